@@ -0,0 +1,265 @@
+import socket
+import threading
+import hashlib
+import bisect
+import time
+import logging
+import collections
+
+STRATEGIES = ('round_robin', 'least_connections', 'consistent_hash')
+
+
+class Backend:
+    """One upstream server and its health state"""
+    def __init__(self, address):
+        self.address = address
+        self.active_connections = 0
+        self.failures = 0
+        self.healthy = True
+        self.ejected_until = 0.0
+        # Learned from responses; only keep-alive backends get warm connections
+        self.supports_keep_alive = False
+
+    def available(self, now):
+        return self.healthy and self.ejected_until <= now
+
+    def __repr__(self):
+        return "{}:{}".format(*self.address)
+
+
+class BackendPool:
+    """Selects a backend per request and tracks health
+
+    Active checks probe health_path on every backend every health_interval
+    seconds. Passive ejection removes a backend for ejection_time seconds
+    after max_failures consecutive connect/read failures.
+    """
+    def __init__(self, addresses, strategy='round_robin', health_path='/santai',
+                 health_interval=5.0, health_timeout=2.0, max_failures=3,
+                 ejection_time=30.0, virtual_nodes=100):
+        if strategy not in STRATEGIES:
+            raise ValueError("Unknown strategy {}, expected one of {}".format(strategy, STRATEGIES))
+        self.backends = [Backend(address) for address in addresses]
+        self.strategy = strategy
+        self.health_path = health_path
+        self.health_interval = health_interval
+        self.health_timeout = health_timeout
+        self.max_failures = max_failures
+        self.ejection_time = ejection_time
+        self.lock = threading.Lock()
+        self.next_index = 0
+
+        # Hash ring with virtual nodes so removing a backend only remaps its own keys
+        self.ring = []
+        for backend in self.backends:
+            for i in range(virtual_nodes):
+                self.ring.append((self.hash_key("{}#{}".format(backend, i)), backend))
+        self.ring.sort(key=lambda node: node[0])
+        self.ring_keys = [node[0] for node in self.ring]
+
+    @staticmethod
+    def hash_key(key):
+        return int.from_bytes(hashlib.md5(key.encode()).digest()[:8], 'big')
+
+    def choose(self, key='', exclude=()):
+        """Pick an available backend not in exclude and count it as an active connection"""
+        now = time.monotonic()
+        with self.lock:
+            candidates = [b for b in self.backends if b.available(now) and b not in exclude]
+            if not candidates:
+                # Everything looks down: fall back to any backend not yet tried
+                candidates = [b for b in self.backends if b not in exclude]
+            if not candidates:
+                return None
+
+            if self.strategy == 'least_connections':
+                backend = min(candidates, key=lambda b: b.active_connections)
+            elif self.strategy == 'consistent_hash':
+                backend = self.ring_lookup(key, candidates)
+            else:
+                backend = candidates[self.next_index % len(candidates)]
+                self.next_index += 1
+
+            backend.active_connections += 1
+            return backend
+
+    def ring_lookup(self, key, candidates):
+        start = bisect.bisect(self.ring_keys, self.hash_key(key))
+        for i in range(len(self.ring)):
+            backend = self.ring[(start + i) % len(self.ring)][1]
+            if backend in candidates:
+                return backend
+        return candidates[0]
+
+    def release(self, backend):
+        with self.lock:
+            backend.active_connections -= 1
+
+    def mark_success(self, backend):
+        with self.lock:
+            backend.failures = 0
+
+    def mark_failure(self, backend):
+        with self.lock:
+            backend.failures += 1
+            if backend.failures >= self.max_failures:
+                backend.ejected_until = time.monotonic() + self.ejection_time
+                backend.failures = 0
+                logging.warning("backend {} ejected for {}s".format(backend, self.ejection_time))
+
+    def probe(self, backend):
+        """Send a GET for health_path and expect a 2xx/3xx status line"""
+        request = (
+            f"GET {self.health_path} HTTP/1.1\r\n"
+            f"Host: {backend.address[0]}\r\n"
+            f"Connection: close\r\n\r\n"
+        ).encode()
+        try:
+            with socket.create_connection(backend.address, timeout=self.health_timeout) as sock:
+                sock.sendall(request)
+                status_line = b""
+                while b"\r\n" not in status_line:
+                    chunk = sock.recv(1024)
+                    if not chunk:
+                        break
+                    status_line += chunk
+            parts = status_line.split(b" ", 2)
+            return len(parts) > 1 and parts[1][:1] in (b"2", b"3")
+        except OSError:
+            return False
+
+    def check_health(self):
+        for backend in self.backends:
+            healthy = self.probe(backend)
+            with self.lock:
+                if healthy != backend.healthy:
+                    logging.warning("backend {} is now {}".format(backend, 'up' if healthy else 'down'))
+                backend.healthy = healthy
+                if healthy and backend.ejected_until:
+                    backend.ejected_until = 0.0
+
+    def run_health_checks(self):
+        while True:
+            self.check_health()
+            time.sleep(self.health_interval)
+
+    def start(self):
+        if self.health_interval:
+            threading.Thread(target=self.run_health_checks, daemon=True).start()
+
+
+class PooledConnection:
+    """An upstream socket plus the bookkeeping needed to expire it"""
+    def __init__(self, backend, sock, reused=False):
+        self.backend = backend
+        self.sock = sock
+        self.created = time.monotonic()
+        self.last_used = self.created
+        self.reused = reused
+
+
+class UpstreamPool:
+    """Warm keep-alive connections to every backend, reused across client requests
+
+    Idle connections are dropped after max_idle seconds (keep this below the
+    backend keep-alive timeout) and any connection is retired after
+    max_lifetime seconds. A maintenance thread keeps min_idle connections
+    open to each available backend so requests rarely wait for a connect.
+    """
+    def __init__(self, backend_pool, max_idle=10.0, max_lifetime=300.0, min_idle=2,
+                 max_idle_per_backend=64, connect_timeout=3.0, maintain_interval=1.0):
+        self.backend_pool = backend_pool
+        self.max_idle = max_idle
+        self.max_lifetime = max_lifetime
+        self.min_idle = min_idle
+        self.max_idle_per_backend = max_idle_per_backend
+        self.connect_timeout = connect_timeout
+        self.maintain_interval = maintain_interval
+        self.lock = threading.Lock()
+        self.idle = {backend: collections.deque() for backend in backend_pool.backends}
+
+    def expired(self, conn, now):
+        return now - conn.last_used > self.max_idle or now - conn.created > self.max_lifetime
+
+    @staticmethod
+    def is_stale(sock):
+        """An idle keep-alive socket must have nothing to read; EOF or data means it is unusable"""
+        try:
+            sock.setblocking(False)
+            try:
+                sock.recv(1, socket.MSG_PEEK)
+                return True
+            except BlockingIOError:
+                return False
+            finally:
+                sock.setblocking(True)
+        except OSError:
+            return True
+
+    def connect(self, backend):
+        sock = socket.create_connection(backend.address, timeout=self.connect_timeout)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        return PooledConnection(backend, sock)
+
+    def get(self, backend):
+        """Return an idle connection to backend, or open a new one (raises OSError)"""
+        now = time.monotonic()
+        while True:
+            with self.lock:
+                idle = self.idle[backend]
+                conn = idle.pop() if idle else None
+            if conn is None:
+                return self.connect(backend)
+            if self.expired(conn, now) or self.is_stale(conn.sock):
+                self.discard(conn)
+                continue
+            conn.reused = True
+            return conn
+
+    def put(self, conn):
+        conn.last_used = time.monotonic()
+        with self.lock:
+            idle = self.idle[conn.backend]
+            if len(idle) < self.max_idle_per_backend and not self.expired(conn, conn.last_used):
+                idle.append(conn)
+                return
+        self.discard(conn)
+
+    def discard(self, conn):
+        try:
+            conn.sock.close()
+        except OSError:
+            pass
+
+    def maintain(self):
+        now = time.monotonic()
+        for backend in self.backend_pool.backends:
+            with self.lock:
+                idle = self.idle[backend]
+                expired = [conn for conn in idle if self.expired(conn, now)]
+                for conn in expired:
+                    idle.remove(conn)
+                missing = self.min_idle - len(idle)
+            for conn in expired:
+                self.discard(conn)
+
+            # Warm connects happen here, never on the accept path. Backends that
+            # close after every response would only be tied up by idle sockets
+            if not backend.available(now) or not backend.supports_keep_alive:
+                continue
+            for i in range(missing):
+                try:
+                    conn = self.connect(backend)
+                except OSError:
+                    self.backend_pool.mark_failure(backend)
+                    break
+                self.put(conn)
+
+    def run_maintenance(self):
+        while True:
+            self.maintain()
+            time.sleep(self.maintain_interval)
+
+    def start(self):
+        if self.maintain_interval:
+            threading.Thread(target=self.run_maintenance, daemon=True).start()
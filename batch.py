@@ -0,0 +1,210 @@
+import os
+import json
+import tarfile
+
+CHUNK_SIZE = 256 * 1024
+MAX_PART_HEADER = 16 * 1024
+MAX_BATCH_LINE = 4096
+STATUS_MEMBER = '.batch-status.json'
+
+
+class MultipartStream:
+    """Incremental multipart/form-data parser over a file-like reader
+
+    parts() yields (headers, data chunks) one part at a time; only a chunk
+    plus one delimiter length is held in memory.
+    """
+    def __init__(self, reader, boundary, chunk_size=CHUNK_SIZE):
+        self.reader = reader
+        self.delimiter = b'\r\n--' + boundary
+        self.chunk_size = chunk_size
+        # The first delimiter has no CRLF in front of it
+        self.buffer = bytearray(b'\r\n')
+        self.eof = False
+
+    def fill(self):
+        chunk = self.reader.read(self.chunk_size)
+        if not chunk:
+            self.eof = True
+        self.buffer += chunk
+
+    def skip_to_delimiter(self):
+        for _ in self.data():
+            pass
+
+    def data(self):
+        keep = len(self.delimiter) - 1
+        while True:
+            index = self.buffer.find(self.delimiter)
+            if index >= 0:
+                if index:
+                    yield bytes(self.buffer[:index])
+                del self.buffer[:index + len(self.delimiter)]
+                return
+            if len(self.buffer) > keep:
+                yield bytes(self.buffer[:-keep])
+                del self.buffer[:-keep]
+            if self.eof:
+                raise ValueError('Unterminated multipart body')
+            self.fill()
+
+    def parts(self):
+        self.skip_to_delimiter()
+        while True:
+            while len(self.buffer) < 2 and not self.eof:
+                self.fill()
+            if self.buffer[:2] == b'--':
+                return
+            while (header_end := self.buffer.find(b'\r\n\r\n')) < 0:
+                if len(self.buffer) > MAX_PART_HEADER or self.eof:
+                    raise ValueError('Malformed multipart part headers')
+                self.fill()
+            headers = {}
+            for line in self.buffer[:header_end].decode('utf-8', errors='replace').split('\r\n'):
+                if ':' in line:
+                    key, value = line.split(':', 1)
+                    headers[key.strip().lower()] = value.strip()
+            del self.buffer[:header_end + 4]
+            data = self.data()
+            yield headers, data
+            # Skip whatever the consumer did not read
+            for _ in data:
+                pass
+
+
+def read_lines(reader):
+    """Yield the non-empty lines of a text body as it arrives"""
+    pending = b''
+    while True:
+        chunk = reader.read(CHUNK_SIZE)
+        if not chunk:
+            break
+        lines = (pending + chunk).split(b'\n')
+        pending = lines.pop()
+        if len(pending) > MAX_BATCH_LINE:
+            raise ValueError('Batch line too long')
+        for line in lines:
+            line = line.strip()
+            if line:
+                yield line.decode('utf-8')
+    if pending.strip():
+        yield pending.strip().decode('utf-8')
+
+
+def file_chunks(fileobj, chunk_size=CHUNK_SIZE):
+    while True:
+        chunk = fileobj.read(chunk_size)
+        if not chunk:
+            break
+        yield chunk
+
+
+def summary(results):
+    """Compact per-item status: {"ok": n, "failed": n, "results": [[name, status, detail], ...]}"""
+    ok = sum(1 for result in results if 200 <= result[1] < 300)
+    return json.dumps({'ok': ok, 'failed': len(results) - ok, 'results': results}, separators=(',', ':'))
+
+
+def part_filename(headers):
+    """filename from a part's Content-Disposition, None for non-file fields"""
+    disposition = headers.get('content-disposition', '')
+    if 'filename=' not in disposition:
+        return None
+    return disposition.split('filename=', 1)[1].split(';', 1)[0].strip().strip('"')
+
+
+def upload_multipart(reader, boundary, save):
+    """save(name, chunks) stores one file and returns its byte count"""
+    results = []
+    for headers, data in MultipartStream(reader, boundary).parts():
+        name = part_filename(headers)
+        if not name:
+            continue
+        try:
+            results.append([name, 201, save(name, data)])
+        except OSError as e:
+            results.append([name, 500, str(e)])
+    return results
+
+
+def upload_tar(reader, save):
+    results = []
+    # 'r|*' reads the archive strictly sequentially, optionally compressed
+    with tarfile.open(fileobj=reader, mode='r|*') as archive:
+        for member in archive:
+            if member.isdir():
+                continue
+            if not member.isfile():
+                results.append([member.name, 415, 'Only regular files are accepted'])
+                continue
+            try:
+                results.append([member.name, 201, save(member.name, file_chunks(archive.extractfile(member)))])
+            except OSError as e:
+                results.append([member.name, 500, str(e)])
+    return results
+
+
+def delete_files(reader):
+    results = []
+    for name in read_lines(reader):
+        filepath = name.lstrip('/')
+        if not filepath or not os.path.isfile(filepath):
+            results.append([name, 404, 'Not found'])
+            continue
+        try:
+            os.remove(filepath)
+            results.append([name, 200, 'Deleted'])
+        except OSError as e:
+            results.append([name, 500, str(e)])
+    return results
+
+
+def tar_member(name, data, mtime=0):
+    info = tarfile.TarInfo(name)
+    info.size = len(data)
+    info.mtime = mtime
+    return info.tobuf(tarfile.PAX_FORMAT) + data + tarfile.NUL * (-len(data) % tarfile.BLOCKSIZE)
+
+
+def fetch_archive(names, chunk_size=CHUNK_SIZE):
+    """Yield an uncompressed tar of the named files, ending with a status member
+
+    Files are read in chunk_size pieces and small members are coalesced, so
+    the archive never has to exist as a whole.
+    """
+    results = []
+    pending = bytearray()
+    for name in names:
+        filepath = name.lstrip('/')
+        try:
+            with open(filepath, 'rb') as f:
+                stat = os.fstat(f.fileno())
+                info = tarfile.TarInfo(filepath)
+                info.size = stat.st_size
+                info.mtime = int(stat.st_mtime)
+                info.mode = 0o644
+                pending += info.tobuf(tarfile.PAX_FORMAT)
+                remaining = stat.st_size
+                while remaining > 0:
+                    chunk = f.read(min(chunk_size, remaining))
+                    if not chunk:
+                        # Truncated while being read; keep the archive well-formed
+                        chunk = tarfile.NUL * remaining
+                    pending += chunk
+                    remaining -= len(chunk)
+                    if len(pending) >= chunk_size:
+                        yield bytes(pending)
+                        pending.clear()
+                pending += tarfile.NUL * (-stat.st_size % tarfile.BLOCKSIZE)
+            results.append([name, 200, stat.st_size])
+        except (FileNotFoundError, IsADirectoryError):
+            results.append([name, 404, 'Not found'])
+        except OSError as e:
+            results.append([name, 500, str(e)])
+        if len(pending) >= chunk_size:
+            yield bytes(pending)
+            pending.clear()
+
+    pending += tar_member(STATUS_MEMBER, summary(results).encode())
+    pending += tarfile.NUL * (2 * tarfile.BLOCKSIZE)
+    yield bytes(pending)
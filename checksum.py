@@ -0,0 +1,153 @@
+import os
+import re
+import json
+import zlib
+import base64
+import hashlib
+import binascii
+import uuid
+from delta_sync import file_etag
+
+CHECKSUM_DIR = '.checksums'
+
+
+class Crc32:
+    """hashlib-style wrapper around zlib.crc32"""
+    def __init__(self):
+        self.value = 0
+
+    def update(self, data):
+        self.value = zlib.crc32(data, self.value)
+
+    def digest(self):
+        return self.value.to_bytes(4, 'big')
+
+
+ALGORITHMS = {
+    'sha-256': hashlib.sha256,
+    'md5': hashlib.md5,
+    'crc32': Crc32,
+}
+ALIASES = {'sha256': 'sha-256', 'sha-256': 'sha-256', 'md5': 'md5', 'crc32': 'crc32'}
+
+
+class ChecksumMismatch(ValueError):
+    pass
+
+
+def decode_digest(value, encoding):
+    try:
+        if encoding == 'hex':
+            return bytes.fromhex(value)
+        return base64.b64decode(value.strip(':'), validate=True)
+    except (ValueError, binascii.Error):
+        raise ValueError(f"Malformed digest value {value!r}")
+
+
+def expected_digests(headers):
+    """Digests announced in Digest / Content-Digest / Content-MD5 / X-Checksum headers
+
+    Digest (RFC 3230) and Content-Digest (RFC 9530) carry base64 values,
+    X-Checksum carries "algorithm:hex". Unknown algorithms are ignored.
+    """
+    expected = {}
+    for header in ('digest', 'content-digest'):
+        for item in headers.get(header, '').split(','):
+            name, _, value = item.strip().partition('=')
+            name = ALIASES.get(name.strip().lower())
+            if name and value:
+                expected[name] = decode_digest(value.strip(), 'base64')
+    if headers.get('content-md5'):
+        expected['md5'] = decode_digest(headers['content-md5'].strip(), 'base64')
+    if headers.get('x-checksum'):
+        match = re.fullmatch(r'\s*([\w-]+)\s*[:=]\s*([0-9a-fA-F]+)\s*', headers['x-checksum'])
+        if not match:
+            raise ValueError("X-Checksum must look like 'sha-256:<hex>'")
+        name = ALIASES.get(match.group(1).lower())
+        if name:
+            expected[name] = decode_digest(match.group(2), 'hex')
+    return expected
+
+
+class ChecksumVerifier:
+    """Hashes an upload incrementally as its chunks arrive
+
+    Computes every algorithm the client announced plus store_algorithm, the
+    one the server keeps for GET.
+    """
+    def __init__(self, headers, store_algorithm=None):
+        self.expected = expected_digests(headers)
+        names = set(self.expected)
+        if store_algorithm:
+            names.add(store_algorithm)
+        self.hashers = {name: ALGORITHMS[name]() for name in names}
+
+    @property
+    def active(self):
+        return bool(self.hashers)
+
+    def update(self, data):
+        for hasher in self.hashers.values():
+            hasher.update(data)
+
+    def update_file(self, fd, chunk_size=1024 * 1024):
+        """Hash the whole file open at fd, e.g. one assembled on disk"""
+        offset = 0
+        while True:
+            chunk = os.pread(fd, chunk_size, offset)
+            if not chunk:
+                return
+            self.update(chunk)
+            offset += len(chunk)
+
+    def wrap(self, chunks):
+        for chunk in chunks:
+            self.update(chunk)
+            yield chunk
+
+    def verify(self):
+        for name, expected in self.expected.items():
+            actual = self.hashers[name].digest()
+            if actual != expected:
+                raise ChecksumMismatch(f"{name} mismatch: expected {expected.hex()}, got {actual.hex()}")
+
+    def hexdigests(self):
+        return {name: hasher.digest().hex() for name, hasher in self.hashers.items()}
+
+
+class ChecksumStore:
+    """Checksums of stored files under CHECKSUM_DIR, valid for one file version (ETag)"""
+    def path_for(self, path):
+        return os.path.join(CHECKSUM_DIR, hashlib.sha1(os.path.abspath(path).encode()).hexdigest()[:16] + '.json')
+
+    def save(self, path, digests):
+        os.makedirs(CHECKSUM_DIR, exist_ok=True)
+        record = {'version': file_etag(os.stat(path)), 'digests': digests}
+        store_path = self.path_for(path)
+        tmp_path = f"{store_path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(record, f)
+        os.replace(tmp_path, store_path)
+
+    def load(self, path, stat):
+        try:
+            with open(self.path_for(path)) as f:
+                record = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        if record.get('version') != file_etag(stat):
+            return {}
+        return record.get('digests', {})
+
+
+def digest_headers(digests):
+    """Response headers for hex digests from ChecksumStore.load"""
+    if not digests:
+        return {}
+    raw = {name: bytes.fromhex(value) for name, value in digests.items()}
+    headers = {'Digest': ','.join(f"{name}={base64.b64encode(value).decode()}" for name, value in sorted(raw.items()))}
+    if 'md5' in raw:
+        headers['Content-MD5'] = base64.b64encode(raw['md5']).decode()
+    name = 'sha-256' if 'sha-256' in digests else sorted(digests)[0]
+    headers['X-Checksum'] = f"{name}:{digests[name]}"
+    return headers
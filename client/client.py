@@ -4,8 +4,10 @@ import json
 import logging
 import ssl
 import os
+from http_client import HttpClient
 
 server_address = ('localhost', 8885)
+client = HttpClient(*server_address)
 
 def make_socket(destination_address='localhost', port=12000):
     try:
@@ -34,8 +36,6 @@ def send_command(command_str):
             if not chunk:
                 break
             response += chunk
-            if len(chunk) < 4096:
-                break
         
         return response.decode('utf-8', errors='replace')
     except socket.timeout:
@@ -58,8 +58,6 @@ def send_command_raw(request_bytes):
             if not chunk:
                 break
             response += chunk
-            if len(chunk) < 4096:
-                break
         
         return response.decode('utf-8', errors='replace')
     except Exception as e:
@@ -68,64 +66,37 @@ def send_command_raw(request_bytes):
         sock.close()
 
 def list_files():
-    cmd = """GET /list HTTP/1.1
-Host: 172.16.16.101
-User-Agent: myclient/1.1
-Accept: */*
-
-"""
-    hasil = send_command(cmd)
+    hasil = client.list_files()
     print("Server response:")
-    print(hasil)
+    print(hasil.text)
 
 
 def upload_file(filename):
     try:
-        with open(filename, 'rb') as f:
-            file_content = f.read()
-        
-        # Build the request
-        request = (
-            f"POST /upload HTTP/1.1\r\n"
-            f"Host: {server_address[0]}\r\n"
-            f"User-Agent: PythonUploader/1.0\r\n"
-            f"X-Filename: {filename}\r\n"  # <-- FIXED LINE
-            f"Content-Length: {len(file_content)}\r\n"
-            f"\r\n"
-        ).encode() + file_content
-
-        # Send request
-        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        sock.settimeout(30.0)
-        sock.connect(server_address)
-        
-        try:
-            sock.sendall(request)
-            response = sock.recv(4096)
-            print(response.decode('utf-8', errors='replace'))
-        finally:
-            sock.close()
-            
+        hasil = client.upload_file(filename)
+        print(hasil.text)
     except FileNotFoundError:
         print(f"Error: File {filename} not found")
     except Exception as e:
         print(f"Upload error: {str(e)}")
 
 def delete_file(filename):
-    cmd = f"""DELETE /{filename} HTTP/1.1
-Host: {server_address[0]}
-User-Agent: myclient/1.1
-Accept: */*
+    hasil = client.delete_file(filename)
+    print(hasil.text)
 
-"""
-    hasil = send_command(cmd)
-    print(hasil)
+def download_file(filename):
+    try:
+        hasil = client.download_segmented(filename)
+        print(f"{hasil.status} {hasil.reason}")
+    except Exception as e:
+        print(f"Download error: {str(e)} (run again to resume)")
 
 if __name__ == '__main__':
     print("1. List files")
     print("2. Upload file")
     print("3. Delete file")
-    choice = input("Select operation (1/2/3): ")
+    print("4. Download file")
+    choice = input("Select operation (1/2/3/4): ")
     
     if choice == '1':
         list_files()
@@ -135,5 +106,8 @@ if __name__ == '__main__':
     elif choice == '3':
         filename = input("Enter filename to delete: ")
         delete_file(filename)
+    elif choice == '4':
+        filename = input("Enter filename to download: ")
+        download_file(filename)
     else:
         print("Invalid choice")
\ No newline at end of file
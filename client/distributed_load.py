@@ -0,0 +1,357 @@
+import os
+import json
+import time
+import socket
+import argparse
+import multiprocessing
+from latency_histogram import LatencyHistogram
+from load_generator import (request_factory, run_load, run_open_loop, raise_fd_limit, sustained, sweep_rates, rate_limited,
+                            MAX_CONNECTIONS, REQUEST_TIMEOUT)
+
+CONTROL_PORT = 9100
+START_DELAY = 2.0
+REGISTER_TIMEOUT = 60.0
+CLOCK_SAMPLES = 5
+# Slack on top of the run itself before a silent worker is given up on
+RESULT_GRACE = 30.0
+
+
+class Channel:
+    """Newline-delimited JSON messages over a TCP control connection"""
+    def __init__(self, sock):
+        self.sock = sock
+        self.file = sock.makefile('rb')
+
+    def send(self, message):
+        self.sock.sendall(json.dumps(message).encode() + b"\n")
+
+    def receive(self, timeout=None):
+        self.sock.settimeout(timeout)
+        line = self.file.readline()
+        if not line:
+            raise ConnectionError('Control channel closed')
+        return json.loads(line)
+
+    def close(self):
+        self.file.close()
+        self.sock.close()
+
+
+def share(total, workers, index):
+    """index's part of total when split as evenly as possible"""
+    return total // workers + (1 if index < total % workers else 0)
+
+
+def run_job(job):
+    """Run one job on this worker; the result carries histograms as dicts"""
+    # Worker index and run keep X-Client-ID unique across workers, hosts and sweep steps
+    factory = request_factory(job['path'], job.get('upload'), job.get('multipart', False),
+                              job.get('headers'), prefix=f"w{job['worker']}-r{job['run']}-")
+    delay = job['start_at'] - time.time()
+    if delay > 0:
+        time.sleep(delay)
+    skew = time.time() - job['start_at']
+    if job['mode'] == 'open':
+        report = run_open_loop(job['host'], job['port'], factory, job['rate'], job['duration'],
+                               job.get('poisson', False), job.get('max_connections', MAX_CONNECTIONS),
+                               job.get('keep_alive', True), seed=job['worker'])
+        return {
+            'type': 'result', 'sent': report['sent'], 'completed': report['completed'],
+            'errors': report['errors'], 'wall_time': report['wall_time'],
+            'latency': report['latency'].to_dict(), 'service': report['service'].to_dict(),
+            'max_lag': report['max_lag'], 'peak_connections': report['peak_connections'], 'skew': skew,
+        }
+    results, wall_time = run_load(job['host'], job['port'], factory, job['concurrency'], job.get('requests'),
+                                  job.get('duration'), job.get('ramp_up', 0.0), keep_alive=job.get('keep_alive', False))
+    latency = LatencyHistogram()
+    errors = {}
+    for r in results:
+        if r.get('success'):
+            latency.record(r['time'])
+        else:
+            key = r.get('error') or f"HTTP {r.get('status')}"
+            errors[key] = errors.get(key, 0) + 1
+    return {
+        'type': 'result', 'sent': len(results), 'completed': latency.total, 'errors': errors,
+        'wall_time': wall_time, 'latency': latency.to_dict(), 'service': LatencyHistogram().to_dict(),
+        'max_lag': 0.0, 'peak_connections': job['concurrency'], 'skew': skew,
+    }
+
+
+def run_worker(coordinator_host, coordinator_port):
+    """Worker process: register with the coordinator, run jobs until told to stop"""
+    raise_fd_limit()
+    # Remote workers may be started before the coordinator is listening
+    deadline = time.monotonic() + REGISTER_TIMEOUT
+    while True:
+        try:
+            sock = socket.create_connection((coordinator_host, coordinator_port), REGISTER_TIMEOUT)
+            break
+        except ConnectionRefusedError:
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(1.0)
+    channel = Channel(sock)
+    channel.send({'type': 'hello', 'host': socket.gethostname(), 'pid': os.getpid(), 'cores': os.cpu_count()})
+    try:
+        while True:
+            message = channel.receive()
+            if message['type'] == 'clock':
+                channel.send({'type': 'clock', 'time': time.time()})
+            elif message['type'] == 'job':
+                try:
+                    channel.send(run_job(message))
+                except Exception as e:
+                    channel.send({'type': 'failed', 'error': f"{type(e).__name__}: {e}"})
+            else:
+                break
+    except ConnectionError:
+        pass
+    finally:
+        channel.close()
+
+
+class WorkerHandle:
+    def __init__(self, channel, hello):
+        self.channel = channel
+        self.name = f"{hello['host']}:{hello['pid']}"
+        self.cores = hello.get('cores')
+        self.offset = 0.0
+
+    def measure_clock(self):
+        """Offset of the worker's clock from ours, from the lowest round trip sample"""
+        best = None
+        for _ in range(CLOCK_SAMPLES):
+            sent = time.time()
+            self.channel.send({'type': 'clock'})
+            remote = self.channel.receive(REGISTER_TIMEOUT)['time']
+            received = time.time()
+            if best is None or received - sent < best[0]:
+                best = (received - sent, remote - (sent + received) / 2)
+        self.offset = best[1]
+
+
+class Coordinator:
+    """Start load-generator workers and merge what they measure
+
+    local_workers are forked here; remote_workers are started by hand on
+    other machines with `distributed_load.py worker <this host> <control
+    port>`. Every worker connects back over the TCP control channel, so
+    both kinds are driven the same way. The coordinator estimates each
+    worker's clock offset, hands out jobs that start at the same instant,
+    and merges the workers' latency histograms into one report.
+    """
+    def __init__(self, local_workers=None, remote_workers=0, bind='127.0.0.1', control_port=0):
+        self.local_workers = os.cpu_count() if local_workers is None else local_workers
+        self.remote_workers = remote_workers
+        self.listener = socket.create_server((bind, control_port))
+        self.control_port = self.listener.getsockname()[1]
+        self.processes = []
+        self.workers = []
+        self.runs = 0
+
+    def start(self):
+        for _ in range(self.local_workers):
+            process = multiprocessing.Process(target=run_worker, args=('127.0.0.1', self.control_port), daemon=True)
+            process.start()
+            self.processes.append(process)
+        expected = self.local_workers + self.remote_workers
+        if self.remote_workers:
+            print(f"Waiting for {self.remote_workers} remote workers on control port {self.control_port}")
+        self.listener.settimeout(REGISTER_TIMEOUT)
+        while len(self.workers) < expected:
+            sock, _ = self.listener.accept()
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            channel = Channel(sock)
+            worker = WorkerHandle(channel, channel.receive(REGISTER_TIMEOUT))
+            worker.measure_clock()
+            self.workers.append(worker)
+        print(f"{len(self.workers)} workers: " + ", ".join(
+            f"{w.name} ({w.offset * 1000:+.1f}ms)" for w in self.workers))
+
+    def run(self, job, start_delay=START_DELAY):
+        """Split job between the workers, start them together, return the merged report
+
+        job holds the target (host, port), the request (path, upload,
+        multipart, headers) and the load: mode 'open' with a total rate,
+        or mode 'closed' with total concurrency and requests or duration.
+        """
+        count = len(self.workers)
+        self.runs += 1
+        start_at = time.time() + start_delay
+        for index, worker in enumerate(self.workers):
+            part = dict(job, type='job', worker=index, run=self.runs, start_at=start_at + worker.offset)
+            if job['mode'] == 'open':
+                part['rate'] = job['rate'] / count
+                part['max_connections'] = max(1, job.get('max_connections', MAX_CONNECTIONS) // count)
+            else:
+                part['concurrency'] = max(1, share(job['concurrency'], count, index))
+                if job.get('requests') is not None:
+                    part['requests'] = share(job['requests'], count, index)
+            worker.channel.send(part)
+        timeout = start_delay + (job.get('duration') or 0) + job.get('request_timeout', REQUEST_TIMEOUT) + RESULT_GRACE
+        if job['mode'] == 'closed' and job.get('requests') is not None:
+            timeout = None
+        results = []
+        for worker in self.workers:
+            try:
+                result = worker.channel.receive(timeout)
+            except (OSError, ValueError) as e:
+                result = {'type': 'failed', 'error': f"{type(e).__name__}: {e}"}
+            result['worker'] = worker.name
+            if result['type'] == 'failed':
+                print(f"Worker {worker.name} failed: {result['error']}")
+            else:
+                results.append(result)
+        return merge(job, results)
+
+    def stop(self):
+        for worker in self.workers:
+            try:
+                worker.channel.send({'type': 'stop'})
+            except OSError:
+                pass
+            worker.channel.close()
+        for process in self.processes:
+            process.join(5)
+        self.listener.close()
+
+
+def merge(job, results):
+    """One report from the per-worker results, shaped like an open-loop report"""
+    latency = LatencyHistogram()
+    service = LatencyHistogram()
+    errors = {}
+    for result in results:
+        latency.merge(LatencyHistogram.from_dict(result['latency']))
+        service.merge(LatencyHistogram.from_dict(result['service']))
+        for key, count in result['errors'].items():
+            errors[key] = errors.get(key, 0) + count
+    # Workers start together, so the slowest one bounds the run
+    wall_time = max((r['wall_time'] for r in results), default=0.0)
+    completed = sum(r['completed'] for r in results)
+    return {
+        'mode': job['mode'],
+        'rate': job.get('rate'),
+        'arrivals': 'poisson' if job.get('poisson') else 'fixed',
+        'duration': job.get('duration'),
+        'wall_time': wall_time,
+        'sent': sum(r['sent'] for r in results),
+        'completed': completed,
+        'errors': errors,
+        'throughput': completed / wall_time if wall_time else 0.0,
+        'latency': latency,
+        'service': service,
+        'max_lag': max((r['max_lag'] for r in results), default=0.0),
+        'max_skew': max((abs(r['skew']) for r in results), default=0.0),
+        'peak_connections': sum(r['peak_connections'] for r in results),
+        'workers': results,
+    }
+
+
+def print_report(report):
+    errors = sum(report['errors'].values())
+    load = f"rate {report['rate']:g}/s ({report['arrivals']})" if report['mode'] == 'open' else 'closed loop'
+    print(f"{load} over {len(report['workers'])} workers: sent {report['sent']}, ok {report['completed']}, "
+          f"errors {errors}, throughput {report['throughput']:.1f} req/s, "
+          f"start skew {report['max_skew'] * 1000:.1f}ms, max lag {report['max_lag'] * 1000:.1f}ms")
+    print(f"  latency  {report['latency'].format()}")
+    if report['service'].total:
+        print(f"  service  {report['service'].format()}")
+    for worker in report['workers']:
+        print(f"    {worker['worker']}: ok {worker['completed']}/{worker['sent']}, "
+              f"{worker['completed'] / worker['wall_time'] if worker['wall_time'] else 0:.1f} req/s, "
+              f"p99 {LatencyHistogram.from_dict(worker['latency']).percentile(99) * 1000:.2f}ms")
+    for error, count in sorted(report['errors'].items(), key=lambda item: -item[1]):
+        print(f"  {count}x {error}")
+    if rate_limited(report['errors'], report['sent']):
+        print("  Warning: the server is rate limiting; this measures its limiter, not its capacity")
+
+
+def distributed_sweep(coordinator, job, rates, slo_p99=None, pause=1.0):
+    """find_saturation across all workers: the highest total rate still sustained"""
+    reports = []
+    saturation = None
+    for rate in rates:
+        report = coordinator.run(dict(job, mode='open', rate=rate))
+        reports.append(report)
+        print_report(report)
+        if not sustained(report, slo_p99):
+            break
+        saturation = report
+        time.sleep(pause)
+    if rate_limited(reports[-1]['errors'], reports[-1]['sent']):
+        print("The sweep stopped on 429s: start the server without --rate-limit to find its saturation")
+    elif saturation is None:
+        print("Saturated at the first rate; sweep from a lower rate")
+    elif saturation is reports[-1]:
+        print(f"Sustained every rate up to {saturation['rate']:g}/s; sweep higher to find saturation")
+    else:
+        print(f"Saturation throughput: {saturation['throughput']:.1f} req/s (target rate {saturation['rate']:g}/s)")
+    return saturation, reports
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Distributed HTTP load generation')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    worker = commands.add_parser('worker', help='run jobs for a coordinator on another host')
+    worker.add_argument('coordinator_host')
+    worker.add_argument('control_port', type=int)
+
+    run = commands.add_parser('run', help='coordinate workers against a server')
+    run.add_argument('host')
+    run.add_argument('port', type=int)
+    run.add_argument('--workers', type=int, default=os.cpu_count(), help='local worker processes')
+    run.add_argument('--remote-workers', type=int, default=0, help='workers to wait for from other hosts')
+    run.add_argument('--bind', default=None, help='control channel address (default 0.0.0.0 with remote workers)')
+    run.add_argument('--control-port', type=int, default=None, help=f'control channel port (default {CONTROL_PORT} '
+                                                                     'with remote workers, else any free port)')
+    run.add_argument('--rate', type=float, help='open loop: total requests per second across workers')
+    run.add_argument('--sweep', help='open loop: total rates "start:stop:step" or "r1,r2,..." to find saturation')
+    run.add_argument('--arrivals', choices=('fixed', 'poisson'), default='fixed')
+    run.add_argument('--slo-p99', type=float, help='sweep: a rate only counts as sustained with p99 under this many ms')
+    run.add_argument('--concurrency', type=int, default=100, help='closed loop: total concurrent connections')
+    run.add_argument('--requests', type=int, help='closed loop: stop after this many requests in total')
+    run.add_argument('--duration', type=float, default=10.0, help='seconds of load (per rate when sweeping)')
+    run.add_argument('--max-connections', type=int, default=MAX_CONNECTIONS, help='open loop: total connection cap')
+    run.add_argument('--path', default='/')
+    run.add_argument('--upload', help='file to POST; it must exist at the same path on every worker host')
+    run.add_argument('--multipart', action='store_true', help='send --upload as a multipart form')
+    run.add_argument('--keep-alive', action='store_true')
+    run.add_argument('--histogram-out', help='write the merged latency histogram as JSON')
+    args = parser.parse_args()
+
+    if args.command == 'worker':
+        run_worker(args.coordinator_host, args.control_port)
+        return
+
+    bind = args.bind or ('0.0.0.0' if args.remote_workers else '127.0.0.1')
+    control_port = args.control_port if args.control_port is not None else (CONTROL_PORT if args.remote_workers else 0)
+    job = {
+        'host': args.host, 'port': args.port, 'path': args.path, 'upload': args.upload,
+        'multipart': args.multipart, 'keep_alive': args.keep_alive, 'duration': args.duration,
+        'poisson': args.arrivals == 'poisson', 'max_connections': args.max_connections,
+    }
+    coordinator = Coordinator(args.workers, args.remote_workers, bind, control_port)
+    try:
+        coordinator.start()
+        if args.sweep:
+            slo = args.slo_p99 / 1000 if args.slo_p99 else None
+            distributed_sweep(coordinator, job, sweep_rates(args.sweep), slo)
+            return
+        if args.rate:
+            report = coordinator.run(dict(job, mode='open', rate=args.rate))
+        else:
+            report = coordinator.run(dict(job, mode='closed', concurrency=args.concurrency, requests=args.requests,
+                                          duration=None if args.requests else args.duration))
+        print_report(report)
+        if args.histogram_out:
+            with open(args.histogram_out, 'w') as f:
+                json.dump(report['latency'].to_dict(), f)
+    finally:
+        coordinator.stop()
+
+
+if __name__ == "__main__":
+    main()
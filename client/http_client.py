@@ -0,0 +1,896 @@
+import os
+import socket
+import threading
+import asyncio
+import time
+import collections
+import json
+import struct
+import hashlib
+import itertools
+import tarfile
+import gzip
+import shutil
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+RECV_BUFSIZE = 256 * 1024
+MAX_LINE = 65536
+IDLE_TIMEOUT = 10.0  # below the server keep-alive timeout
+SEGMENT_SIZE = 8 * 1024 * 1024
+MAX_LITERAL = 1024 * 1024
+
+
+class HttpResponse:
+    def __init__(self, status, reason, headers, body=b""):
+        self.status = status
+        self.reason = reason
+        self.headers = headers
+        self.body = body
+
+    @property
+    def ok(self):
+        return 200 <= self.status < 300
+
+    @property
+    def text(self):
+        return self.body.decode('utf-8', errors='replace')
+
+    def __repr__(self):
+        return f"<HttpResponse {self.status} {self.reason}>"
+
+
+def build_request(method, path, host, headers=None, content_length=None):
+    lines = [
+        f"{method} {path} HTTP/1.1",
+        f"Host: {host}",
+        "User-Agent: myclient/1.1",
+        "Connection: keep-alive",
+    ]
+    for key, value in (headers or {}).items():
+        lines.append(f"{key}: {value}")
+    if content_length is not None:
+        lines.append(f"Content-Length: {content_length}")
+    return ("\r\n".join(lines) + "\r\n\r\n").encode()
+
+
+def parse_status_line(line):
+    if not line:
+        raise ConnectionError("Connection closed before response")
+    parts = line.decode('latin-1').rstrip("\r\n").split(" ", 2)
+    if len(parts) < 2 or not parts[1].isdigit():
+        raise ValueError(f"Malformed status line: {line!r}")
+    return int(parts[1]), parts[2] if len(parts) > 2 else ''
+
+
+def parse_header_line(line, headers):
+    if b":" in line:
+        key, value = line.decode('latin-1').split(":", 1)
+        headers[key.strip().lower()] = value.strip()
+
+
+def body_framing(method, status, headers):
+    """Return ('none'|'chunked'|'length'|'close', content_length)"""
+    if method == 'HEAD' or status in (204, 304) or 100 <= status < 200:
+        return 'none', 0
+    if 'chunked' in headers.get('transfer-encoding', '').lower():
+        return 'chunked', None
+    if 'content-length' in headers:
+        return 'length', int(headers['content-length'])
+    return 'close', None
+
+
+def reusable(headers, framing):
+    return framing != 'close' and headers.get('connection', '').lower() == 'keep-alive'
+
+
+class FileBody:
+    """Raw request body streamed from disk with socket.sendfile"""
+    def __init__(self, filename):
+        self.filename = filename
+        self.length = os.path.getsize(filename)
+
+    def chunks(self, chunk_size=RECV_BUFSIZE):
+        with open(self.filename, 'rb') as f:
+            while True:
+                chunk = f.read(chunk_size)
+                if not chunk:
+                    break
+                yield chunk
+
+    def send(self, sock):
+        with open(self.filename, 'rb') as f:
+            sock.sendfile(f, 0, self.length)
+
+
+class FileRangeBody(FileBody):
+    """length bytes of a file starting at offset, sent with socket.sendfile"""
+    def __init__(self, filename, offset, length):
+        self.filename = filename
+        self.offset = offset
+        self.length = length
+
+    def chunks(self, chunk_size=RECV_BUFSIZE):
+        with open(self.filename, 'rb') as f:
+            f.seek(self.offset)
+            remaining = self.length
+            while remaining > 0:
+                chunk = f.read(min(chunk_size, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                yield chunk
+
+    def send(self, sock):
+        with open(self.filename, 'rb') as f:
+            sock.sendfile(f, self.offset, self.length)
+
+
+class MultipartFileBody(FileBody):
+    """multipart/form-data body for one file, emitted as preamble + file + epilogue
+
+    Content-Length is known up front, so the file never has to be loaded
+    into memory.
+    """
+    def __init__(self, filename, boundary, field='file', remote_name=None):
+        FileBody.__init__(self, filename)
+        self.boundary = boundary
+        self.file_length = self.length
+        self.preamble = (
+            f"--{boundary}\r\n"
+            f'Content-Disposition: form-data; name="{field}"; filename="{remote_name or os.path.basename(filename)}"\r\n'
+            f"Content-Type: application/octet-stream\r\n\r\n"
+        ).encode()
+        self.epilogue = f"\r\n--{boundary}--\r\n".encode()
+        self.length = len(self.preamble) + self.file_length + len(self.epilogue)
+
+    @property
+    def content_type(self):
+        return f"multipart/form-data; boundary={self.boundary}"
+
+    def chunks(self, chunk_size=RECV_BUFSIZE):
+        yield self.preamble
+        yield from FileBody.chunks(self, chunk_size)
+        yield self.epilogue
+
+    def send(self, sock):
+        sock.sendall(self.preamble)
+        with open(self.filename, 'rb') as f:
+            sock.sendfile(f, 0, self.file_length)
+        sock.sendall(self.epilogue)
+
+
+class TarFilesBody(FileBody):
+    """Several files as one uncompressed tar stream; each file goes out with sendfile"""
+    def __init__(self, filenames, names=None):
+        self.members = []
+        self.length = 2 * tarfile.BLOCKSIZE
+        for filename, name in zip(filenames, names or [os.path.basename(f) for f in filenames]):
+            info = tarfile.TarInfo(name)
+            info.size = os.path.getsize(filename)
+            info.mtime = int(os.path.getmtime(filename))
+            info.mode = 0o644
+            header = info.tobuf(tarfile.PAX_FORMAT)
+            padding = tarfile.NUL * (-info.size % tarfile.BLOCKSIZE)
+            self.members.append((filename, header, info.size, padding))
+            self.length += len(header) + info.size + len(padding)
+
+    def chunks(self, chunk_size=RECV_BUFSIZE):
+        for filename, header, size, padding in self.members:
+            yield header
+            yield from FileRangeBody(filename, 0, size).chunks(chunk_size)
+            yield padding
+        yield tarfile.NUL * (2 * tarfile.BLOCKSIZE)
+
+    def send(self, sock):
+        for filename, header, size, padding in self.members:
+            sock.sendall(header)
+            if size:
+                with open(filename, 'rb') as f:
+                    sock.sendfile(f, 0, size)
+            sock.sendall(padding)
+        sock.sendall(tarfile.NUL * (2 * tarfile.BLOCKSIZE))
+
+
+def gzip_to_temp(filename, level=6):
+    """Compress filename into a temp file, return its path
+
+    The server wants a Content-Length, so the compressed size has to be
+    known before sending.
+    """
+    fd, path = tempfile.mkstemp(suffix='.gz')
+    with os.fdopen(fd, 'wb') as out, open(filename, 'rb') as src:
+        with gzip.GzipFile(fileobj=out, mode='wb', compresslevel=level) as gz:
+            shutil.copyfileobj(src, gz, RECV_BUFSIZE)
+    return path
+
+
+def body_length(body):
+    return body.length if isinstance(body, FileBody) else len(body)
+
+
+def weak_checksum(block):
+    """Must match delta_sync.weak_checksum on the server"""
+    a = sum(block) & 0xffff
+    b = sum(itertools.accumulate(block)) & 0xffff
+    return a, b
+
+
+def strong_hash(block):
+    return hashlib.blake2b(block, digest_size=16).hexdigest()
+
+
+def compute_delta(data, signature):
+    """Encode data as block copies from the signed file plus literal bytes
+
+    A rolling checksum slides over data one byte at a time; only windows
+    whose weak checksum is known get the strong hash. Returns (delta, literal
+    bytes).
+    """
+    block_size = signature['block_size']
+    blocks = signature['blocks']
+    table = {}
+    for index, (weak, strong) in enumerate(blocks):
+        if index < len(blocks) - 1 or signature['length'] % block_size == 0:
+            table.setdefault(weak, {}).setdefault(strong, index)
+
+    delta = bytearray()
+    literal = 0
+    run = None  # [first block, count] of the pending copy
+
+    def flush_run():
+        if run:
+            delta.extend(b'C' + struct.pack('>II', *run))
+
+    def emit_literal(start, end):
+        nonlocal literal
+        literal += end - start
+        for offset in range(start, end, MAX_LITERAL):
+            chunk = data[offset:min(end, offset + MAX_LITERAL)]
+            delta.extend(b'L' + struct.pack('>I', len(chunk)))
+            delta.extend(chunk)
+
+    size = len(data)
+    position = literal_start = 0
+    if size >= block_size:
+        a, b = weak_checksum(data[:block_size])
+    while position + block_size <= size:
+        candidates = table.get(a | (b << 16))
+        index = candidates.get(strong_hash(data[position:position + block_size])) if candidates else None
+        if index is not None:
+            if literal_start < position:
+                flush_run()
+                run = None
+                emit_literal(literal_start, position)
+            if run and run[0] + run[1] == index:
+                run[1] += 1
+            else:
+                flush_run()
+                run = [index, 1]
+            position += block_size
+            literal_start = position
+            if position + block_size <= size:
+                a, b = weak_checksum(data[position:position + block_size])
+            continue
+        if position + block_size < size:
+            old, new = data[position], data[position + block_size]
+            a = (a - old + new) & 0xffff
+            b = (b - block_size * old + a) & 0xffff
+        position += 1
+
+    # The signed file's last block may be short; it can only match the tail
+    if blocks and signature['length'] % block_size:
+        tail = size - signature['length'] % block_size
+        last = blocks[-1]
+        if tail >= literal_start and strong_hash(data[tail:]) == last[1]:
+            if literal_start < tail:
+                flush_run()
+                run = None
+                emit_literal(literal_start, tail)
+            if run and run[0] + run[1] == len(blocks) - 1:
+                run[1] += 1
+            else:
+                flush_run()
+                run = [len(blocks) - 1, 1]
+            literal_start = size
+
+    if literal_start < size:
+        flush_run()
+        run = None
+        emit_literal(literal_start, size)
+    flush_run()
+    return bytes(delta), literal
+
+
+class OffsetWriter:
+    """Body sink that writes into an open file descriptor at a fixed offset with os.pwrite"""
+    def __init__(self, fd, offset):
+        self.fd = fd
+        self.offset = offset
+
+    def write(self, data):
+        view = memoryview(data)
+        while view:
+            written = os.pwrite(self.fd, view, self.offset)
+            self.offset += written
+            view = view[written:]
+
+
+class DownloadState:
+    """Sidecar file that records which segments of a download are complete"""
+    def __init__(self, path, remote_name, size, etag, segment_size, done=()):
+        self.path = path
+        self.remote_name = remote_name
+        self.size = size
+        self.etag = etag
+        self.segment_size = segment_size
+        self.done = set(done)
+        self.lock = threading.Lock()
+
+    @classmethod
+    def load(cls, path):
+        try:
+            with open(path) as f:
+                data = json.load(f)
+            return cls(path, data['remote_name'], data['size'], data['etag'], data['segment_size'], data['done'])
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def matches(self, remote_name, size, etag, segment_size):
+        return (self.remote_name, self.size, self.etag, self.segment_size) == (remote_name, size, etag, segment_size)
+
+    @property
+    def segment_count(self):
+        return (self.size + self.segment_size - 1) // self.segment_size
+
+    def missing(self):
+        return [i for i in range(self.segment_count) if i not in self.done]
+
+    def mark_done(self, index):
+        with self.lock:
+            self.done.add(index)
+            self.save()
+
+    def save(self):
+        data = {
+            'remote_name': self.remote_name,
+            'size': self.size,
+            'etag': self.etag,
+            'segment_size': self.segment_size,
+            'done': sorted(self.done),
+        }
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(data, f)
+        os.replace(tmp_path, self.path)
+
+    def remove(self):
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+
+class Collector:
+    """Default body sink: keeps the body in memory"""
+    def __init__(self):
+        self.parts = []
+
+    def write(self, data):
+        self.parts.append(bytes(data))
+
+    def getvalue(self):
+        return b"".join(self.parts)
+
+
+class HttpConnection:
+    """One blocking keep-alive connection"""
+    def __init__(self, host, port, timeout=30.0):
+        self.host = host
+        self.port = port
+        self.sock = socket.create_connection((host, port), timeout=timeout)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.rfile = self.sock.makefile('rb', buffering=RECV_BUFSIZE)
+        self.last_used = time.monotonic()
+        self.reused = False
+        self.response_started = False
+
+    def send(self, data, body=b""):
+        self.response_started = False
+        if isinstance(body, FileBody):
+            self.sock.sendall(data)
+            body.send(self.sock)
+        else:
+            self.sock.sendall(data + bytes(body))
+
+    def read_response(self, method, sink=None):
+        """Read one response; the body goes to sink.write() if given, else into response.body"""
+        status, reason = parse_status_line(self.rfile.readline(MAX_LINE))
+        self.response_started = True
+        headers = {}
+        while True:
+            line = self.rfile.readline(MAX_LINE)
+            if line in (b"\r\n", b"\n", b""):
+                break
+            parse_header_line(line, headers)
+
+        collector = sink if sink is not None else Collector()
+        framing, length = body_framing(method, status, headers)
+        if framing == 'length':
+            self.copy(collector, length)
+        elif framing == 'chunked':
+            while True:
+                size = int(self.rfile.readline(MAX_LINE).split(b";")[0].strip() or b"0", 16)
+                if size == 0:
+                    # Trailers end with an empty line
+                    while self.rfile.readline(MAX_LINE) not in (b"\r\n", b"\n", b""):
+                        pass
+                    break
+                self.copy(collector, size)
+                self.rfile.readline(MAX_LINE)
+        elif framing == 'close':
+            self.copy(collector, None)
+
+        body = collector.getvalue() if sink is None else b""
+        return HttpResponse(status, reason, headers, body), reusable(headers, framing)
+
+    def copy(self, sink, length):
+        remaining = length
+        while remaining is None or remaining > 0:
+            chunk = self.rfile.read1(RECV_BUFSIZE if remaining is None else min(RECV_BUFSIZE, remaining))
+            if not chunk:
+                if remaining is None:
+                    return
+                raise ConnectionError(f"Connection closed with {remaining} body bytes outstanding")
+            sink.write(chunk)
+            if remaining is not None:
+                remaining -= len(chunk)
+
+    def close(self):
+        try:
+            self.rfile.close()
+            self.sock.close()
+        except OSError:
+            pass
+
+
+class ConnectionPool:
+    """Thread-safe pool of keep-alive connections to one server
+
+    At most max_connections are open at once; callers wait for a free one.
+    """
+    def __init__(self, host, port, max_connections=8, timeout=30.0, idle_timeout=IDLE_TIMEOUT):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.idle_timeout = idle_timeout
+        self.max_connections = max_connections
+        self.slots = threading.BoundedSemaphore(max_connections)
+        self.lock = threading.Lock()
+        self.idle = collections.deque()
+
+    def acquire(self):
+        self.slots.acquire()
+        now = time.monotonic()
+        with self.lock:
+            while self.idle:
+                conn = self.idle.pop()
+                if now - conn.last_used < self.idle_timeout:
+                    conn.reused = True
+                    return conn
+                conn.close()
+        try:
+            return HttpConnection(self.host, self.port, self.timeout)
+        except Exception:
+            self.slots.release()
+            raise
+
+    def release(self, conn, reuse):
+        if reuse:
+            conn.last_used = time.monotonic()
+            with self.lock:
+                self.idle.append(conn)
+        else:
+            conn.close()
+        self.slots.release()
+
+    def close(self):
+        with self.lock:
+            while self.idle:
+                self.idle.pop().close()
+
+
+class HttpClient:
+    """Blocking file-server client that reuses pooled keep-alive connections"""
+    def __init__(self, host='localhost', port=8885, max_connections=8, timeout=30.0):
+        self.host = host
+        self.port = port
+        self.pool = ConnectionPool(host, port, max_connections, timeout)
+
+    def request(self, method, path, headers=None, body=b"", sink=None):
+        data = build_request(method, path, self.host, headers, body_length(body) if body or method == 'POST' else None)
+        for attempt in range(2):
+            conn = self.pool.acquire()
+            try:
+                conn.send(data, body)
+                response, reuse = conn.read_response(method, sink)
+            except (ConnectionError, BrokenPipeError):
+                self.pool.release(conn, False)
+                # The server may have closed an idle keep-alive connection
+                if conn.reused and not conn.response_started and attempt == 0:
+                    continue
+                raise
+            except Exception:
+                self.pool.release(conn, False)
+                raise
+            self.pool.release(conn, reuse)
+            return response
+
+    def list_files(self):
+        return self.request('GET', '/list')
+
+    def upload_file(self, filename, remote_name=None):
+        headers = {'X-Filename': remote_name or os.path.basename(filename)}
+        return self.request('POST', '/upload', headers, FileBody(filename))
+
+    def upload_multipart(self, filename, remote_name=None):
+        body = MultipartFileBody(filename, f"----myclient{os.urandom(8).hex()}", remote_name=remote_name)
+        return self.request('POST', '/upload', {'Content-Type': body.content_type}, body)
+
+    def upload_compressed(self, filename, remote_name=None, level=6):
+        """Upload with Content-Encoding: gzip; the server stores the decompressed file"""
+        compressed = gzip_to_temp(filename, level)
+        try:
+            headers = {'X-Filename': remote_name or os.path.basename(filename), 'Content-Encoding': 'gzip'}
+            return self.request('POST', '/upload', headers, FileBody(compressed))
+        finally:
+            os.remove(compressed)
+
+    def download_file(self, remote_name, filename=None):
+        filename = filename or os.path.basename(remote_name)
+        with open(filename, 'wb') as f:
+            response = self.request('GET', '/' + remote_name, sink=f)
+        if not response.ok:
+            os.remove(filename)
+        return response
+
+    def delete_file(self, remote_name):
+        return self.request('DELETE', '/' + remote_name)
+
+    def download_segmented(self, remote_name, filename=None, segment_size=SEGMENT_SIZE, workers=None):
+        """Download a file as concurrent byte ranges written in place with os.pwrite
+
+        Progress is kept in filename + '.download'; calling this again after an
+        interruption fetches only the missing segments, as long as the remote
+        file (size and ETag) is unchanged and the local file is still there at
+        its full preallocated size. Otherwise the download starts over.
+        """
+        filename = filename or os.path.basename(remote_name)
+        path = '/' + remote_name
+        state = DownloadState.load(filename + '.download')
+        if state is not None:
+            try:
+                intact = os.path.getsize(filename) == state.size
+            except OSError:
+                intact = False
+            if not intact:
+                # Segments marked done would be holes in a recreated or truncated file
+                state.remove()
+                state = None
+
+        fd = os.open(filename, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            # Probe with the first byte; a server without range support sends everything
+            probe = self.request('GET', path, {'Range': 'bytes=0-0'}, sink=OffsetWriter(fd, 0))
+            if probe.status == 200:
+                os.ftruncate(fd, int(probe.headers.get('content-length', 0)))
+                return probe
+            if probe.status == 416 and probe.headers.get('content-range', '').endswith('/0'):
+                os.ftruncate(fd, 0)
+                return HttpResponse(200, 'OK', probe.headers)
+            if probe.status != 206:
+                if state is None:
+                    os.remove(filename)
+                return probe
+
+            size = int(probe.headers['content-range'].rsplit('/', 1)[1])
+            etag = probe.headers.get('etag')
+            if state is None or not state.matches(remote_name, size, etag, segment_size):
+                state = DownloadState(filename + '.download', remote_name, size, etag, segment_size)
+                state.save()
+
+            # Preallocate so every segment can be written at its offset
+            if hasattr(os, 'posix_fallocate'):
+                os.posix_fallocate(fd, 0, size)
+            os.ftruncate(fd, size)
+
+            def fetch(index):
+                start = index * segment_size
+                end = min(size, start + segment_size) - 1
+                headers = {'Range': f'bytes={start}-{end}'}
+                if etag:
+                    headers['If-Range'] = etag
+                writer = OffsetWriter(fd, start)
+                response = self.request('GET', path, headers, sink=writer)
+                if response.status != 206 or not response.headers.get('content-range', '').startswith(f'bytes {start}-{end}/'):
+                    raise ValueError(f"Unexpected response for range {start}-{end}: {response.status} {response.reason}")
+                if etag and response.headers.get('etag') != etag:
+                    raise ValueError(f"{remote_name} changed on the server during download")
+                if writer.offset != end + 1:
+                    raise ConnectionError(f"Short read for range {start}-{end}")
+                state.mark_done(index)
+
+            with ThreadPoolExecutor(max_workers=workers or self.pool.max_connections) as executor:
+                for future in [executor.submit(fetch, index) for index in state.missing()]:
+                    future.result()
+
+            state.remove()
+            return HttpResponse(200, 'OK', probe.headers)
+        finally:
+            os.close(fd)
+
+    def upload_resumable(self, filename, remote_name=None, chunk_size=SEGMENT_SIZE, workers=None):
+        """Upload through a server upload session, sending chunks in parallel
+
+        The session id is kept in filename + '.upload'; after an interruption
+        only the ranges the server has not received are sent again.
+        """
+        remote_name = remote_name or os.path.basename(filename)
+        stat = os.stat(filename)
+        sidecar = filename + '.upload'
+        identity = [remote_name, stat.st_size, stat.st_mtime_ns]
+
+        status = None
+        try:
+            with open(sidecar) as f:
+                saved = json.load(f)
+            if saved['identity'] == identity:
+                response = self.request('GET', f"/uploads/{saved['id']}")
+                if response.ok:
+                    status = json.loads(response.body)
+        except (OSError, ValueError, KeyError):
+            pass
+
+        if status is None:
+            response = self.request('POST', '/uploads', {'X-Filename': remote_name, 'Upload-Length': stat.st_size})
+            if response.status != 201:
+                return response
+            status = json.loads(response.body)
+            with open(sidecar, 'w') as f:
+                json.dump({'id': status['id'], 'identity': identity}, f)
+
+        session_path = f"/uploads/{status['id']}"
+        chunks = []
+        for start, end in status['missing']:
+            for offset in range(start, end, chunk_size):
+                chunks.append((offset, min(chunk_size, end - offset)))
+
+        def send(chunk):
+            offset, length = chunk
+            response = self.request('PATCH', session_path, {'Upload-Offset': offset},
+                                    FileRangeBody(filename, offset, length))
+            if not response.ok:
+                raise ValueError(f"Chunk at {offset} rejected: {response.status} {response.text}")
+
+        with ThreadPoolExecutor(max_workers=workers or self.pool.max_connections) as executor:
+            for future in [executor.submit(send, chunk) for chunk in chunks]:
+                future.result()
+
+        response = self.request('POST', session_path + '/commit')
+        if response.ok:
+            os.remove(sidecar)
+        return response
+
+    def upload_delta(self, filename, remote_name=None):
+        """Upload only the parts of filename that differ from the stored remote_name
+
+        Falls back to a full upload when the server has no copy of the file.
+        """
+        remote_name = remote_name or os.path.basename(filename)
+        for attempt in range(2):
+            response = self.request('GET', '/signatures/' + remote_name)
+            if response.status == 404:
+                return self.upload_file(filename, remote_name)
+            if not response.ok:
+                return response
+            signature = json.loads(response.body)
+            with open(filename, 'rb') as f:
+                data = f.read()
+            delta, literal = compute_delta(data, signature)
+            response = self.request('POST', '/delta/' + remote_name, {'If-Match': signature['version']}, delta)
+            # The remote file changed between fetching signatures and sending the delta
+            if response.status != 412:
+                return response
+        return response
+
+    def upload_batch(self, filenames, names=None):
+        """Upload many files in one request; the JSON response has a status per file"""
+        return self.request('POST', '/batch/upload', {'Content-Type': 'application/x-tar'}, TarFilesBody(filenames, names))
+
+    def delete_batch(self, remote_names):
+        return self.request('POST', '/batch/delete', {'Content-Type': 'text/plain'}, "\n".join(remote_names).encode())
+
+    def fetch_batch(self, remote_names, directory='.'):
+        """Fetch many files as one streamed tar, return the per-file statuses"""
+        body = "\n".join(remote_names).encode()
+        with tempfile.TemporaryFile(dir=directory) as archive:
+            response = self.request('POST', '/batch/fetch', {'Content-Type': 'text/plain'}, body, sink=archive)
+            if not response.ok:
+                raise ValueError(f"Batch fetch failed: {response.status} {response.reason}")
+            archive.seek(0)
+            status = None
+            with tarfile.open(fileobj=archive, mode='r|') as members:
+                for member in members:
+                    if not member.isfile():
+                        continue
+                    data = members.extractfile(member)
+                    if member.name == '.batch-status.json':
+                        status = json.loads(data.read())
+                        continue
+                    # Never trust archive paths: keep only the file name
+                    with open(os.path.join(directory, os.path.basename(member.name)), 'wb') as f:
+                        while True:
+                            chunk = data.read(RECV_BUFSIZE)
+                            if not chunk:
+                                break
+                            f.write(chunk)
+        return status
+
+    def close(self):
+        self.pool.close()
+
+
+class AsyncHttpConnection:
+    """One asyncio keep-alive connection"""
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+        self.last_used = time.monotonic()
+        self.reused = False
+        self.response_started = False
+
+    @classmethod
+    async def open(cls, host, port):
+        reader, writer = await asyncio.open_connection(host, port, limit=MAX_LINE)
+        return cls(reader, writer)
+
+    async def send(self, data, body=b""):
+        self.response_started = False
+        if isinstance(body, FileBody):
+            self.writer.write(data)
+            loop = asyncio.get_running_loop()
+            chunks = body.chunks()
+            try:
+                # File reads run in the default executor so the loop never blocks on disk
+                while True:
+                    chunk = await loop.run_in_executor(None, next, chunks, None)
+                    if chunk is None:
+                        break
+                    self.writer.write(chunk)
+                    await self.writer.drain()
+            finally:
+                chunks.close()
+        else:
+            self.writer.write(data + bytes(body))
+            await self.writer.drain()
+
+    async def read_response(self, method, sink=None):
+        status, reason = parse_status_line(await self.reader.readline())
+        self.response_started = True
+        headers = {}
+        while True:
+            line = await self.reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            parse_header_line(line, headers)
+
+        collector = sink if sink is not None else Collector()
+        framing, length = body_framing(method, status, headers)
+        if framing == 'length':
+            await self.copy(collector, length)
+        elif framing == 'chunked':
+            while True:
+                size = int((await self.reader.readline()).split(b";")[0].strip() or b"0", 16)
+                if size == 0:
+                    while (await self.reader.readline()) not in (b"\r\n", b"\n", b""):
+                        pass
+                    break
+                await self.copy(collector, size)
+                await self.reader.readline()
+        elif framing == 'close':
+            await self.copy(collector, None)
+
+        body = collector.getvalue() if sink is None else b""
+        return HttpResponse(status, reason, headers, body), reusable(headers, framing)
+
+    async def copy(self, sink, length):
+        remaining = length
+        while remaining is None or remaining > 0:
+            chunk = await self.reader.read(RECV_BUFSIZE if remaining is None else min(RECV_BUFSIZE, remaining))
+            if not chunk:
+                if remaining is None:
+                    return
+                raise ConnectionError(f"Connection closed with {remaining} body bytes outstanding")
+            sink.write(chunk)
+            if remaining is not None:
+                remaining -= len(chunk)
+
+    def close(self):
+        self.writer.close()
+
+
+class AsyncHttpClient:
+    """asyncio file-server client sharing at most max_connections keep-alive connections"""
+    def __init__(self, host='localhost', port=8885, max_connections=8, idle_timeout=IDLE_TIMEOUT):
+        self.host = host
+        self.port = port
+        self.idle_timeout = idle_timeout
+        self.slots = asyncio.Semaphore(max_connections)
+        self.idle = collections.deque()
+
+    async def acquire(self):
+        await self.slots.acquire()
+        now = time.monotonic()
+        while self.idle:
+            conn = self.idle.pop()
+            if now - conn.last_used < self.idle_timeout:
+                conn.reused = True
+                return conn
+            conn.close()
+        try:
+            return await AsyncHttpConnection.open(self.host, self.port)
+        except Exception:
+            self.slots.release()
+            raise
+
+    def release(self, conn, reuse):
+        if reuse:
+            conn.last_used = time.monotonic()
+            self.idle.append(conn)
+        else:
+            conn.close()
+        self.slots.release()
+
+    async def request(self, method, path, headers=None, body=b"", sink=None):
+        data = build_request(method, path, self.host, headers, body_length(body) if body or method == 'POST' else None)
+        for attempt in range(2):
+            conn = await self.acquire()
+            try:
+                await conn.send(data, body)
+                response, reuse = await conn.read_response(method, sink)
+            except (ConnectionError, asyncio.IncompleteReadError):
+                self.release(conn, False)
+                if conn.reused and not conn.response_started and attempt == 0:
+                    continue
+                raise
+            except BaseException:
+                self.release(conn, False)
+                raise
+            self.release(conn, reuse)
+            return response
+
+    async def list_files(self):
+        return await self.request('GET', '/list')
+
+    async def upload_file(self, filename, remote_name=None):
+        headers = {'X-Filename': remote_name or os.path.basename(filename)}
+        return await self.request('POST', '/upload', headers, FileBody(filename))
+
+    async def upload_multipart(self, filename, remote_name=None):
+        body = MultipartFileBody(filename, f"----myclient{os.urandom(8).hex()}", remote_name=remote_name)
+        return await self.request('POST', '/upload', {'Content-Type': body.content_type}, body)
+
+    async def download_file(self, remote_name, filename=None):
+        filename = filename or os.path.basename(remote_name)
+        with open(filename, 'wb') as f:
+            response = await self.request('GET', '/' + remote_name, sink=f)
+        if not response.ok:
+            os.remove(filename)
+        return response
+
+    async def delete_file(self, remote_name):
+        return await self.request('DELETE', '/' + remote_name)
+
+    async def close(self):
+        while self.idle:
+            self.idle.pop().close()
@@ -0,0 +1,116 @@
+import math
+
+UNIT = 1e-6  # values are recorded as integer microseconds
+SUMMARY_PERCENTILES = (50, 90, 99, 99.9)
+
+
+class LatencyHistogram:
+    """HdrHistogram-style latency histogram with bounded relative error
+
+    Values fall into power-of-two buckets, each split linearly into enough
+    sub-buckets for significant_digits of precision (about 0.1% for 3), so
+    memory stays small whatever the range. Counts live in a sparse dict,
+    which makes histograms cheap to merge across runs, processes and
+    machines and to ship as JSON (to_dict / from_dict).
+    """
+    def __init__(self, significant_digits=3):
+        self.significant_digits = significant_digits
+        self.sub_bucket_bits = math.ceil(math.log2(2 * 10 ** significant_digits))
+        self.sub_bucket_count = 1 << self.sub_bucket_bits
+        self.counts = {}
+        self.total = 0
+        self.sum = 0
+        self.min = None
+        self.max = 0
+
+    def index(self, value):
+        bucket = max(0, value.bit_length() - self.sub_bucket_bits)
+        return bucket * self.sub_bucket_count + (value >> bucket)
+
+    def highest_equivalent(self, index):
+        bucket, sub_bucket = divmod(index, self.sub_bucket_count)
+        return ((sub_bucket + 1) << bucket) - 1
+
+    def record_value(self, value, count=1):
+        """Record an integer number of microseconds"""
+        value = max(0, int(value))
+        index = self.index(value)
+        self.counts[index] = self.counts.get(index, 0) + count
+        self.total += count
+        self.sum += value * count
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = max(self.max, value)
+
+    def record(self, seconds):
+        self.record_value(round(seconds / UNIT))
+
+    def record_corrected(self, seconds, expected_interval):
+        """Record a closed-loop sample, back-filling the samples a stall kept from being sent
+
+        A request that took far longer than the interval between requests
+        hid the requests that would have been issued meanwhile; they are
+        added with linearly decreasing latencies, as HdrHistogram does.
+        """
+        self.record(seconds)
+        if expected_interval <= 0:
+            return
+        missing = seconds - expected_interval
+        while missing >= expected_interval:
+            self.record(missing)
+            missing -= expected_interval
+
+    def merge(self, other):
+        for index, count in other.counts.items():
+            self.counts[index] = self.counts.get(index, 0) + count
+        self.total += other.total
+        self.sum += other.sum
+        if other.min is not None:
+            self.min = other.min if self.min is None else min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        return self
+
+    def percentile(self, percent):
+        """Latency in seconds at percent (0-100); the exact maximum for 100"""
+        if not self.total:
+            return 0.0
+        if percent >= 100:
+            return self.max * UNIT
+        wanted = max(1, math.ceil(self.total * percent / 100))
+        seen = 0
+        for index in sorted(self.counts):
+            seen += self.counts[index]
+            if seen >= wanted:
+                return min(self.highest_equivalent(index), self.max) * UNIT
+        return self.max * UNIT
+
+    def mean(self):
+        return self.sum / self.total * UNIT if self.total else 0.0
+
+    def summary(self):
+        result = {'count': self.total, 'mean': self.mean()}
+        for percent in SUMMARY_PERCENTILES:
+            result[f"p{percent:g}"] = self.percentile(percent)
+        result['max'] = self.max * UNIT
+        return result
+
+    def format(self):
+        values = self.summary()
+        parts = [f"{name} {values[name] * 1000:.2f}" for name in values if name != 'count']
+        return f"n={self.total}  " + "  ".join(parts) + " (ms)"
+
+    def to_dict(self):
+        return {
+            'significant_digits': self.significant_digits,
+            'counts': {str(index): count for index, count in self.counts.items()},
+            'total': self.total, 'sum': self.sum, 'min': self.min, 'max': self.max,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        histogram = cls(data['significant_digits'])
+        histogram.counts = {int(index): count for index, count in data['counts'].items()}
+        histogram.total = data['total']
+        histogram.sum = data['sum']
+        histogram.min = data['min']
+        histogram.max = data['max']
+        return histogram
@@ -0,0 +1,649 @@
+import os
+import json
+import time
+import socket
+import random
+import asyncio
+import argparse
+from http_client import FileBody, MultipartFileBody
+from latency_histogram import LatencyHistogram
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+CONNECT_TIMEOUT = 10.0
+REQUEST_TIMEOUT = 180.0
+TICK = 0.05
+RESPONSE_PREVIEW = 200
+MAX_HEAD = 65536
+MAX_CONNECTIONS = 1000
+# A rate is sustained when this share of it completes without errors
+SUSTAINED_RATIO = 0.95
+MAX_ERROR_RATIO = 0.01
+
+
+def raise_fd_limit():
+    """Lift the soft open-files limit to the hard limit; every connection needs one"""
+    if resource is None:
+        return None
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if hard == resource.RLIM_INFINITY or hard > soft:
+        target = hard if hard != resource.RLIM_INFINITY else 1 << 20
+        try:
+            resource.setrlimit(resource.RLIMIT_NOFILE, (target, hard))
+            soft = target
+        except (ValueError, OSError):
+            pass
+    return soft
+
+
+class Request:
+    """What one virtual user sends: body is bytes, a FileBody or a MultipartFileBody"""
+    def __init__(self, method='GET', path='/', headers=None, body=b""):
+        self.method = method
+        self.path = path
+        self.headers = headers or {}
+        self.body = body
+
+    @property
+    def length(self):
+        return self.body.length if isinstance(self.body, FileBody) else len(self.body)
+
+    def head(self, host, keep_alive):
+        lines = [f"{self.method} {self.path} HTTP/1.1", f"Host: {host}", "User-Agent: myclient-load/1.0",
+                 f"Connection: {'keep-alive' if keep_alive else 'close'}"]
+        lines += [f"{key}: {value}" for key, value in self.headers.items()]
+        if self.body or self.method in ('POST', 'PUT', 'PATCH'):
+            lines.append(f"Content-Length: {self.length}")
+        return ("\r\n".join(lines) + "\r\n\r\n").encode()
+
+
+def request_factory(path='/', upload=None, multipart=False, headers=None, prefix=''):
+    """request_factory(user_id) that GETs path, or POSTs upload to it
+
+    The upload goes as the raw body named by X-Filename, or as a multipart
+    form with multipart set. Every request carries X-Client-ID, so a
+    server's per-client limits see each virtual user rather than one
+    client IP; prefix keeps ids and names unique across processes.
+    """
+    def make_request(user_id):
+        client_id = f"{prefix}{user_id}"
+        extra = dict(headers or {})
+        extra['X-Client-ID'] = client_id
+        if not upload:
+            return Request('GET', path, extra)
+        if multipart:
+            body = MultipartFileBody(upload, f"----LoadBoundary{client_id}")
+            extra['Content-Type'] = body.content_type
+            return Request('POST', path, extra, body)
+        extra['X-Filename'] = f"load-{client_id}-{os.path.basename(upload)}"
+        return Request('POST', path, extra, FileBody(upload))
+    return make_request
+
+
+class Stage:
+    """Move linearly to target concurrent users over seconds"""
+    def __init__(self, seconds, target):
+        self.seconds = seconds
+        self.target = target
+
+
+def ramp(concurrency, ramp_up=0.0, duration=None):
+    """Stages for: ramp to concurrency over ramp_up seconds, then hold for duration"""
+    stages = [Stage(ramp_up, concurrency)]
+    if duration:
+        stages.append(Stage(duration, concurrency))
+    return stages
+
+
+def target_at(stages, elapsed):
+    """Concurrent users wanted elapsed seconds into the schedule, None once it is over"""
+    previous = 0
+    for stage in stages:
+        if elapsed < stage.seconds:
+            return int(previous + (stage.target - previous) * elapsed / stage.seconds)
+        elapsed -= stage.seconds
+        previous = stage.target
+    return None
+
+
+class ConnectionState(asyncio.Protocol):
+    """One client connection as a state machine
+
+    idle -> head (status line and headers) -> body -> idle again for
+    keep-alive, or closed. Response bodies are only counted, never stored,
+    so tens of thousands of connections stay cheap.
+    """
+    def __init__(self):
+        self.loop = asyncio.get_running_loop()
+        self.transport = None
+        self.state = 'connecting'
+        self.buffer = bytearray()
+        self.waiter = None
+        self.writable = None
+        self.remaining = None
+        self.chunked = False
+        self.chunk_left = 0
+        self.trailer = False
+        self.received = 0
+        self.status = 0
+        self.keep_alive = False
+        self.preview = b""
+
+    def connection_made(self, transport):
+        self.transport = transport
+        self.state = 'idle'
+
+    def expect_response(self):
+        self.state = 'head'
+        self.buffer.clear()
+        self.received = 0
+        self.waiter = self.loop.create_future()
+        return self.waiter
+
+    def data_received(self, data):
+        if self.state == 'head':
+            self.buffer += data
+            header_end = self.buffer.find(b"\r\n\r\n")
+            if header_end < 0:
+                if len(self.buffer) > MAX_HEAD:
+                    self.fail(ValueError('Response head too large'))
+                return
+            self.parse_head(bytes(self.buffer[:header_end]))
+            data = bytes(self.buffer[header_end + 4:])
+            self.preview = bytes(self.buffer[:header_end + 4 + RESPONSE_PREVIEW])
+            self.buffer.clear()
+            self.state = 'body'
+        if self.state == 'body':
+            self.received += len(data)
+            if self.chunked:
+                if self.consume_chunked(data):
+                    self.finish()
+            elif self.remaining is not None and self.received >= self.remaining:
+                self.finish()
+
+    def consume_chunked(self, data):
+        """Follow chunked framing through data; True once the zero-size chunk and trailers are in"""
+        self.buffer += data
+        position = 0
+        while self.state == 'body':
+            if self.chunk_left:
+                # Chunk data and its CRLF are only skipped, like any other body
+                step = min(self.chunk_left, len(self.buffer) - position)
+                position += step
+                self.chunk_left -= step
+                if self.chunk_left:
+                    break
+            line_end = self.buffer.find(b"\r\n", position)
+            if line_end < 0:
+                if len(self.buffer) - position > MAX_HEAD:
+                    self.fail(ValueError('Chunk header too large'))
+                break
+            line = bytes(self.buffer[position:line_end])
+            position = line_end + 2
+            if self.trailer:
+                if not line:
+                    self.buffer.clear()
+                    return True
+                continue
+            try:
+                size = int(line.split(b';', 1)[0].strip(), 16)
+            except ValueError:
+                self.fail(ValueError(f'Bad chunk size {line[:20]!r}'))
+                break
+            if size:
+                self.chunk_left = size + 2
+            else:
+                self.trailer = True
+        del self.buffer[:position]
+        return False
+
+    def parse_head(self, head):
+        lines = head.decode('latin-1').split("\r\n")
+        parts = lines[0].split(" ", 2)
+        self.status = int(parts[1]) if len(parts) > 1 and parts[1].isdigit() else 0
+        headers = {}
+        for line in lines[1:]:
+            name, _, value = line.partition(':')
+            headers[name.strip().lower()] = value.strip()
+        # A chunked body ends with its zero-size chunk, whatever Content-Length says
+        self.chunked = 'chunked' in headers.get('transfer-encoding', '').lower()
+        self.chunk_left = 0
+        self.trailer = False
+        length = headers.get('content-length')
+        self.remaining = int(length) if length and length.isdigit() and not self.chunked else None
+        self.keep_alive = ((self.remaining is not None or self.chunked)
+                           and headers.get('connection', '').lower() == 'keep-alive')
+
+    def finish(self):
+        self.state = 'idle'
+        if self.waiter is not None and not self.waiter.done():
+            self.waiter.set_result(self.status)
+
+    def fail(self, exc):
+        self.state = 'closed'
+        if self.waiter is not None and not self.waiter.done():
+            self.waiter.set_exception(exc)
+        if self.transport is not None:
+            self.transport.abort()
+
+    def connection_lost(self, exc):
+        if self.state == 'body' and self.remaining is None and not self.chunked:
+            # Body delimited by the server closing the connection
+            self.keep_alive = False
+            self.finish()
+        elif self.state in ('head', 'body'):
+            self.fail(exc or ConnectionError('Server closed the connection'))
+        self.state = 'closed'
+        if self.writable is not None and not self.writable.done():
+            self.writable.set_result(None)
+
+    def pause_writing(self):
+        self.writable = self.loop.create_future()
+
+    def resume_writing(self):
+        if self.writable is not None and not self.writable.done():
+            self.writable.set_result(None)
+
+    async def drain(self):
+        if self.writable is not None:
+            await self.writable
+
+
+class LoadGenerator:
+    """asyncio load engine: virtual users following a ramp schedule
+
+    Each virtual user owns one connection (reused when keep_alive is set)
+    and sends request_factory(user_id) in a loop until the schedule ends,
+    total_requests have been started, or the user is retired because the
+    schedule ramps down. Results are dicts in the format stress_test.py
+    already analyses.
+    """
+    def __init__(self, host, port, request_factory, keep_alive=False,
+                 connect_timeout=CONNECT_TIMEOUT, request_timeout=REQUEST_TIMEOUT):
+        self.host = host
+        self.port = port
+        self.request_factory = request_factory
+        self.keep_alive = keep_alive
+        self.connect_timeout = connect_timeout
+        self.request_timeout = request_timeout
+        self.results = []
+        self.tickets = None
+        self.users = []
+        self.spawned = 0
+        self.active = 0
+        self.peak = 0
+
+    async def connect(self):
+        loop = asyncio.get_running_loop()
+        transport, state = await asyncio.wait_for(
+            loop.create_connection(ConnectionState, self.host, self.port), self.connect_timeout)
+        transport.get_extra_info('socket').setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        return state
+
+    async def send(self, state, request):
+        transport = state.transport
+        transport.write(request.head(f"{self.host}:{self.port}", self.keep_alive))
+        body = request.body
+        if isinstance(body, FileBody):
+            preamble = getattr(body, 'preamble', b"")
+            if preamble:
+                transport.write(preamble)
+            with open(body.filename, 'rb') as f:
+                await asyncio.get_running_loop().sendfile(
+                    transport, f, getattr(body, 'offset', 0), getattr(body, 'file_length', body.length))
+            epilogue = getattr(body, 'epilogue', b"")
+            if epilogue:
+                transport.write(epilogue)
+        elif body:
+            transport.write(body)
+        await state.drain()
+
+    async def exchange(self, state, request):
+        waiter = state.expect_response()
+        await self.send(state, request)
+        return await waiter
+
+    async def user(self, user_id, retired):
+        state = None
+        try:
+            while not retired.is_set():
+                if self.tickets is not None:
+                    if self.tickets <= 0:
+                        break
+                    self.tickets -= 1
+                request = self.request_factory(user_id)
+                start = time.perf_counter()
+                try:
+                    if state is None or state.state != 'idle':
+                        state = await self.connect()
+                    status = await asyncio.wait_for(self.exchange(state, request), self.request_timeout)
+                    elapsed = time.perf_counter() - start
+                    self.results.append({
+                        'client_id': str(user_id),
+                        'success': 200 <= status < 300,
+                        'status': status,
+                        'time': elapsed,
+                        'start': start,
+                        'response': state.preview.decode('utf-8', errors='replace'),
+                        'bytes_sent': request.length,
+                        'bytes_received': state.received,
+                    })
+                    if not state.keep_alive:
+                        state.transport.close()
+                        state = None
+                except (OSError, ValueError, asyncio.TimeoutError) as e:
+                    self.results.append({
+                        'client_id': str(user_id),
+                        'success': False,
+                        'error': f"{type(e).__name__}: {e}" if str(e) else type(e).__name__,
+                        'time': time.perf_counter() - start,
+                        'start': start,
+                    })
+                    if state is not None and state.transport is not None:
+                        state.transport.abort()
+                    state = None
+                    # Do not spin on a server that refuses or resets connections
+                    await asyncio.sleep(TICK)
+        finally:
+            if state is not None and state.transport is not None:
+                state.transport.close()
+            self.active -= 1
+
+    async def run(self, stages, total_requests=None):
+        """Follow stages (list of Stage); return (results, wall seconds)"""
+        self.tickets = total_requests
+        tasks = []
+        started = time.perf_counter()
+        while True:
+            target = target_at(stages, time.perf_counter() - started)
+            if target is None or (self.tickets is not None and self.tickets <= 0):
+                break
+            while len(self.users) < target:
+                retired = asyncio.Event()
+                self.users.append(retired)
+                self.active += 1
+                tasks.append(asyncio.get_running_loop().create_task(self.user(self.spawned, retired)))
+                self.spawned += 1
+            while len(self.users) > target:
+                self.users.pop().set()
+            self.peak = max(self.peak, self.active)
+            await asyncio.sleep(TICK)
+        if total_requests is None:
+            # Time-based: the schedule is over, stop every user after its current request
+            for retired in self.users:
+                retired.set()
+        await asyncio.gather(*tasks)
+        return self.results, time.perf_counter() - started
+
+
+def run_load(host, port, request_factory, concurrency, total_requests=None, duration=None, ramp_up=0.0,
+             stages=None, keep_alive=False, request_timeout=REQUEST_TIMEOUT):
+    """Blocking wrapper around LoadGenerator.run
+
+    With total_requests the schedule holds at concurrency until that many
+    requests have been made; otherwise it runs for ramp_up + duration.
+    """
+    raise_fd_limit()
+    if stages is None:
+        stages = ramp(concurrency, ramp_up, duration)
+    if total_requests is not None:
+        # Hold the last target until every request has been made
+        stages = stages + [Stage(float('inf'), stages[-1].target)]
+    generator = LoadGenerator(host, port, request_factory, keep_alive, request_timeout=request_timeout)
+    return asyncio.run(generator.run(stages, total_requests))
+
+
+class OpenLoopGenerator(LoadGenerator):
+    """Open-loop load: requests start on a schedule, whatever the server does
+
+    Arrivals are evenly spaced at rate per second, or Poisson (exponential
+    gaps with the same mean). Each request goes out at its intended time on
+    an idle keep-alive connection or a new one; once max_connections are
+    busy it waits for one. Latency is measured from the intended send time,
+    so time spent queued behind a slow server is counted rather than
+    omitted (coordinated omission); service holds the time from the actual
+    send for comparison. Lag is how far the generator itself fell behind
+    the schedule: when it is large the client, not the server, was the
+    bottleneck.
+    """
+    def __init__(self, host, port, request_factory, rate, poisson=False, max_connections=MAX_CONNECTIONS,
+                 keep_alive=True, connect_timeout=CONNECT_TIMEOUT, request_timeout=REQUEST_TIMEOUT, seed=None):
+        LoadGenerator.__init__(self, host, port, request_factory, keep_alive, connect_timeout, request_timeout)
+        self.rate = rate
+        self.poisson = poisson
+        self.max_connections = max_connections
+        self.random = random.Random(seed)
+        self.latency = LatencyHistogram()
+        self.service = LatencyHistogram()
+        self.errors = {}
+        self.idle = []
+        self.slots = None
+        self.sent = 0
+        self.completed = 0
+        self.max_lag = 0.0
+
+    def arrivals(self, started):
+        intended = started
+        while True:
+            yield intended
+            intended += self.random.expovariate(self.rate) if self.poisson else 1.0 / self.rate
+
+    def error(self, key):
+        self.errors[key] = self.errors.get(key, 0) + 1
+
+    async def issue(self, sequence, intended):
+        loop = asyncio.get_running_loop()
+        request = self.request_factory(sequence)
+        async with self.slots:
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+            state = self.idle.pop() if self.idle else None
+            sent = loop.time()
+            try:
+                if state is None or state.state != 'idle':
+                    state = await self.connect()
+                status = await asyncio.wait_for(self.exchange(state, request), self.request_timeout)
+            except (OSError, ValueError, asyncio.TimeoutError) as e:
+                self.error(type(e).__name__)
+                if state is not None and state.transport is not None:
+                    state.transport.abort()
+                return
+            finally:
+                self.active -= 1
+            done = loop.time()
+            if 200 <= status < 300:
+                self.completed += 1
+                self.latency.record(done - intended)
+                self.service.record(done - sent)
+            else:
+                self.error(f"HTTP {status}")
+            if self.keep_alive and state.keep_alive:
+                self.idle.append(state)
+            else:
+                state.transport.close()
+
+    async def run(self, duration):
+        """Issue requests for duration seconds, wait for them; return a report dict"""
+        loop = asyncio.get_running_loop()
+        self.slots = asyncio.Semaphore(self.max_connections)
+        tasks = set()
+        started = loop.time()
+        for sequence, intended in enumerate(self.arrivals(started)):
+            if intended >= started + duration:
+                break
+            # Behind schedule: still yield so responses get read between bursts
+            await asyncio.sleep(max(intended - loop.time(), 0))
+            self.max_lag = max(self.max_lag, loop.time() - intended)
+            task = loop.create_task(self.issue(sequence, intended))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+            self.sent += 1
+        await asyncio.gather(*tasks)
+        wall_time = loop.time() - started
+        for state in self.idle:
+            state.transport.close()
+        self.idle.clear()
+        return {
+            'rate': self.rate,
+            'arrivals': 'poisson' if self.poisson else 'fixed',
+            'duration': duration,
+            'wall_time': wall_time,
+            'sent': self.sent,
+            'completed': self.completed,
+            'errors': self.errors,
+            'throughput': self.completed / wall_time if wall_time else 0.0,
+            'latency': self.latency,
+            'service': self.service,
+            'max_lag': self.max_lag,
+            'peak_connections': self.peak,
+        }
+
+
+def run_open_loop(host, port, request_factory, rate, duration, poisson=False, max_connections=MAX_CONNECTIONS,
+                  keep_alive=True, request_timeout=REQUEST_TIMEOUT, seed=None):
+    """Blocking wrapper around OpenLoopGenerator.run"""
+    raise_fd_limit()
+    generator = OpenLoopGenerator(host, port, request_factory, rate, poisson, max_connections, keep_alive,
+                                  request_timeout=request_timeout, seed=seed)
+    return asyncio.run(generator.run(duration))
+
+
+def sustained(report, slo_p99=None):
+    """True when the server kept up with the report's arrival rate"""
+    errors = sum(report['errors'].values())
+    return (report['throughput'] >= SUSTAINED_RATIO * report['rate']
+            and errors <= MAX_ERROR_RATIO * max(report['sent'], 1)
+            and (slo_p99 is None or report['latency'].percentile(99) <= slo_p99))
+
+
+def sweep_rates(spec):
+    """Rates from "start:stop:step" (inclusive) or a comma separated list"""
+    if ':' in spec:
+        start, stop, step = (float(part) for part in spec.split(':'))
+        rates = []
+        rate = start
+        while rate <= stop + 1e-9:
+            rates.append(rate)
+            rate += step
+        return rates
+    return [float(rate) for rate in spec.split(',')]
+
+
+def find_saturation(host, port, request_factory, rates, duration, poisson=False, slo_p99=None,
+                    max_connections=MAX_CONNECTIONS, keep_alive=True, pause=1.0):
+    """Step through rates until the server stops keeping up
+
+    Returns (saturation report or None, all reports). The saturation
+    throughput is the highest rate that was still sustained, i.e. its
+    completions kept pace and p99 stayed within slo_p99 seconds.
+    """
+    reports = []
+    saturation = None
+    for rate in rates:
+        report = run_open_loop(host, port, request_factory, rate, duration, poisson, max_connections, keep_alive)
+        reports.append(report)
+        print_open_loop(report)
+        if not sustained(report, slo_p99):
+            break
+        saturation = report
+        # Let the server drain sockets in TIME_WAIT and queued work
+        time.sleep(pause)
+    if rate_limited(reports[-1]['errors'], reports[-1]['sent']):
+        print("The sweep stopped on 429s: start the server without --rate-limit to find its saturation")
+    elif saturation is None:
+        print("Saturated at the first rate; sweep from a lower rate")
+    elif saturation is reports[-1]:
+        print(f"Sustained every rate up to {saturation['rate']:g}/s; sweep higher to find saturation")
+    else:
+        print(f"Saturation throughput: {saturation['throughput']:.1f} req/s (target rate {saturation['rate']:g}/s)")
+    return saturation, reports
+
+
+def rate_limited(errors, sent):
+    """True when 429s make up a noticeable share of the requests
+
+    The numbers then describe the server's per-client limiter, not its
+    capacity: rerun against a server started without --rate-limit.
+    """
+    return errors.get('HTTP 429', 0) > MAX_ERROR_RATIO * max(sent, 1)
+
+
+def print_open_loop(report):
+    errors = sum(report['errors'].values())
+    print(f"rate {report['rate']:g}/s ({report['arrivals']}): sent {report['sent']}, ok {report['completed']}, "
+          f"errors {errors}, throughput {report['throughput']:.1f} req/s, "
+          f"peak connections {report['peak_connections']}, max lag {report['max_lag'] * 1000:.1f}ms")
+    print(f"  latency  {report['latency'].format()}")
+    print(f"  service  {report['service'].format()}")
+    for error, count in sorted(report['errors'].items(), key=lambda item: -item[1]):
+        print(f"  {count}x {error}")
+    if rate_limited(report['errors'], report['sent']):
+        print("  Warning: the server is rate limiting; this measures its limiter, not its capacity")
+
+
+def summarize(results, wall_time):
+    ok = [r for r in results if r.get('success')]
+    histogram = LatencyHistogram()
+    for r in ok:
+        histogram.record(r['time'])
+    print(f"Requests: {len(results)}, successful: {len(ok)}, wall time {wall_time:.2f}s, "
+          f"{len(ok) / wall_time if wall_time else 0:.1f} req/s")
+    if ok:
+        print(f"Latency (closed loop, excludes queueing before send): {histogram.format()}")
+    errors = {}
+    for r in results:
+        if not r.get('success'):
+            key = r.get('error') or f"HTTP {r.get('status')}"
+            errors[key] = errors.get(key, 0) + 1
+    for error, count in sorted(errors.items(), key=lambda item: -item[1]):
+        print(f"  {count}x {error}")
+    if rate_limited(errors, len(results)):
+        print("  Warning: the server is rate limiting; this measures its limiter, not its capacity")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='asyncio HTTP load generator')
+    parser.add_argument('host')
+    parser.add_argument('port', type=int)
+    parser.add_argument('--concurrency', type=int, default=100, help='concurrent connections (virtual users)')
+    parser.add_argument('--ramp-up', type=float, default=0.0, help='seconds to reach full concurrency')
+    parser.add_argument('--duration', type=float, default=10.0, help='seconds to hold full concurrency')
+    parser.add_argument('--requests', type=int, help='stop after this many requests instead of after --duration')
+    parser.add_argument('--path', default='/', help='GET this path, or upload to it with --upload')
+    parser.add_argument('--upload', help='file to POST as the raw request body')
+    parser.add_argument('--keep-alive', action='store_true', help='reuse each connection for further requests')
+    parser.add_argument('--rate', type=float, help='open loop: start this many requests per second instead of '
+                                                    'running --concurrency users')
+    parser.add_argument('--sweep', help='open loop: find the saturation throughput over rates "start:stop:step" or "r1,r2,..."')
+    parser.add_argument('--arrivals', choices=('fixed', 'poisson'), default='fixed', help='open loop arrival process')
+    parser.add_argument('--max-connections', type=int, default=MAX_CONNECTIONS, help='open loop connection cap')
+    parser.add_argument('--slo-p99', type=float, help='sweep: a rate only counts as sustained with p99 under this many ms')
+    parser.add_argument('--histogram-out', help='open loop: write the latency histogram as JSON for merging')
+    args = parser.parse_args()
+
+    factory = request_factory(args.path, args.upload)
+    poisson = args.arrivals == 'poisson'
+    if args.sweep:
+        slo = args.slo_p99 / 1000 if args.slo_p99 else None
+        find_saturation(args.host, args.port, factory, sweep_rates(args.sweep), args.duration, poisson, slo,
+                        args.max_connections, args.keep_alive)
+        return
+    if args.rate:
+        report = run_open_loop(args.host, args.port, factory, args.rate, args.duration, poisson,
+                               args.max_connections, args.keep_alive)
+        print_open_loop(report)
+        if args.histogram_out:
+            with open(args.histogram_out, 'w') as f:
+                json.dump(report['latency'].to_dict(), f)
+        return
+
+    results, wall_time = run_load(args.host, args.port, factory, args.concurrency, args.requests,
+                                  args.duration, args.ramp_up, keep_alive=args.keep_alive)
+    summarize(results, wall_time)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,8 @@
 import socket
 import time
 import sys
-import os
 import json
+from http_client import MultipartFileBody
 
 def upload_file(filename, server_address, client_id):
     start_time = time.time()
@@ -15,33 +15,23 @@ def upload_file(filename, server_address, client_id):
         # Connect with verification
         sock.connect(server_address)
         
-        # Read file content
-        with open(filename, 'rb') as f:
-            file_content = f.read()
-        
-        # Build proper HTTP request
+        # Stream the multipart body from disk instead of reading the file into memory
         boundary = f"----WebKitFormBoundary{client_id}{int(time.time())}"
-        body_parts = [
-            f"--{boundary}\r\n".encode(),
-            f'Content-Disposition: form-data; name="file"; filename="{os.path.basename(filename)}"\r\n'.encode(),
-            f"Content-Type: application/octet-stream\r\n\r\n".encode(),
-            file_content,
-            f"\r\n--{boundary}--\r\n".encode()
-        ]
-        body = b"".join(body_parts)
+        body = MultipartFileBody(filename, boundary)
         
         headers = (
             f"POST /upload HTTP/1.1\r\n"
             f"Host: {server_address[0]}:{server_address[1]}\r\n"
-            f"Content-Type: multipart/form-data; boundary={boundary}\r\n"
-            f"Content-Length: {len(body)}\r\n"
+            f"Content-Type: {body.content_type}\r\n"
+            f"Content-Length: {body.length}\r\n"
             f"X-Client-ID: {client_id}\r\n"
             f"Connection: close\r\n"
             f"\r\n"
         ).encode()
         
         # Send request
-        sock.sendall(headers + body)
+        sock.sendall(headers)
+        body.send(sock)
         
         # Get response
         response = b""
@@ -66,7 +56,7 @@ def upload_file(filename, server_address, client_id):
             'success': success,
             'time': response_time,
             'response': response_str[:200],
-            'bytes_sent': len(body)
+            'bytes_sent': body.length
         })
         
     except Exception as e:
@@ -4,10 +4,11 @@ import statistics
 import matplotlib.pyplot as plt
 import psutil
 import os
-from concurrent.futures import ThreadPoolExecutor, as_completed
 import numpy as np
 import json
 import socket
+from load_generator import request_factory, run_load, find_saturation, sweep_rates
+from distributed_load import Coordinator, distributed_sweep
 
 # Configuration - Adjust these for different test intensities
 TEST_CONFIG = {
@@ -36,123 +37,53 @@ def create_test_files():
                     f.write(chunk)
                     remaining -= len(chunk)
 
-def run_single_client(client_id, server_ip, port, test_file):
-    """Run a single client and return the result"""
-    start_time = time.time()
-    try:
-        # Use direct socket connection instead of subprocess
-        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
-        sock.settimeout(180.0)  # Total operation timeout
-        
-        # Connect with timeout
-        sock.connect((server_ip, port))
-        
-        # Build and send request
-        boundary = f"----WebKitFormBoundary{client_id}{int(time.time())}"
-        with open(test_file, 'rb') as f:
-            file_content = f.read()
-        
-        body = b"".join([
-            f"--{boundary}\r\n".encode(),
-            f'Content-Disposition: form-data; name="file"; filename="{os.path.basename(test_file)}"\r\n'.encode(),
-            b"Content-Type: application/octet-stream\r\n\r\n",
-            file_content,
-            f"\r\n--{boundary}--\r\n".encode()
-        ])
-        
-        headers = (
-            f"POST /upload HTTP/1.1\r\n"
-            f"Host: {server_ip}:{port}\r\n"
-            f"Content-Type: multipart/form-data; boundary={boundary}\r\n"
-            f"Content-Length: {len(body)}\r\n"
-            f"X-Client-ID: {client_id}\r\n"
-            f"Connection: close\r\n\r\n"
-        ).encode()
-        
-        sock.sendall(headers + body)
-        
-        # Receive response
-        response = b""
-        while True:
-            chunk = sock.recv(4096)
-            if not chunk:
-                break
-            response += chunk
-        
-        elapsed = time.time() - start_time
-        
-        # Parse response
-        response_str = response.decode('utf-8', errors='replace')
-        success = response_str.startswith(('HTTP/1.1 200', 'HTTP/1.1 201'))
-        
-        return {
-            'client_id': str(client_id),
-            'success': success,
-            'time': elapsed,
-            'response': response_str[:200],
-            'bytes_sent': len(body)
-        }
-        
-    except socket.timeout as e:
-        return {
-            'client_id': str(client_id),
-            'success': False,
-            'error': f"Socket timeout after {time.time()-start_time:.2f}s",
-            'time': time.time()-start_time
-        }
-    except ConnectionRefusedError:
-        return {
-            'client_id': str(client_id),
-            'success': False,
-            'error': "Connection refused",
-            'time': time.time()-start_time
-        }
-    except Exception as e:
-        return {
-            'client_id': str(client_id),
-            'success': False,
-            'error': str(e),
-            'time': time.time()-start_time
-        }
-    finally:
-        try:
-            sock.close()
-        except:
-            pass
+def run_clients(num_clients, server_ip, port, test_file, durability=None, concurrency=None, ramp_up=0.0):
+    """Run num_clients uploads with the asyncio load generator
 
-def run_clients(num_clients, server_ip, port, test_file):
-    """Run multiple clients concurrently"""
+    concurrency caps the uploads in flight (default: all of them at once);
+    ramp_up spreads the first connections over that many seconds.
+    """
     print(f"Starting {num_clients} clients...")
-    start_time = time.time()
-    results = []
-    
-    with ThreadPoolExecutor(max_workers=min(200, os.cpu_count() * 4)) as executor:
-        # Submit all client tasks
-        futures = []
-        for i in range(num_clients):
-            future = executor.submit(run_single_client, i, server_ip, port, test_file)
-            futures.append(future)
-            time.sleep(0.01)  # Small delay to stagger starts
-        
-        # Collect results
-        for i, future in enumerate(as_completed(futures)):
-            try:
-                result = future.result()
-                results.append(result)
-                if i % 10 == 0:  # Progress update every 10 clients
-                    print(f"Completed {i+1}/{num_clients} clients")
-            except Exception as e:
-                print(f"Client {i} exception: {e}")
-                results.append({
-                    'client_id': str(i),
-                    'success': False,
-                    'error': str(e),
-                    'time': 0
-                })
-    
-    total_time = time.time() - start_time
-    return results, total_time
+    return run_load(server_ip, port, upload_request_factory(test_file, durability), concurrency or num_clients,
+                    total_requests=num_clients, ramp_up=ramp_up)
+
+def upload_request_factory(test_file, durability=None):
+    """request_factory for the load generator: one multipart upload of test_file per client"""
+    headers = {'X-Durability': durability} if durability else None
+    return request_factory('/upload', test_file, multipart=True, headers=headers)
+
+def saturation_sweep(server_ip, server_port, rates, duration=10.0, test_file='test_small.jpg', poisson=False, slo_p99=None,
+                     workers=1):
+    """Open-loop upload sweep: the highest arrival rate the server sustains
+
+    Unlike the closed-loop runs above, latency here is measured from when
+    each upload was scheduled, so queueing delay under overload shows up
+    in the percentiles instead of just slowing the clients down. With
+    workers > 1 the load comes from that many generator processes and
+    their histograms are merged, so one client core is not the limit.
+    """
+    print(f"\n{'='*60}")
+    print(f"SATURATION SWEEP {server_ip}:{server_port} rates {', '.join(f'{r:g}' for r in rates)}/s, {duration:g}s each")
+    print(f"{'='*60}")
+    if workers > 1:
+        coordinator = Coordinator(workers)
+        try:
+            coordinator.start()
+            job = {'host': server_ip, 'port': server_port, 'path': '/upload', 'upload': test_file,
+                   'multipart': True, 'duration': duration, 'poisson': poisson}
+            saturation, reports = distributed_sweep(coordinator, job, rates, slo_p99)
+        finally:
+            coordinator.stop()
+    else:
+        saturation, reports = find_saturation(server_ip, server_port, upload_request_factory(test_file), rates,
+                                              duration, poisson, slo_p99)
+    print(f"{'rate':>8} {'req/s':>8} {'p50 ms':>8} {'p99 ms':>8} {'p99.9 ms':>9} {'max ms':>8} {'errors':>7}")
+    for report in reports:
+        latency = report['latency']
+        print(f"{report['rate']:>8g} {report['throughput']:>8.1f} {latency.percentile(50) * 1000:>8.1f} "
+              f"{latency.percentile(99) * 1000:>8.1f} {latency.percentile(99.9) * 1000:>9.1f} "
+              f"{latency.percentile(100) * 1000:>8.1f} {sum(report['errors'].values()):>7}")
+    return saturation, reports
 
 def analyze_results(results, server_type):
     """Analyze and display test results"""
@@ -326,6 +257,7 @@ def test_server(server_type, server_ip, port, test_intensity='medium', custom_co
     num_clients = config['clients']
     num_runs = config['runs']
     test_file = config['file']
+    durability = config.get('durability')
     
     # Check if test file exists
     if not os.path.exists(test_file):
@@ -346,7 +278,7 @@ def test_server(server_type, server_ip, port, test_intensity='medium', custom_co
     
     for run_num in range(num_runs):
         print(f"\n--- Run {run_num + 1}/{num_runs} ---")
-        client_results, total_time = run_clients(num_clients, server_ip, port, test_file)
+        client_results, total_time = run_clients(num_clients, server_ip, port, test_file, durability)
         
         run_data = {
             'run': run_num + 1,
@@ -446,20 +378,55 @@ def run_test():
     print("Test completed!")
     return results
 
-def run_custom_test(server_ip, server_port, num_clients=50, num_runs=3, test_file='test_small.jpg'):
+def run_custom_test(server_ip, server_port, num_clients=50, num_runs=3, test_file='test_small.jpg', durability=None):
     """Run a custom test with specified parameters"""
     custom_config = {
         'clients': num_clients,
         'runs': num_runs,
-        'file': test_file
+        'file': test_file,
+        'durability': durability
     }
     
-    return test_server('custom', server_ip, server_port, custom_config=custom_config)
+    return test_server(f"custom-{durability}" if durability else 'custom', server_ip, server_port, custom_config=custom_config)
+
+def compare_durability(server_ip, server_port, num_clients=50, num_runs=3, test_file='test_small.jpg'):
+    """Run the same upload load once per server durability mode (X-Durability header)"""
+    summary = {}
+    for mode in ('none', 'fdatasync', 'group'):
+        runs = run_custom_test(server_ip, server_port, num_clients, num_runs, test_file, mode)
+        clients = [r for run in runs for r in run['client_results']]
+        times = [r['time'] for r in clients if r.get('success')]
+        wall_time = sum(run['total_time'] for run in runs)
+        summary[mode] = {
+            'success': len(times),
+            'total': len(clients),
+            'avg': statistics.mean(times) if times else 0,
+            'p95': np.percentile(times, 95) if times else 0,
+            'req_per_sec': len(times) / wall_time if wall_time else 0,
+            'mb_per_sec': sum(r.get('bytes_sent', 0) for r in clients if r.get('success')) / wall_time / 1e6 if wall_time else 0,
+        }
+        time.sleep(2)
+    
+    print(f"\n{'='*60}")
+    print("DURABILITY COMPARISON")
+    print(f"{'='*60}")
+    print(f"{'mode':<10} {'ok':>9} {'avg s':>8} {'p95 s':>8} {'req/s':>8} {'MB/s':>8}")
+    for mode, row in summary.items():
+        print(f"{mode:<10} {row['success']:>4}/{row['total']:<4} {row['avg']:>8.3f} {row['p95']:>8.3f} "
+              f"{row['req_per_sec']:>8.1f} {row['mb_per_sec']:>8.1f}")
+    return summary
 
 if __name__ == "__main__":
     import sys
     
-    if len(sys.argv) > 1:
+    if len(sys.argv) > 4 and sys.argv[3] == 'sweep':
+        # Open-loop saturation sweep
+        create_test_files()
+        saturation_sweep(sys.argv[1], int(sys.argv[2]), sweep_rates(sys.argv[4]),
+                         float(sys.argv[5]) if len(sys.argv) > 5 else 10.0,
+                         sys.argv[6] if len(sys.argv) > 6 else 'test_small.jpg',
+                         workers=int(sys.argv[7]) if len(sys.argv) > 7 else 1)
+    elif len(sys.argv) > 1:
         # Custom test mode
         if len(sys.argv) >= 3:
             server_ip = sys.argv[1]
@@ -467,16 +434,21 @@ if __name__ == "__main__":
             num_clients = int(sys.argv[3]) if len(sys.argv) > 3 else 50
             num_runs = int(sys.argv[4]) if len(sys.argv) > 4 else 3
             test_file = sys.argv[5] if len(sys.argv) > 5 else 'test_small.jpg'
+            durability = sys.argv[6] if len(sys.argv) > 6 else None
             
             print(f"Running custom test: {server_ip}:{server_port}")
-            print(f"Clients: {num_clients}, Runs: {num_runs}, File: {test_file}")
+            print(f"Clients: {num_clients}, Runs: {num_runs}, File: {test_file}, Durability: {durability or 'server default'}")
             
             get_system_info()
             create_test_files()
-            run_custom_test(server_ip, server_port, num_clients, num_runs, test_file)
+            if durability == 'compare':
+                compare_durability(server_ip, server_port, num_clients, num_runs, test_file)
+            else:
+                run_custom_test(server_ip, server_port, num_clients, num_runs, test_file, durability)
         else:
             print("Usage for custom test:")
-            print("python stress_test.py <server_ip> <server_port> [num_clients] [num_runs] [test_file]")
+            print("python stress_test.py <server_ip> <server_port> [num_clients] [num_runs] [test_file] [none|fdatasync|group|compare]")
+            print("python stress_test.py <server_ip> <server_port> sweep <start:stop:step> [seconds_per_rate] [test_file] [workers]")
     else:
         # Run full test suite
         run_test()
\ No newline at end of file
@@ -0,0 +1,180 @@
+import io
+import os
+import mmap
+import zlib
+import tempfile
+import hashlib
+from glob import glob
+from delta_sync import file_etag
+from durability import temp_path
+
+CONTENT_CODINGS = {'gzip': 'gzip', 'x-gzip': 'gzip', 'deflate': 'deflate'}
+CHUNK_SIZE = 256 * 1024
+MAX_RATIO = 200
+MAX_OUTPUT = 4 * 1024 * 1024 * 1024
+# Tiny bodies legitimately have huge ratios (e.g. a few KB of zeros); only
+# enforce MAX_RATIO once this much has been produced
+RATIO_GRACE = 1024 * 1024
+# decode_body keeps up to this much decoded output on the heap
+DECODE_SPOOL_MEMORY = 1024 * 1024
+ENCODED_DIR = '.encoded'
+
+
+class UnsupportedEncoding(ValueError):
+    pass
+
+
+class DecompressionBomb(ValueError):
+    pass
+
+
+def content_coding(headers):
+    """Normalised Content-Encoding of a request, None for identity
+
+    Stacked codings ("gzip, deflate") are not accepted.
+    """
+    value = headers.get('content-encoding', '').strip().lower()
+    if not value or value == 'identity':
+        return None
+    if value not in CONTENT_CODINGS:
+        raise UnsupportedEncoding(f"Unsupported Content-Encoding {value!r}")
+    return CONTENT_CODINGS[value]
+
+
+def accepts_gzip(headers):
+    for item in headers.get('accept-encoding', '').lower().split(','):
+        name, _, params = item.strip().partition(';')
+        if name.strip() in ('gzip', 'x-gzip', '*'):
+            q = params.strip()
+            if not q.startswith('q='):
+                return True
+            try:
+                return float(q[2:] or 0) > 0
+            except ValueError:
+                # A malformed q-value is treated as not accepted
+                return False
+    return False
+
+
+def make_decoder(coding, first_bytes):
+    if coding == 'gzip':
+        return zlib.decompressobj(16 + zlib.MAX_WBITS)
+    # "deflate" is meant to be zlib-wrapped, but raw deflate is common in practice
+    if len(first_bytes) >= 2 and first_bytes[0] & 0x0f == 8 and (first_bytes[0] << 8 | first_bytes[1]) % 31 == 0:
+        return zlib.decompressobj(zlib.MAX_WBITS)
+    return zlib.decompressobj(-zlib.MAX_WBITS)
+
+
+class DecodingReader:
+    """File-like reader that decompresses a gzip/deflate body while it arrives
+
+    read() never produces more than size bytes from one call, so output is
+    bounded no matter how well the input compresses. DecompressionBomb is
+    raised once the output exceeds max_output, or max_ratio times the
+    compressed bytes read so far. raw_observer, if set, sees every
+    compressed chunk as read.
+    """
+    def __init__(self, reader, coding, max_ratio=MAX_RATIO, max_output=MAX_OUTPUT):
+        self.reader = reader
+        self.coding = coding
+        self.max_ratio = max_ratio
+        self.max_output = max_output
+        self.raw_observer = None
+        self.decoder = None
+        self.pending = b''
+        self.compressed = 0
+        self.output = 0
+        self.finished = False
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            return b''.join(iter(lambda: self.read(CHUNK_SIZE), b''))
+        while not self.finished:
+            data = self.pending
+            self.pending = b''
+            if not data:
+                data = self.reader.read(CHUNK_SIZE)
+                if not data:
+                    if self.decoder is not None and not self.decoder.eof:
+                        raise ValueError('Truncated compressed body')
+                    self.finished = True
+                    break
+                self.compressed += len(data)
+                if self.raw_observer is not None:
+                    self.raw_observer(data)
+            if self.decoder is None:
+                self.decoder = make_decoder(self.coding, data)
+            try:
+                out = self.decoder.decompress(data, size or CHUNK_SIZE)
+            except zlib.error as e:
+                raise ValueError(f"Corrupt {self.coding} body: {e}")
+            self.pending = self.decoder.unconsumed_tail
+            if self.decoder.eof:
+                # Concatenated gzip members decode to the concatenated data
+                rest = self.decoder.unused_data
+                if self.coding == 'gzip' and rest.strip(b'\0'):
+                    self.decoder = None
+                    self.pending = rest
+                else:
+                    self.finished = True
+            if out:
+                self.output += len(out)
+                if self.output > self.max_output:
+                    raise DecompressionBomb(f"Decompressed body exceeds {self.max_output} bytes")
+                if self.output > RATIO_GRACE and self.output > self.max_ratio * self.compressed:
+                    raise DecompressionBomb(f"Compression ratio exceeds {self.max_ratio}:1")
+                return out
+        return b''
+
+
+def decode_body(body, coding, max_ratio=MAX_RATIO, max_output=MAX_OUTPUT):
+    """Decompress a body that is already in memory, with the same limits
+
+    The output goes through a SpooledTemporaryFile, so a body that decodes
+    past DECODE_SPOOL_MEMORY lives in the page cache instead of the heap,
+    like a request spooled under the memory budget. Returns bytes, or a
+    read-only mmap for large output; close that with release_request.
+    """
+    reader = DecodingReader(io.BytesIO(body), coding, max_ratio, max_output)
+    with tempfile.SpooledTemporaryFile(max_size=DECODE_SPOOL_MEMORY) as spooled:
+        for chunk in iter(lambda: reader.read(CHUNK_SIZE), b''):
+            spooled.write(chunk)
+        if reader.output <= DECODE_SPOOL_MEMORY:
+            spooled.seek(0)
+            return spooled.read()
+        spooled.rollover()
+        spooled.flush()
+        return mmap.mmap(spooled.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+class EncodedStore:
+    """gzip copies of stored files under ENCODED_DIR, one per file version (ETag)
+
+    Uploads sent with Content-Encoding: gzip can be kept as received, so GET
+    answers clients that accept gzip without compressing anything.
+    """
+    def disk_prefix(self, path):
+        return os.path.join(ENCODED_DIR, hashlib.sha1(os.path.abspath(path).encode()).hexdigest()[:16])
+
+    def path_for(self, path, stat):
+        version = file_etag(stat).strip('"')
+        return f"{self.disk_prefix(path)}-{version}.gz"
+
+    def open_temp(self, path):
+        """(fd, temp path) to write the gzip copy of path into before path is committed"""
+        os.makedirs(ENCODED_DIR, exist_ok=True)
+        tmp_path = temp_path(self.disk_prefix(path))
+        return os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644), tmp_path
+
+    def commit(self, durability, fd, tmp_path, path, mode=None):
+        """Publish the copy for the version of path that was just committed"""
+        for old in glob(self.disk_prefix(path) + '-*.gz'):
+            try:
+                os.remove(old)
+            except OSError:
+                pass
+        durability.commit(fd, tmp_path, self.path_for(path, os.stat(path)), mode)
+
+    def lookup(self, path, stat):
+        encoded_path = self.path_for(path, stat)
+        return encoded_path if os.path.isfile(encoded_path) else None
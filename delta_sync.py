@@ -0,0 +1,178 @@
+import os
+import json
+import math
+import uuid
+import struct
+import hashlib
+import threading
+import itertools
+import collections
+from glob import glob
+
+SIGNATURE_DIR = '.signatures'
+SIGNATURE_CACHE_SIZE = 64
+MIN_BLOCK_SIZE = 2048
+MAX_BLOCK_SIZE = 128 * 1024
+COPY_CHUNK = 1024 * 1024
+
+# Delta format: a sequence of operations
+#   b'C' first_block:u32 block_count:u32   copy blocks of the base file
+#   b'L' length:u32 data                    literal bytes
+OP_COPY = b'C'
+OP_LITERAL = b'L'
+COPY = struct.Struct('>II')
+LITERAL = struct.Struct('>I')
+
+
+def file_etag(stat):
+    return f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+
+
+def block_size_for(length):
+    """Roughly sqrt(length) as a power of two, like rsync"""
+    return min(MAX_BLOCK_SIZE, max(MIN_BLOCK_SIZE, 1 << math.isqrt(length).bit_length()))
+
+
+def weak_checksum(block):
+    """rsync rolling checksum: a = sum(x_i), b = sum((L - i) * x_i), both mod 2^16"""
+    a = sum(block) & 0xffff
+    b = sum(itertools.accumulate(block)) & 0xffff
+    return a | (b << 16)
+
+
+def strong_hash(block):
+    return hashlib.blake2b(block, digest_size=16).hexdigest()
+
+
+def file_signature(path, block_size=None):
+    length = os.path.getsize(path)
+    block_size = block_size or block_size_for(length)
+    blocks = []
+    with open(path, 'rb') as f:
+        while True:
+            block = f.read(block_size)
+            if not block:
+                break
+            blocks.append([weak_checksum(block), strong_hash(block)])
+    return {'length': length, 'block_size': block_size, 'blocks': blocks}
+
+
+class SignatureCache:
+    """Block signatures per file version (ETag), kept in an LRU and under SIGNATURE_DIR
+
+    Signatures are computed once per version; the on-disk copy lets other
+    worker processes and restarted servers reuse them.
+    """
+    def __init__(self, max_entries=SIGNATURE_CACHE_SIZE):
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.entries = collections.OrderedDict()
+
+    def disk_prefix(self, path):
+        return os.path.join(SIGNATURE_DIR, hashlib.sha1(os.path.abspath(path).encode()).hexdigest()[:16])
+
+    def get(self, path):
+        """Return (etag, signature JSON bytes) for the current version of path"""
+        etag = file_etag(os.stat(path))
+        key = (path, etag)
+        with self.lock:
+            signature = self.entries.get(key)
+            if signature is not None:
+                self.entries.move_to_end(key)
+                return etag, signature
+
+        version = etag.strip('"')
+        disk_path = f"{self.disk_prefix(path)}-{version}.json"
+        try:
+            with open(disk_path, 'rb') as f:
+                signature = f.read()
+        except FileNotFoundError:
+            data = file_signature(path)
+            signature = json.dumps({'version': etag, **data}).encode()
+            # The file may have been replaced while it was read
+            if file_etag(os.stat(path)) != etag:
+                return etag, signature
+            self.store(path, disk_path, signature)
+
+        with self.lock:
+            self.entries[key] = signature
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+        return etag, signature
+
+    def store(self, path, disk_path, signature):
+        os.makedirs(SIGNATURE_DIR, exist_ok=True)
+        for old in glob(self.disk_prefix(path) + '-*.json'):
+            try:
+                os.remove(old)
+            except FileNotFoundError:
+                pass
+        tmp_path = f"{disk_path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(signature)
+        os.replace(tmp_path, disk_path)
+
+
+def copy_range(src_fd, dst_fd, offset, length):
+    while length > 0:
+        if hasattr(os, 'copy_file_range'):
+            copied = os.copy_file_range(src_fd, dst_fd, min(length, COPY_CHUNK), offset)
+        else:
+            copied = os.write(dst_fd, os.pread(src_fd, min(length, COPY_CHUNK), offset))
+        if not copied:
+            raise ValueError('Base file shorter than expected')
+        offset += copied
+        length -= copied
+
+
+def apply_delta(base_path, delta, target_path, block_size, commit=None):
+    """Rebuild target_path from base_path plus delta, return (length, literal bytes)
+
+    The result is written to a temporary file and moved over target_path by
+    commit(fd, tmp_path, target_path), e.g. Durability.commit, or a plain
+    rename without one, so target_path may be the base file itself.
+    """
+    view = memoryview(delta)
+    tmp_path = f"{target_path}.{uuid.uuid4().hex}.delta"
+    base_fd = os.open(base_path, os.O_RDONLY)
+    out_fd = os.open(tmp_path, os.O_RDWR | os.O_CREAT | os.O_EXCL, 0o644)
+    try:
+        base_length = os.fstat(base_fd).st_size
+        position = written = literal = 0
+        while position < len(view):
+            op = view[position:position + 1]
+            position += 1
+            if op == OP_COPY:
+                first, count = COPY.unpack_from(view, position)
+                position += COPY.size
+                start = first * block_size
+                if count == 0 or start >= base_length:
+                    raise ValueError(f'Block reference {first}+{count} outside base file')
+                length = min(base_length, (first + count) * block_size) - start
+                copy_range(base_fd, out_fd, start, length)
+            elif op == OP_LITERAL:
+                (length,) = LITERAL.unpack_from(view, position)
+                position += LITERAL.size
+                if position + length > len(view):
+                    raise ValueError('Truncated literal in delta')
+                data = view[position:position + length]
+                while data:
+                    data = data[os.write(out_fd, data):]
+                position += length
+                literal += length
+            else:
+                raise ValueError(f'Unknown delta operation {bytes(op)!r}')
+            written += length
+        if commit is None:
+            os.replace(tmp_path, target_path)
+        else:
+            commit(out_fd, tmp_path, target_path)
+        return written, literal
+    except struct.error:
+        raise ValueError('Truncated delta')
+    finally:
+        os.close(base_fd)
+        if out_fd is not None:
+            os.close(out_fd)
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
@@ -0,0 +1,189 @@
+import os
+import time
+import uuid
+import threading
+
+DURABILITY_MODES = ('none', 'fdatasync', 'group')
+GROUP_COMMIT_WINDOW = 0.002
+GROUP_COMMIT_MAX_BATCH = 256
+
+
+def temp_path(filename):
+    return f"{filename}.{uuid.uuid4().hex}.part"
+
+
+def write_all(fd, data):
+    view = memoryview(data)
+    while view:
+        view = view[os.write(fd, view):]
+
+
+def sync_data(fd):
+    if hasattr(os, 'fdatasync'):
+        os.fdatasync(fd)
+    else:
+        os.fsync(fd)
+
+
+def sync_directory(path):
+    """Persist renames in path; not possible (nor needed) on every platform"""
+    try:
+        fd = os.open(path or '.', os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+class PendingCommit:
+    __slots__ = ('fd', 'tmp_path', 'final_path', 'done', 'error')
+
+    def __init__(self, fd, tmp_path, final_path):
+        self.fd = fd
+        self.tmp_path = tmp_path
+        self.final_path = final_path
+        self.done = threading.Event()
+        self.error = None
+
+
+class GroupCommitter:
+    """Background thread that makes concurrent uploads durable together
+
+    Commits arriving within window seconds of each other form one batch: the
+    files are synced, renamed, and each directory involved is synced once,
+    then every upload in the batch is acknowledged.
+    """
+    def __init__(self, window=GROUP_COMMIT_WINDOW, max_batch=GROUP_COMMIT_MAX_BATCH):
+        self.window = window
+        self.max_batch = max_batch
+        self.cond = threading.Condition()
+        self.pending = []
+        self.thread = None
+        self.batches = 0
+        self.batched = 0
+
+    def commit(self, fd, tmp_path, final_path):
+        entry = PendingCommit(fd, tmp_path, final_path)
+        with self.cond:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run, daemon=True)
+                self.thread.start()
+            self.pending.append(entry)
+            self.cond.notify()
+        entry.done.wait()
+        if entry.error is not None:
+            raise entry.error
+
+    def run(self):
+        while True:
+            with self.cond:
+                while not self.pending:
+                    self.cond.wait()
+                full = len(self.pending) >= self.max_batch
+            if not full:
+                # Give concurrent uploads the chance to join this batch
+                time.sleep(self.window)
+            with self.cond:
+                batch = self.pending[:self.max_batch]
+                del self.pending[:self.max_batch]
+                self.batches += 1
+                self.batched += len(batch)
+            self.commit_batch(batch)
+
+    def commit_batch(self, batch):
+        directories = set()
+        for entry in batch:
+            try:
+                sync_data(entry.fd)
+                os.replace(entry.tmp_path, entry.final_path)
+                directories.add(os.path.dirname(entry.final_path))
+            except OSError as e:
+                entry.error = e
+        for directory in directories:
+            sync_directory(directory)
+        for entry in batch:
+            entry.done.set()
+
+
+class Durability:
+    """How uploads reach their final name: always via a temp file and an atomic rename
+
+    none       rename only; a power loss can still lose recent uploads
+    fdatasync  sync every file and its directory before acknowledging
+    group      like fdatasync, but batched across concurrent uploads by a GroupCommitter
+    """
+    def __init__(self, mode='none', window=GROUP_COMMIT_WINDOW, max_batch=GROUP_COMMIT_MAX_BATCH):
+        if mode not in DURABILITY_MODES:
+            raise ValueError(f"Unknown durability mode {mode!r}")
+        self.mode = mode
+        self.committer = GroupCommitter(window, max_batch)
+        self.lock = threading.Lock()
+        self.commits = {name: 0 for name in DURABILITY_MODES}
+        self.commit_time = {name: 0.0 for name in DURABILITY_MODES}
+        # Called with the final path after every commit, e.g. to drop cached copies
+        self.listeners = []
+
+    def commit(self, fd, tmp_path, final_path, mode=None):
+        """Make the open temp file durable according to mode and rename it to final_path
+
+        The caller still owns fd and closes it afterwards.
+        """
+        mode = mode or self.mode
+        started = time.monotonic()
+        if mode == 'group':
+            self.committer.commit(fd, tmp_path, final_path)
+        else:
+            if mode == 'fdatasync':
+                sync_data(fd)
+            os.replace(tmp_path, final_path)
+            if mode == 'fdatasync':
+                sync_directory(os.path.dirname(final_path))
+        with self.lock:
+            self.commits[mode] += 1
+            self.commit_time[mode] += time.monotonic() - started
+        for listener in self.listeners:
+            listener(final_path)
+
+    def write_stream(self, filename, chunks, mode=None, verify=None):
+        """Write chunks to a temp file and commit it as filename, return the byte count
+
+        verify() runs after the last chunk; if it raises, nothing is committed.
+        """
+        tmp_path = temp_path(filename)
+        written = 0
+        try:
+            fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+            try:
+                for chunk in chunks:
+                    write_all(fd, chunk)
+                    written += len(chunk)
+                if verify is not None:
+                    verify()
+                self.commit(fd, tmp_path, filename, mode)
+            finally:
+                os.close(fd)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        return written
+
+    def write_file(self, filename, data, mode=None):
+        return self.write_stream(filename, [data], mode)
+
+    def stats(self):
+        with self.lock:
+            stats = {
+                'mode': self.mode,
+                'commits': dict(self.commits),
+                'avg_commit_ms': {name: round(1000 * self.commit_time[name] / count, 3)
+                                  for name, count in self.commits.items() if count},
+            }
+        committer = self.committer
+        if committer.batches:
+            stats['group_batches'] = committer.batches
+            stats['avg_group_batch'] = round(committer.batched / committer.batches, 2)
+        return stats
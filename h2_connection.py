@@ -0,0 +1,191 @@
+import asyncio
+import functools
+from http import ChunkedResponse
+
+try:
+    import h2.config
+    import h2.connection
+    import h2.events
+    import h2.exceptions
+    import h2.errors
+except ImportError:
+    h2 = None
+
+PREFACE = b'PRI * HTTP/2.0\r\n\r\nSM\r\n\r\n'
+# Connection-specific headers are not allowed in HTTP/2
+HOP_BY_HOP = {'connection', 'keep-alive', 'proxy-connection', 'transfer-encoding', 'upgrade', 'te', 'http2-settings'}
+MAX_STREAM_BODY = 64 * 1024 * 1024
+SWITCHING_PROTOCOLS = b"HTTP/1.1 101 Switching Protocols\r\nConnection: Upgrade\r\nUpgrade: h2c\r\n\r\n"
+
+
+def available():
+    return h2 is not None
+
+
+def is_upgrade(headers):
+    """True for an HTTP/1.1 request asking to switch to h2c (RFC 7540 section 3.2)"""
+    upgrade = [token.strip().lower() for token in headers.get('upgrade', '').split(',')]
+    return 'h2c' in upgrade and 'http2-settings' in headers
+
+
+def request_from_headers(headers):
+    """(method, path, headers_dict) from an HTTP/2 header list"""
+    pseudo = {}
+    headers_dict = {}
+    for name, value in headers:
+        if name.startswith(':'):
+            pseudo[name] = value
+        elif name in headers_dict:
+            # Split cookie crumbs and repeated fields fold back into one value
+            headers_dict[name] += ('; ' if name == 'cookie' else ', ') + value
+        else:
+            headers_dict[name] = value
+    if ':authority' in pseudo and 'host' not in headers_dict:
+        headers_dict['host'] = pseudo[':authority']
+    return pseudo.get(':method', 'GET').upper(), pseudo.get(':path', '/'), headers_dict
+
+
+def split_response(raw):
+    """(status, header list, body) from HTTP/1.1 response bytes built by HttpServer"""
+    header_end = raw.find(b"\r\n\r\n")
+    lines = raw[:header_end].decode('utf-8', errors='replace').split("\r\n")
+    status = lines[0].split(" ", 2)[1]
+    headers = []
+    for line in lines[1:]:
+        name, _, value = line.partition(':')
+        name = name.strip().lower()
+        if name and name not in HOP_BY_HOP:
+            headers.append((name, value.strip()))
+    return status, headers, raw[header_end + 4:]
+
+
+class H2Session:
+    """HTTP/2 on one connection of an asyncio server
+
+    Every stream becomes one HttpServer.proses_request call in the loop's
+    executor, so many requests run concurrently over a single connection.
+    h2 does the framing, HPACK and flow-control bookkeeping; response
+    bodies are sent only as far as the stream and connection windows
+    allow, waiting for WINDOW_UPDATE when they are exhausted.
+    """
+    def __init__(self, transport, httpserver):
+        self.transport = transport
+        self.httpserver = httpserver
+        self.loop = asyncio.get_running_loop()
+        config = h2.config.H2Configuration(client_side=False, header_encoding='utf-8')
+        self.conn = h2.connection.H2Connection(config=config)
+        self.streams = {}
+        self.window_waiters = {}
+        self.tasks = set()
+
+    def start(self, data=b''):
+        """Prior knowledge: data starts with the client connection preface"""
+        self.conn.initiate_connection()
+        self.flush()
+        if data:
+            self.data_received(data)
+
+    def start_upgrade(self, settings, method, path, headers_dict, body):
+        """After 101 Switching Protocols; the upgraded request becomes stream 1"""
+        self.conn.initiate_upgrade_connection(settings)
+        self.flush()
+        headers_dict = {name: value for name, value in headers_dict.items() if name not in HOP_BY_HOP}
+        self.handle(1, method, path, headers_dict, body)
+
+    def flush(self):
+        data = self.conn.data_to_send()
+        if data:
+            self.transport.write(data)
+
+    def data_received(self, data):
+        try:
+            events = self.conn.receive_data(data)
+        except h2.exceptions.ProtocolError:
+            self.flush()
+            self.transport.close()
+            return
+        for event in events:
+            if isinstance(event, h2.events.RequestReceived):
+                self.streams[event.stream_id] = (event.headers, bytearray())
+            elif isinstance(event, h2.events.DataReceived):
+                stream = self.streams.get(event.stream_id)
+                if stream is not None:
+                    stream[1].extend(event.data)
+                    if len(stream[1]) > MAX_STREAM_BODY:
+                        del self.streams[event.stream_id]
+                        self.conn.reset_stream(event.stream_id, h2.errors.ErrorCodes.REFUSED_STREAM)
+                # The body is consumed into memory: give the window back right away
+                self.conn.acknowledge_received_data(event.flow_controlled_length, event.stream_id)
+            elif isinstance(event, h2.events.StreamEnded):
+                stream = self.streams.pop(event.stream_id, None)
+                if stream is not None:
+                    method, path, headers_dict = request_from_headers(stream[0])
+                    self.handle(event.stream_id, method, path, headers_dict, bytes(stream[1]))
+            elif isinstance(event, h2.events.WindowUpdated):
+                self.wake(event.stream_id)
+            elif isinstance(event, h2.events.StreamReset):
+                self.streams.pop(event.stream_id, None)
+                self.wake(event.stream_id)
+            elif isinstance(event, h2.events.ConnectionTerminated):
+                self.flush()
+                self.transport.close()
+                return
+        self.flush()
+
+    def handle(self, stream_id, method, path, headers_dict, body):
+        task = self.loop.create_task(self.respond(stream_id, method, path, headers_dict, body))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    async def respond(self, stream_id, method, path, headers_dict, body):
+        raw = await self.loop.run_in_executor(None, functools.partial(
+            self.httpserver.proses_request, method, path, headers_dict, body, stream=True))
+        if isinstance(raw, ChunkedResponse):
+            # Each chunk of a streamed response becomes DATA frames; no chunk framing in HTTP/2
+            status, headers, _ = split_response(raw.head)
+            chunks = iter(raw.chunks)
+        else:
+            status, headers, content = split_response(raw)
+            chunks = iter([content]) if content else None
+        try:
+            self.conn.send_headers(stream_id, [(':status', status)] + headers, end_stream=chunks is None)
+            self.flush()
+            if chunks is not None:
+                while True:
+                    # Streamed chunks may read files, so they are produced in the executor too
+                    chunk = await self.loop.run_in_executor(None, next, chunks, None)
+                    if chunk is None:
+                        break
+                    await self.send_data(stream_id, chunk)
+                self.conn.end_stream(stream_id)
+                self.flush()
+        except (h2.exceptions.StreamClosedError, h2.exceptions.ProtocolError):
+            # The client reset the stream or went away meanwhile
+            pass
+        finally:
+            if hasattr(chunks, 'close'):
+                chunks.close()
+
+    async def send_data(self, stream_id, content):
+        view = memoryview(content)
+        while view:
+            window = min(self.conn.local_flow_control_window(stream_id), self.conn.max_outbound_frame_size)
+            if window <= 0:
+                waiter = self.window_waiters[stream_id] = self.loop.create_future()
+                await waiter
+                continue
+            self.conn.send_data(stream_id, view[:window].tobytes())
+            view = view[window:]
+            self.flush()
+
+    def wake(self, stream_id):
+        # WINDOW_UPDATE on stream 0 widens the connection window for every stream
+        stream_ids = list(self.window_waiters) if stream_id == 0 else [stream_id]
+        for waiting_id in stream_ids:
+            waiter = self.window_waiters.pop(waiting_id, None)
+            if waiter is not None and not waiter.done():
+                waiter.set_result(None)
+
+    def connection_lost(self):
+        for task in list(self.tasks):
+            task.cancel()
@@ -5,10 +5,59 @@ from glob import glob
 from datetime import datetime
 import os
 import re
+import time
+import io
+import mmap
+import json
+import tarfile
+import batch
+from upload_session import UploadSessions
+from http_connection import release_request
+from delta_sync import SignatureCache, apply_delta, file_etag
+from durability import Durability, DURABILITY_MODES, temp_path, write_all
+from checksum import ChecksumVerifier, ChecksumStore, ChecksumMismatch, digest_headers
+from content_coding import (DecodingReader, DecompressionBomb, UnsupportedEncoding, EncodedStore,
+                            content_coding, decode_body, accepts_gzip, MAX_RATIO, MAX_OUTPUT)
+
+HEADER_END = re.compile(rb'\r\n\r\n')
+
+
+class ChunkedResponse:
+    """Streamed response: iterating yields the head, then each chunk in chunked transfer coding
+
+    HTTP/2 has its own framing, so it reads head and the raw chunks instead.
+    """
+    def __init__(self, head, chunks):
+        self.head = head
+        self.chunks = chunks
+
+    def __iter__(self):
+        yield self.head
+        for chunk in self.chunks:
+            if chunk:
+                yield f"{len(chunk):x}\r\n".encode() + chunk + b"\r\n"
+        yield b"0\r\n\r\n"
+
 
 class HttpServer:
-    def __init__(self):
+    def __init__(self, durability='none', checksum=None):
         self.sessions = {}
+        self.durability = Durability(durability)
+        # Algorithm stored for every upload so GET can return it; None stores
+        # only what clients announce
+        self.checksum_algorithm = checksum
+        self.checksums = ChecksumStore()
+        # Limits for bodies sent with Content-Encoding, against decompression bombs
+        self.max_decoded_ratio = MAX_RATIO
+        self.max_decoded_size = MAX_OUTPUT
+        # Keep streamed gzip uploads as received too, for clients accepting gzip
+        self.store_compressed = False
+        self.encoded = EncodedStore()
+        # Optional static_cache.SharedStaticCache shared by all worker processes
+        self.static_cache = None
+        self.durability.listeners.append(self.invalidate_cached)
+        self.uploads = UploadSessions(self.sessions)
+        self.signatures = SignatureCache()
         self.types = {
             '.pdf': 'application/pdf',
             '.jpg': 'image/jpeg',
@@ -20,70 +69,105 @@ class HttpServer:
         }
         
     def response(self, kode=404, message='Not Found', messagebody=bytes(), headers={}):
+        response_headers = self.response_head(kode, message, {'Content-Length': len(messagebody), **headers})
+        
+        if not isinstance(messagebody, bytes):
+            messagebody = messagebody.encode()
+            
+        return response_headers + messagebody
+
+    def response_head(self, kode, message, headers):
         tanggal = datetime.now().strftime('%c')
         resp = [
             f"HTTP/1.1 {kode} {message}\r\n",
             f"Date: {tanggal}\r\n",
             "Connection: close\r\n",
-            "Server: myserver/1.0\r\n",
-            f"Content-Length: {len(messagebody)}\r\n"
+            "Server: myserver/1.0\r\n"
         ]
         
         for kk, vv in headers.items():
             resp.append(f"{kk}: {vv}\r\n")
         
         resp.append("\r\n")
-        response_headers = "".join(resp)
-        
-        if not isinstance(messagebody, bytes):
-            messagebody = messagebody.encode()
-            
-        return response_headers.encode() + messagebody
+        return "".join(resp).encode()
+
+    def chunked_response(self, kode, message, chunks, headers={}):
+        return ChunkedResponse(self.response_head(kode, message, {'Transfer-Encoding': 'chunked', **headers}), chunks)
+
+    def keep_alive_stream(self, chunks):
+        chunks = iter(chunks)
+        yield self.keep_alive(next(chunks))
+        yield from chunks
+
+    def keep_alive(self, response):
+        """Switch a built response from Connection: close to keep-alive"""
+        header_end = response.find(b"\r\n\r\n")
+        head = response[:header_end].replace(b"Connection: close\r\n", b"Connection: keep-alive\r\n", 1)
+        return head + response[header_end:]
 
     def parse_multipart_form_data(self, body, boundary):
-        """Parse multipart form data to extract file content and filename"""
+        """Parse multipart form data to extract file content and filename
+
+        body may be bytes or a memoryview of a spooled request. re searches
+        the buffer in place and the content comes back as a memoryview slice
+        of body, so a spilled upload is never copied into memory.
+        """
         try:
             boundary = boundary.encode() if isinstance(boundary, str) else boundary
-            parts = body.split(b'--' + boundary)
-            
-            for part in parts:
-                if b'Content-Disposition' in part and b'filename=' in part:
-                    # Extract filename
-                    filename_match = re.search(rb'filename="([^"]*)"', part)
-                    if not filename_match:
-                        continue
-                    
-                    filename = filename_match.group(1).decode('utf-8')
-                    filename = os.path.basename(filename)  # Security: prevent path traversal
-                    
-                    # Find file content (after double CRLF)
-                    content_start = part.find(b'\r\n\r\n')
-                    if content_start == -1:
-                        continue
-                    
-                    content = part[content_start + 4:]
-                    # Remove trailing CRLF if present
-                    if content.endswith(b'\r\n'):
-                        content = content[:-2]
-                    
-                    return filename, content
+            view = memoryview(body)
+            delimiter = b'--' + boundary
+            positions = [match.start() for match in re.finditer(re.escape(delimiter), view)]
             
-            return None, None
+            for start, end in zip(positions, positions[1:]):
+                part_start = start + len(delimiter)
+                # Find file content (after double CRLF)
+                header_match = HEADER_END.search(view, part_start, end)
+                if not header_match:
+                    continue
+                part_head = view[part_start:header_match.start()].tobytes()
+                if b'Content-Disposition' not in part_head or b'filename=' not in part_head:
+                    continue
+                
+                # Extract filename
+                filename_match = re.search(rb'filename="([^"]*)"', part_head)
+                if not filename_match:
+                    continue
+                filename = filename_match.group(1).decode('utf-8')
+                filename = os.path.basename(filename)  # Security: prevent path traversal
+                
+                content_start = header_match.end()
+                # Remove the CRLF in front of the next delimiter
+                if end - content_start >= 2 and view[end - 2:end] == b'\r\n':
+                    end -= 2
+                content = view[content_start:end]
+                
+                part_headers = {}
+                for line in part_head.decode('utf-8', errors='replace').split('\r\n'):
+                    if ':' in line:
+                        key, value = line.split(':', 1)
+                        part_headers[key.strip().lower()] = value.strip()
+                return filename, content, part_headers
+            
+            return None, None, {}
         except Exception as e:
             print(f"Error parsing multipart data: {e}")
-            return None, None
+            return None, None, {}
 
     def proses(self, data):
         try:
             # Handle binary data
-            if isinstance(data, bytes):
+            if isinstance(data, (bytes, bytearray, mmap.mmap)):
                 # Split headers and body
                 header_end = data.find(b"\r\n\r\n")
                 if header_end < 0:
                     return self.response(400, 'Bad Request', 'Invalid request format')
                 
                 headers_part = data[:header_end]
-                body = data[header_end+4:]
+                if isinstance(data, mmap.mmap):
+                    # Spooled request: hand the body on without copying it into memory
+                    body = memoryview(data)[header_end+4:]
+                else:
+                    body = data[header_end+4:]
                 
                 try:
                     # Parse request line and headers
@@ -103,19 +187,15 @@ class HttpServer:
                             key, value = header.split(':', 1)
                             headers_dict[key.strip().lower()] = value.strip()
                     
-                    print(f"Processing {method} {path}")
-                    
-                    if method == 'POST' and path == '/upload':
-                        return self.http_post(body, headers_dict)
-                    elif method == 'GET':
-                        return self.http_get(path, headers_dict)
-                    elif method == 'DELETE':
-                        return self.http_delete(path, headers_dict)
-                    else:
-                        return self.response(405, 'Method Not Allowed', 'Method not supported')
-                        
                 except (IndexError, ValueError, UnicodeDecodeError) as e:
                     return self.response(400, 'Bad Request', f'Malformed request: {str(e)}')
+                
+                result = self.proses_request(method, path, headers_dict, body)
+                
+                # Keep-alive is opt-in so clients that read until EOF keep working
+                if headers_dict.get('connection', '').lower() == 'keep-alive':
+                    result = self.keep_alive(result)
+                return result
             
             return self.response(400, 'Bad Request', 'Expected binary data')
             
@@ -123,6 +203,127 @@ class HttpServer:
             print(f"Error processing request: {e}")
             return self.response(500, 'Internal Server Error', str(e))
 
+    def proses_request(self, method, path, headers_dict, body, stream=False):
+        """Handle a request that is already parsed, e.g. one HTTP/2 stream
+
+        headers_dict has lowercase names; returns HTTP/1.1 response bytes
+        with Connection: close, or with stream set possibly a ChunkedResponse.
+        """
+        try:
+            print(f"Processing {method} {path}")
+            
+            # Handlers only ever see the decoded body
+            coding = content_coding(headers_dict)
+            if coding and len(body):
+                decoded = decode_body(body, coding, self.max_decoded_ratio, self.max_decoded_size)
+                # Large output is spooled to a file rather than kept on the heap
+                body = memoryview(decoded) if isinstance(decoded, mmap.mmap) else decoded
+            else:
+                decoded = None
+            
+            try:
+                if path == '/uploads' or path.startswith('/uploads/'):
+                    result = self.http_upload_session(method, path, body, headers_dict)
+                elif path.startswith('/batch/'):
+                    # A spooled body is read in place; mmap is file-like
+                    reader = decoded if isinstance(decoded, mmap.mmap) else io.BytesIO(body)
+                    result = self.http_batch(method, path, headers_dict, reader)
+                    if not isinstance(result, bytes) and not stream:
+                        result = b"".join(result)
+                elif path.startswith('/signatures/') or path.startswith('/delta/'):
+                    result = self.http_delta(method, path, body, headers_dict)
+                elif method == 'POST' and path == '/upload':
+                    result = self.http_post(body, headers_dict)
+                elif method == 'GET':
+                    result = self.http_get(path, headers_dict)
+                elif method == 'DELETE':
+                    result = self.http_delete(path, headers_dict)
+                else:
+                    result = self.response(405, 'Method Not Allowed', 'Method not supported')
+            finally:
+                if decoded is not None and body is not decoded:
+                    body.release()
+                release_request(decoded)
+            return result
+        
+        except UnsupportedEncoding as e:
+            return self.response(415, 'Unsupported Media Type', str(e))
+        except DecompressionBomb as e:
+            return self.response(413, 'Payload Too Large', str(e))
+        except (IndexError, ValueError, UnicodeDecodeError) as e:
+            return self.response(400, 'Bad Request', f'Malformed request: {str(e)}')
+        except Exception as e:
+            print(f"Error processing request: {e}")
+            return self.response(500, 'Internal Server Error', str(e))
+
+    def streams(self, head):
+        """True for requests whose body proses_stream consumes straight from the connection"""
+        if head.method != 'POST':
+            return False
+        if head.path.startswith('/batch/'):
+            return True
+        # Uploads go from the socket to the file without being buffered in memory
+        return head.path == '/upload'
+
+
+    def proses_stream(self, head, reader):
+        """Like proses for a RequestHead whose body is read incrementally from reader
+
+        May return an iterator of chunks (head first) instead of bytes.
+        """
+        print(f"Processing {head.method} {head.path} (streamed)")
+        try:
+            coding = content_coding(head.headers)
+        except UnsupportedEncoding as e:
+            result = self.response(415, 'Unsupported Media Type', str(e))
+        else:
+            body = reader
+            if coding:
+                body = DecodingReader(reader, coding, self.max_decoded_ratio, self.max_decoded_size)
+            if head.path == '/upload':
+                result = self.http_post_stream(head.headers, body)
+            else:
+                result = self.http_batch(head.method, head.path, head.headers, body)
+        reader.drain()
+        if head.keep_alive:
+            result = self.keep_alive(result) if isinstance(result, bytes) else self.keep_alive_stream(result)
+        return result
+
+    def http_batch(self, method, path, headers_dict, reader):
+        """Many files per request, each item with its own status
+
+        POST /batch/upload  multipart/form-data or (optionally compressed) tar stream
+        POST /batch/delete  one path per line
+        POST /batch/fetch   one path per line; answered with a streamed tar whose
+                            last member, .batch-status.json, holds the statuses
+        """
+        if method != 'POST':
+            return self.response(405, 'Method Not Allowed', 'Method not supported')
+        try:
+            if path == '/batch/upload':
+                mode = self.durability_mode(headers_dict)
+                save = lambda name, chunks: self.durability.write_stream(self.safe_filename(name), chunks, mode)
+                content_type = headers_dict.get('content-type', '')
+                boundary_match = re.search(r'boundary="?([^";]+)"?', content_type)
+                if 'multipart/form-data' in content_type:
+                    if not boundary_match:
+                        return self.response(400, 'Bad Request', 'No boundary found in multipart data')
+                    results = batch.upload_multipart(reader, boundary_match.group(1).encode(), save)
+                else:
+                    results = batch.upload_tar(reader, save)
+            elif path == '/batch/delete':
+                results = batch.delete_files(reader)
+            elif path == '/batch/fetch':
+                names = list(batch.read_lines(reader))
+                return self.chunked_response(200, 'OK', batch.fetch_archive(names), {'Content-Type': 'application/x-tar'})
+            else:
+                return self.response(404, 'Not Found', f'Unknown batch operation {path}')
+        except DecompressionBomb as e:
+            return self.response(413, 'Payload Too Large', str(e))
+        except (ValueError, tarfile.TarError) as e:
+            return self.response(400, 'Bad Request', f'Invalid batch: {str(e)}')
+        return self.response(200, 'OK', batch.summary(results), {'Content-Type': 'application/json'})
+
     def http_post(self, body, headers_dict):
         """Handle file upload"""
         try:
@@ -135,43 +336,273 @@ class HttpServer:
                     return self.response(400, 'Bad Request', 'No boundary found in multipart data')
                 
                 boundary = boundary_match.group(1)
-                filename, file_content = self.parse_multipart_form_data(body, boundary)
+                filename, file_content, part_headers = self.parse_multipart_form_data(body, boundary)
                 
                 if not filename or file_content is None:
                     return self.response(400, 'Bad Request', 'No valid file found in upload')
                 
             else:
                 # Simple binary upload
-                filename = headers_dict.get('x-filename') # Try x-filename first
-                if not filename:
-                    # If not found, try to parse Content-Disposition as a backup
-                    content_disposition = headers_dict.get('content-disposition', '')
-                    match = re.search(r'filename="([^"]*)"', content_disposition)
-                    if match:
-                        filename = match.group(1)
-                
-                if not filename: # If still no filename, use the final fallback
-                    filename = 'uploaded_file'
-                    
+                filename = self.raw_upload_filename(headers_dict)
                 file_content = body
+                part_headers = headers_dict
             
             # Save file
             if not filename:
                 return self.response(400, 'Bad Request', 'No filename specified')
             
-            # Security: sanitize filename
-            filename = os.path.basename(filename)
-            if not filename or filename.startswith('.'):
-                filename = f"upload_{int(datetime.now().timestamp())}"
+            filename = self.safe_filename(filename)
+            
+            # The body is already in memory: verify before anything touches the disk
+            verifier = self.checksum_verifier(headers_dict, part_headers)
+            verifier.update(file_content)
+            verifier.verify()
             
-            with open(filename, 'wb') as f:
-                f.write(file_content)
+            self.durability.write_file(filename, file_content, self.durability_mode(headers_dict))
+            self.store_checksums(filename, verifier)
             
             return self.response(201, 'Created', f'File {filename} uploaded successfully ({len(file_content)} bytes)')
             
+        except ValueError as e:
+            return self.response(400, 'Bad Request', f'Upload rejected: {str(e)}')
         except Exception as e:
             return self.response(500, 'Internal Server Error', f'Upload failed: {str(e)}')
 
+    def http_post_stream(self, headers_dict, reader):
+        """Upload written from the connection straight into the file"""
+        content_type = headers_dict.get('content-type', '')
+        if 'multipart/form-data' in content_type:
+            boundary_match = re.search(r'boundary="?([^";]+)"?', content_type)
+            if not boundary_match:
+                return self.response(400, 'Bad Request', 'No boundary found in multipart data')
+            try:
+                for part_headers, data in batch.MultipartStream(reader, boundary_match.group(1).encode()).parts():
+                    filename = batch.part_filename(part_headers)
+                    if filename:
+                        filename = self.safe_filename(filename)
+                        verifier = self.checksum_verifier(headers_dict, part_headers)
+                        written = self.durability.write_stream(filename, verifier.wrap(data), self.durability_mode(headers_dict),
+                                                               verify=verifier.verify)
+                        self.store_checksums(filename, verifier)
+                        return self.response(201, 'Created', f'File {filename} uploaded successfully ({written} bytes)')
+            except ChecksumMismatch as e:
+                return self.response(400, 'Bad Request', f'Upload rejected: {str(e)}')
+            except DecompressionBomb as e:
+                return self.response(413, 'Payload Too Large', str(e))
+            except ValueError as e:
+                return self.response(400, 'Bad Request', f'Malformed multipart data: {str(e)}')
+            except (ConnectionError, TimeoutError):
+                raise
+            except OSError as e:
+                return self.response(500, 'Internal Server Error', f'Upload failed: {str(e)}')
+            return self.response(400, 'Bad Request', 'No valid file found in upload')
+
+        if isinstance(reader, DecodingReader):
+            return self.http_post_decoded(headers_dict, reader)
+
+        filename = self.safe_filename(self.raw_upload_filename(headers_dict))
+        tmp_path = temp_path(filename)
+        try:
+            verifier = self.checksum_verifier(headers_dict, headers_dict)
+            fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+            try:
+                if reader.remaining > 0 and hasattr(os, 'posix_fallocate'):
+                    os.posix_fallocate(fd, 0, reader.remaining + len(reader.buffer))
+                # Hashing needs the bytes in user space, so it disables splice
+                written = reader.copy_to(fd, verifier.update if verifier.active else None)
+                verifier.verify()
+                self.durability.commit(fd, tmp_path, filename, self.durability_mode(headers_dict))
+            finally:
+                os.close(fd)
+            self.store_checksums(filename, verifier)
+            return self.response(201, 'Created', f'File {filename} uploaded successfully ({written} bytes)')
+        except ValueError as e:
+            return self.response(400, 'Bad Request', f'Upload rejected: {str(e)}')
+        except (ConnectionError, TimeoutError):
+            raise
+        except OSError as e:
+            return self.response(500, 'Internal Server Error', f'Upload failed: {str(e)}')
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def http_post_decoded(self, headers_dict, reader):
+        """Raw upload with Content-Encoding, decompressed into the file as it arrives
+
+        The decoded size is unknown up front and every byte passes through
+        zlib, so there is no preallocation or splice here. With
+        store_compressed, a gzip body is also kept as received.
+        """
+        filename = self.safe_filename(self.raw_upload_filename(headers_dict))
+        mode = self.durability_mode(headers_dict)
+        encoded_fd = None
+        try:
+            if self.store_compressed and reader.coding == 'gzip':
+                encoded_fd, encoded_tmp = self.encoded.open_temp(filename)
+                reader.raw_observer = lambda data: write_all(encoded_fd, data)
+            verifier = self.checksum_verifier(headers_dict, headers_dict)
+            written = self.durability.write_stream(filename, verifier.wrap(batch.file_chunks(reader)), mode,
+                                                   verify=verifier.verify)
+            self.store_checksums(filename, verifier)
+            if encoded_fd is not None:
+                self.encoded.commit(self.durability, encoded_fd, encoded_tmp, filename, mode)
+            return self.response(201, 'Created',
+                                 f'File {filename} uploaded successfully ({written} bytes, {reader.compressed} compressed)')
+        except DecompressionBomb as e:
+            return self.response(413, 'Payload Too Large', str(e))
+        except ValueError as e:
+            return self.response(400, 'Bad Request', f'Upload rejected: {str(e)}')
+        except (ConnectionError, TimeoutError):
+            raise
+        except OSError as e:
+            return self.response(500, 'Internal Server Error', f'Upload failed: {str(e)}')
+        finally:
+            if encoded_fd is not None:
+                os.close(encoded_fd)
+                if os.path.exists(encoded_tmp):
+                    os.remove(encoded_tmp)
+
+    def checksum_verifier(self, headers_dict, file_headers):
+        """Verifier for one uploaded file
+
+        Digest, Content-Digest and Content-MD5 describe the file only in
+        file_headers (the request for raw uploads, the part for multipart);
+        X-Checksum on the request always means the file.
+        """
+        announced = dict(file_headers)
+        if 'x-checksum' in headers_dict:
+            announced['x-checksum'] = headers_dict['x-checksum']
+        return ChecksumVerifier(announced, self.checksum_algorithm)
+
+    def store_checksums(self, filename, verifier):
+        if verifier.active:
+            self.checksums.save(filename, verifier.hexdigests())
+
+    def raw_upload_filename(self, headers_dict):
+        filename = headers_dict.get('x-filename') # Try x-filename first
+        if not filename:
+            # If not found, try to parse Content-Disposition as a backup
+            content_disposition = headers_dict.get('content-disposition', '')
+            match = re.search(r'filename="([^"]*)"', content_disposition)
+            if match:
+                filename = match.group(1)
+        
+        if not filename: # If still no filename, use the final fallback
+            filename = 'uploaded_file'
+        return filename
+
+    def durability_mode(self, headers_dict):
+        """X-Durability lets a client (e.g. the stress test) pick a mode per upload"""
+        mode = headers_dict.get('x-durability', '').lower()
+        return mode if mode in DURABILITY_MODES else None
+
+    def safe_filename(self, filename):
+        # Security: sanitize filename
+        filename = os.path.basename(filename or '')
+        if not filename or filename.startswith('.'):
+            filename = f"upload_{int(datetime.now().timestamp())}"
+        return filename
+
+    def http_upload_session(self, method, path, body, headers_dict):
+        """Resumable uploads
+
+        POST   /uploads              create (X-Filename, Upload-Length)
+        PATCH  /uploads/<id>         write body at Upload-Offset (any order, in parallel)
+        PUT    /uploads/<id>         write body at the Content-Range offset
+        GET    /uploads/<id>         received and missing ranges
+        POST   /uploads/<id>/commit  move the completed file into place (X-Durability,
+                                     X-Checksum or Digest of the whole file apply here)
+        DELETE /uploads/<id>         abort
+        """
+        parts = path.strip('/').split('/')
+        try:
+            if method == 'POST' and len(parts) == 1:
+                length = int(headers_dict.get('upload-length', ''))
+                if length < 0:
+                    raise ValueError('negative length')
+                session = self.uploads.create(self.safe_filename(headers_dict.get('x-filename')), length)
+                return self.response(201, 'Created', json.dumps(session.to_dict()),
+                                     {'Content-Type': 'application/json', 'Location': f'/uploads/{session.session_id}'})
+        except ValueError:
+            return self.response(400, 'Bad Request', 'Upload-Length header required')
+
+        session = self.uploads.get(parts[1]) if len(parts) > 1 else None
+        if session is None:
+            return self.response(404, 'Not Found', 'Unknown upload session')
+
+        try:
+            if method in ('PATCH', 'PUT') and len(parts) == 2:
+                if method == 'PATCH':
+                    offset = int(headers_dict.get('upload-offset', ''))
+                else:
+                    match = re.fullmatch(r'bytes (\d+)-(\d+)/(\d+|\*)', headers_dict.get('content-range', '').strip())
+                    if not match or int(match.group(2)) - int(match.group(1)) + 1 != len(body):
+                        return self.response(400, 'Bad Request', 'Content-Range does not match body')
+                    offset = int(match.group(1))
+                session.write_chunk(offset, body)
+            elif method == 'POST' and len(parts) == 3 and parts[2] == 'commit':
+                filename = session.filename
+                verifier = self.checksum_verifier(headers_dict, headers_dict)
+                if not session.commit(filename, self.durability, self.durability_mode(headers_dict), verifier):
+                    return self.response(409, 'Conflict', json.dumps(session.to_dict()), {'Content-Type': 'application/json'})
+                self.uploads.discard(session, keep_data=True)
+                self.store_checksums(filename, verifier)
+                return self.response(201, 'Created', f'File {filename} uploaded successfully ({session.length} bytes)')
+            elif method == 'DELETE' and len(parts) == 2:
+                self.uploads.discard(session)
+                return self.response(200, 'OK', 'Upload session deleted')
+            elif method != 'GET' or len(parts) != 2:
+                return self.response(405, 'Method Not Allowed', 'Method not supported')
+        except ValueError as e:
+            return self.response(400, 'Bad Request', str(e))
+
+        return self.response(200, 'OK', json.dumps(session.to_dict()), {'Content-Type': 'application/json'})
+
+    def http_delta(self, method, path, body, headers_dict):
+        """rsync-style delta uploads
+
+        GET  /signatures/<file>  block signatures of the stored file (cached per ETag)
+        POST /delta/<file>       rebuild from <file> plus the delta body; If-Match
+                                 must carry the ETag the signatures were made from,
+                                 X-Filename optionally names a different target
+        """
+        kind, _, filepath = path[1:].partition('/')
+        if not filepath or filepath.startswith('.') or not os.path.isfile(filepath):
+            return self.response(404, 'Not Found', f'File {filepath} not found')
+
+        try:
+            if method == 'GET' and kind == 'signatures':
+                etag, signature = self.signatures.get(filepath)
+                return self.response(200, 'OK', signature, {'Content-Type': 'application/json', 'ETag': etag})
+            if method != 'POST' or kind != 'delta':
+                return self.response(405, 'Method Not Allowed', 'Method not supported')
+
+            etag, signature = self.signatures.get(filepath)
+            if headers_dict.get('if-match') != etag:
+                return self.response(412, 'Precondition Failed', f'File {filepath} changed, fetch new signatures',
+                                     {'ETag': etag})
+            block_size = json.loads(signature)['block_size']
+            filename = self.safe_filename(headers_dict.get('x-filename') or filepath)
+            # X-Checksum describes the rebuilt file; Digest headers would describe the delta
+            verifier = self.checksum_verifier(headers_dict, {})
+            mode = self.durability_mode(headers_dict)
+
+            def commit(fd, tmp_path, final_path):
+                if verifier.active:
+                    verifier.update_file(fd)
+                    verifier.verify()
+                self.durability.commit(fd, tmp_path, final_path, mode)
+
+            length, literal = apply_delta(filepath, body, filename, block_size, commit)
+            self.store_checksums(filename, verifier)
+            return self.response(201, 'Created',
+                                 f'File {filename} uploaded successfully ({length} bytes, {literal} sent as literal data)',
+                                 {'ETag': file_etag(os.stat(filename))})
+        except ValueError as e:
+            return self.response(400, 'Bad Request', f'Invalid delta: {str(e)}')
+        except Exception as e:
+            return self.response(500, 'Internal Server Error', str(e))
+
     def http_get(self, object_address, headers_dict):
         if object_address == '/':
             return self.response(200, 'OK', 'HTTP Server Test - Upload files to /upload')
@@ -193,16 +624,98 @@ class HttpServer:
             return self.response(404, 'Not Found', f'File {filepath} not found')
         
         try:
-            with open(filepath, 'rb') as f:
-                content = f.read()
+            # Validators let caches revalidate instead of refetching the body
+            stat = os.stat(filepath)
+            validators = {
+                'ETag': file_etag(stat),
+                'Last-Modified': time.strftime('%a, %d %b %Y %H:%M:%S GMT', time.gmtime(stat.st_mtime))
+            }
+            # A gzip copy kept from the upload is a second representation of the file
+            encoded_path = self.encoded.lookup(filepath, stat)
+            if encoded_path:
+                validators['Vary'] = 'Accept-Encoding'
+                if accepts_gzip(headers_dict) and not headers_dict.get('range'):
+                    validators['ETag'] = validators['ETag'][:-1] + '-gzip"'
+                else:
+                    encoded_path = None
+            if_none_match = headers_dict.get('if-none-match')
+            if if_none_match and validators['ETag'] in [tag.strip() for tag in if_none_match.split(',')]:
+                return self.response(304, 'Not Modified', '', validators)
             
             ext = os.path.splitext(filepath)[1].lower()
             content_type = self.types.get(ext, 'application/octet-stream')
             
-            return self.response(200, 'OK', content, {'Content-Type': content_type})
+            if encoded_path:
+                with open(encoded_path, 'rb') as f:
+                    content = f.read()
+                return self.response(200, 'OK', content, {'Content-Type': content_type, 'Content-Encoding': 'gzip', **validators})
+            
+            range_header = headers_dict.get('range')
+            if range_header:
+                byte_range = self.parse_range(range_header, stat.st_size)
+                if byte_range is False:
+                    return self.response(416, 'Range Not Satisfiable', '', {'Content-Range': f'bytes */{stat.st_size}'})
+                if byte_range is not None:
+                    start, end = byte_range
+                    if self.static_cache is not None and stat.st_size <= self.static_cache.max_object_size:
+                        content = self.read_file(filepath, stat)[start:end + 1]
+                    else:
+                        with open(filepath, 'rb') as f:
+                            f.seek(start)
+                            content = f.read(end - start + 1)
+                    return self.response(206, 'Partial Content', content, {
+                        'Content-Type': content_type,
+                        'Content-Range': f'bytes {start}-{end}/{stat.st_size}',
+                        'Accept-Ranges': 'bytes',
+                        **validators
+                    })
+            
+            content = self.read_file(filepath, stat)
+            
+            checksums = digest_headers(self.checksums.load(filepath, stat))
+            return self.response(200, 'OK', content, {'Content-Type': content_type, 'Accept-Ranges': 'bytes', **validators, **checksums})
         except Exception as e:
             return self.response(500, 'Internal Server Error', str(e))
 
+    def read_file(self, filepath, stat):
+        """Contents of filepath at the version in stat, through the shared static cache if any"""
+        cache = self.static_cache
+        if cache is not None:
+            content = cache.get(filepath, stat)
+            if content is not None:
+                return content
+        with open(filepath, 'rb') as f:
+            content = f.read()
+        if cache is not None:
+            cache.put(filepath, stat, content)
+        return content
+
+    def invalidate_cached(self, filepath):
+        if self.static_cache is not None:
+            self.static_cache.invalidate(filepath)
+
+    def parse_range(self, range_header, size):
+        """Parse a single 'bytes=' range into (start, end) inclusive
+
+        Returns None when the header should be ignored (malformed or multiple
+        ranges, so the whole file is sent) and False when it is unsatisfiable.
+        """
+        match = re.fullmatch(r'\s*bytes\s*=\s*(\d*)\s*-\s*(\d*)\s*', range_header)
+        if not match or match.group(1) == match.group(2) == '':
+            return None
+        first, last = match.group(1), match.group(2)
+        if first == '':
+            # Suffix range: the last N bytes
+            length = int(last)
+            if length == 0 or size == 0:
+                return False
+            return max(0, size - length), size - 1
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+        if start >= size or end < start:
+            return False
+        return start, end
+
     def http_delete(self, object_address, headers_dict):
         filepath = object_address[1:]  # Remove leading slash
         if not filepath or not os.path.exists(filepath):
@@ -210,6 +723,7 @@ class HttpServer:
         
         try:
             os.remove(filepath)
+            self.invalidate_cached(filepath)
             return self.response(200, 'OK', f'File {filepath} deleted successfully')
         except Exception as e:
             return self.response(500, 'Internal Server Error', str(e))
\ No newline at end of file
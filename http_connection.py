@@ -0,0 +1,401 @@
+import os
+import sys
+import socket
+import select
+import mmap
+import tempfile
+from rate_limit import too_many_requests
+from memory_budget import BudgetExceeded, service_unavailable
+
+RECV_BUFSIZE = 1024 * 1024
+MAX_HEADER_SIZE = 64 * 1024
+SOCKET_TIMEOUT = 240.0
+KEEPALIVE_TIMEOUT = 15.0
+SPLICE_PIPE_SIZE = 1024 * 1024
+SPOOL_MEMORY = 1024 * 1024
+USE_SPLICE = hasattr(os, 'splice') and sys.platform.startswith('linux')
+
+
+class HeaderTooLarge(ValueError):
+    """The head did not end within MAX_HEADER_SIZE bytes"""
+
+
+def header_too_large():
+    message = 'Request header fields too large'
+    return (
+        f"HTTP/1.1 431 Request Header Fields Too Large\r\n"
+        f"Connection: close\r\n"
+        f"Content-Type: text/plain\r\n"
+        f"Content-Length: {len(message)}\r\n\r\n{message}"
+    ).encode()
+
+
+def parse_headers(lines):
+    headers = {}
+    for line in lines:
+        if ':' in line:
+            key, value = line.split(':', 1)
+            headers[key.strip().lower()] = value.strip()
+    return headers
+
+
+class RequestHead:
+    """Request line and headers of an incoming request"""
+    def __init__(self, raw):
+        self.raw = raw
+        lines = raw[:-4].decode('utf-8', errors='replace').split("\r\n")
+        request_line = lines[0].split(" ")
+        self.method = request_line[0].upper()
+        self.path = request_line[1] if len(request_line) > 1 else ''
+        self.version = request_line[2] if len(request_line) > 2 else ''
+        self.headers = parse_headers(lines[1:])
+
+        try:
+            self.content_length = max(0, int(self.headers.get('content-length', 0)))
+        except ValueError:
+            self.content_length = 0
+
+    @property
+    def keep_alive(self):
+        return self.headers.get('connection', '').lower() == 'keep-alive'
+
+
+class ResponseHead:
+    """Status line and headers of a response read from an upstream server"""
+    def __init__(self, raw):
+        self.raw = raw
+        lines = raw[:-4].decode('utf-8', errors='replace').split("\r\n")
+        status_line = lines[0].split(" ", 2)
+        self.version = status_line[0]
+        self.status = int(status_line[1]) if len(status_line) > 1 and status_line[1].isdigit() else 0
+        self.reason = status_line[2] if len(status_line) > 2 else ''
+        self.headers = parse_headers(lines[1:])
+
+        # A chunked body ends with its zero-size chunk, whatever Content-Length says
+        self.chunked = 'chunked' in self.headers.get('transfer-encoding', '').lower()
+
+        # None means the body is chunked or delimited by the server closing the connection
+        try:
+            self.content_length = None if self.chunked else max(0, int(self.headers['content-length']))
+        except (KeyError, ValueError):
+            self.content_length = None
+
+    @property
+    def keep_alive(self):
+        return ((self.content_length is not None or self.chunked)
+                and self.headers.get('connection', '').lower() == 'keep-alive')
+
+
+def read_head(connection, data=b"", head_class=RequestHead):
+    """Receive until the end of the headers, return (head, body bytes already read)
+
+    data holds bytes already received on the connection. Returns (None, b"")
+    when the peer closes before sending anything, e.g. an idle keep-alive
+    connection.
+    """
+    data = bytearray(data)
+    while True:
+        header_end = data.find(b"\r\n\r\n")
+        if header_end >= 0:
+            break
+        if len(data) > MAX_HEADER_SIZE:
+            raise HeaderTooLarge("Request headers too large")
+        chunk = connection.recv(RECV_BUFSIZE)
+        if not chunk:
+            if not data:
+                return None, b""
+            raise ConnectionError("Client disconnected during headers")
+        data += chunk
+
+    body_start = header_end + 4
+    return head_class(bytes(data[:body_start])), bytes(data[body_start:])
+
+
+def read_request_body(connection, head, body_start):
+    """Receive the Content-Length body after head, return head + body in one buffer"""
+    body_start = body_start[:head.content_length]
+
+    # Preallocate the whole request and let recv_into fill it in place
+    request = bytearray(len(head.raw) + head.content_length)
+    request[:len(head.raw)] = head.raw
+    received = len(head.raw) + len(body_start)
+    request[len(head.raw):received] = body_start
+
+    view = memoryview(request)
+    while received < len(request):
+        nbytes = connection.recv_into(view[received:], min(RECV_BUFSIZE, len(request) - received))
+        if not nbytes:
+            raise ConnectionError("Client disconnected during body")
+        received += nbytes
+    view.release()
+
+    return request
+
+
+class BodyReader:
+    """File-like reader over a Content-Length body that is still arriving
+
+    Lets HttpServer.proses_stream consume large bodies incrementally instead
+    of receiving them into one buffer first.
+    """
+    def __init__(self, connection, head, body_start):
+        self.connection = connection
+        self.buffer = body_start[:head.content_length]
+        self.remaining = head.content_length - len(self.buffer)
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            chunks = []
+            while True:
+                chunk = self.read(RECV_BUFSIZE)
+                if not chunk:
+                    return b"".join(chunks)
+                chunks.append(chunk)
+        if self.buffer:
+            chunk, self.buffer = self.buffer[:size], self.buffer[size:]
+            return chunk
+        if self.remaining <= 0 or size == 0:
+            return b""
+        chunk = self.connection.recv(min(size, self.remaining, RECV_BUFSIZE))
+        if not chunk:
+            raise ConnectionError("Client disconnected during body")
+        self.remaining -= len(chunk)
+        return chunk
+
+    def copy_to(self, fd, observer=None):
+        """Write the rest of the body to file descriptor fd, return the byte count
+
+        Plain sockets on Linux are spliced through a pipe so the data never
+        enters user space; otherwise, or when observer(chunk) has to see the
+        data (e.g. to hash it), one reused buffer is filled with recv_into.
+        """
+        written = 0
+        if observer is not None and self.buffer:
+            observer(self.buffer)
+        while self.buffer:
+            nbytes = os.write(fd, self.buffer)
+            self.buffer = self.buffer[nbytes:]
+            written += nbytes
+        if self.remaining > 0 and observer is None and USE_SPLICE and isinstance(self.connection, socket.socket):
+            written += self.splice_to(fd)
+
+        if self.remaining > 0:
+            view = memoryview(bytearray(min(RECV_BUFSIZE, self.remaining)))
+            while self.remaining > 0:
+                nbytes = self.connection.recv_into(view, min(len(view), self.remaining))
+                if not nbytes:
+                    raise ConnectionError("Client disconnected during body")
+                self.remaining -= nbytes
+                written += nbytes
+                data = view[:nbytes]
+                if observer is not None:
+                    observer(data)
+                while data:
+                    data = data[os.write(fd, data):]
+        return written
+
+    def splice_to(self, fd):
+        pipe_r, pipe_w = os.pipe()
+        try:
+            capacity = 64 * 1024
+            try:
+                import fcntl
+                capacity = fcntl.fcntl(pipe_w, fcntl.F_SETPIPE_SZ, SPLICE_PIPE_SIZE)
+            except (ImportError, AttributeError, OSError):
+                pass
+            # A socket with a timeout is non-blocking underneath, so wait with poll
+            poller = select.poll()
+            poller.register(self.connection, select.POLLIN)
+            timeout = self.connection.gettimeout()
+            written = 0
+            while self.remaining > 0:
+                try:
+                    moved = os.splice(self.connection.fileno(), pipe_w, min(capacity, self.remaining),
+                                      flags=os.SPLICE_F_MOVE | os.SPLICE_F_NONBLOCK)
+                except BlockingIOError:
+                    if not poller.poll(None if timeout is None else timeout * 1000):
+                        raise socket.timeout("timed out")
+                    continue
+                if not moved:
+                    raise ConnectionError("Client disconnected during body")
+                self.remaining -= moved
+                while moved:
+                    nbytes = os.splice(pipe_r, fd, moved, flags=os.SPLICE_F_MOVE)
+                    moved -= nbytes
+                    written += nbytes
+            return written
+        finally:
+            os.close(pipe_r)
+            os.close(pipe_w)
+
+    def drain(self):
+        """Discard any unread body so the next request on the connection lines up"""
+        while self.read(RECV_BUFSIZE):
+            pass
+
+
+def spool_request(connection, head, body_start):
+    """Receive head + body into a SpooledTemporaryFile and return it memory-mapped
+
+    Used when the memory budget is exhausted: past SPOOL_MEMORY the request
+    lives in the page cache, which the kernel can write back under pressure,
+    instead of the process heap. The caller closes the mmap.
+    """
+    with tempfile.SpooledTemporaryFile(max_size=SPOOL_MEMORY) as spooled:
+        spooled.write(head.raw)
+        reader = BodyReader(connection, head, body_start)
+        while True:
+            chunk = reader.read(RECV_BUFSIZE)
+            if not chunk:
+                break
+            spooled.write(chunk)
+        spooled.rollover()
+        spooled.flush()
+        return mmap.mmap(spooled.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def release_request(request):
+    """Close a request returned by spool_request; plain buffers need nothing"""
+    if isinstance(request, mmap.mmap):
+        try:
+            request.close()
+        except BufferError:
+            # A view is still alive; the mapping goes away with it
+            pass
+
+
+def read_request(connection):
+    """Receive a complete request (headers + Content-Length body) into one buffer
+
+    Returns None if the client closed the connection without sending a request.
+    """
+    head, body_start = read_head(connection)
+    if head is None:
+        return None
+    return read_request_body(connection, head, body_start)
+
+
+def is_keep_alive(response):
+    """True if a response built by HttpServer keeps the connection open"""
+    header_end = response.find(b"\r\n\r\n")
+    return response.find(b"\r\nConnection: keep-alive\r\n", 0, header_end + 2) >= 0
+
+
+def send_response(connection, response):
+    """Send a response built by HttpServer, return True to keep the connection open
+
+    response is bytes or, for streamed responses, an iterator of byte chunks
+    whose first chunk is the complete head.
+    """
+    if isinstance(response, str):
+        response = response.encode()
+    if isinstance(response, (bytes, bytearray)):
+        connection.sendall(response)
+        return is_keep_alive(response)
+
+    chunks = iter(response)
+    head = next(chunks)
+    connection.sendall(head)
+    for chunk in chunks:
+        connection.sendall(chunk)
+    return is_keep_alive(head)
+
+
+def rewrite_connection_header(raw, value, extra=(), drop=()):
+    """Return raw head bytes with hop-by-hop connection headers replaced by Connection: value
+
+    Headers named in drop are removed as well and the "Name: value" strings
+    in extra are appended.
+    """
+    dropped = {b"connection", b"keep-alive", b"proxy-connection"} | {name.lower().encode() for name in drop}
+    lines = raw[:-4].split(b"\r\n")
+    kept = [lines[0]]
+    for line in lines[1:]:
+        name = line.split(b":", 1)[0].strip().lower()
+        if name not in dropped:
+            kept.append(line)
+    kept.append(b"Connection: " + value.encode())
+    kept.extend(header.encode() for header in extra)
+    return b"\r\n".join(kept) + b"\r\n\r\n"
+
+
+def close_connection(connection):
+    try:
+        connection.shutdown(socket.SHUT_RDWR)
+    except:
+        pass
+    try:
+        connection.close()
+    except:
+        pass
+
+
+def buffer_and_process(connection, head, body_start, httpserver, budget=None):
+    """Receive the whole request (spooled to disk if budget says so) and process it"""
+    size = len(head.raw) + head.content_length
+    try:
+        in_memory = budget.acquire(size) if budget is not None else True
+    except BudgetExceeded as e:
+        return service_unavailable(e.retry_after)
+
+    try:
+        if in_memory:
+            request = read_request_body(connection, head, body_start)
+        else:
+            request = spool_request(connection, head, body_start)
+        try:
+            return httpserver.proses(request)
+        finally:
+            release_request(request)
+    finally:
+        if in_memory and budget is not None:
+            budget.release(size)
+
+
+def handle_connection(connection, address, httpserver, limiter=None, budget=None):
+    """Serve requests on the connection with HttpServer until it is closed"""
+    try:
+        connection.settimeout(SOCKET_TIMEOUT)
+        while True:
+            head, body_start = read_head(connection)
+            if head is None:
+                break
+            # The keep-alive timeout only covers waiting for the next head
+            connection.settimeout(SOCKET_TIMEOUT)
+
+            # Rate limiting happens before the body is received
+            if limiter is not None:
+                key = limiter.client_key(address, head.headers)
+                allowed, retry_after = limiter.acquire(key, head.content_length)
+                if not allowed:
+                    connection.sendall(too_many_requests(retry_after))
+                    break
+            try:
+                if httpserver.streams(head):
+                    response = httpserver.proses_stream(head, BodyReader(connection, head, body_start))
+                else:
+                    response = buffer_and_process(connection, head, body_start, httpserver, budget)
+            finally:
+                if limiter is not None:
+                    limiter.release(key)
+
+            if not send_response(connection, response):
+                break
+            connection.settimeout(KEEPALIVE_TIMEOUT)
+
+    except socket.timeout:
+        pass
+    except HeaderTooLarge:
+        try:
+            connection.sendall(header_too_large())
+        except OSError:
+            pass
+    except Exception as e:
+        print(f"Error processing client {address}: {str(e)}")
+        try:
+            error_response = b"HTTP/1.1 500 Internal Server Error\r\n\r\nServer Error"
+            connection.sendall(error_response)
+        except:
+            pass
+    finally:
+        close_connection(connection)
@@ -0,0 +1,123 @@
+import time
+import threading
+import collections
+
+BUDGET_POLICIES = ('wait', 'spill', 'reject')
+DEFAULT_BUDGET = 512 * 1024 * 1024
+DEFAULT_WAIT_TIMEOUT = 30.0
+
+
+class BudgetExceeded(Exception):
+    def __init__(self, retry_after=1):
+        Exception.__init__(self, 'Memory budget exhausted')
+        self.retry_after = retry_after
+
+
+class MemoryBudget:
+    """Server-wide limit on bytes held in memory for in-flight request bodies
+
+    When a request does not fit, policy decides what happens: 'wait' queues
+    it FIFO until enough earlier requests release their bytes, 'spill' tells
+    the caller to buffer it on disk instead, 'reject' raises BudgetExceeded.
+    A request larger than the whole budget is admitted once nothing else is
+    buffered, so it cannot starve.
+    """
+    def __init__(self, limit=DEFAULT_BUDGET, policy='wait', wait_timeout=DEFAULT_WAIT_TIMEOUT):
+        if policy not in BUDGET_POLICIES:
+            raise ValueError(f"Unknown budget policy {policy!r}")
+        self.limit = limit
+        self.policy = policy
+        self.wait_timeout = wait_timeout
+        self.cond = threading.Condition()
+        self.queue = collections.deque()
+        self.in_use = 0
+        self.peak = 0
+        self.admitted = 0
+        self.waited = 0
+        self.spilled = 0
+        self.rejected = 0
+        self.timed_out = 0
+
+    def fits(self, nbytes):
+        return self.in_use + nbytes <= self.limit or self.in_use == 0
+
+    def take(self, nbytes):
+        self.in_use += nbytes
+        self.peak = max(self.peak, self.in_use)
+        self.admitted += 1
+
+    def acquire(self, nbytes):
+        """Reserve nbytes; True when reserved, False when the caller should spill to disk
+
+        Every True must be paired with release(nbytes).
+        """
+        with self.cond:
+            if not self.queue and self.fits(nbytes):
+                self.take(nbytes)
+                return True
+            if self.policy == 'reject':
+                self.rejected += 1
+                raise BudgetExceeded()
+            if self.policy == 'spill':
+                self.spilled += 1
+                return False
+
+            ticket = object()
+            self.queue.append(ticket)
+            self.waited += 1
+            deadline = time.monotonic() + self.wait_timeout
+            try:
+                while self.queue[0] is not ticket or not self.fits(nbytes):
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self.timed_out += 1
+                        raise BudgetExceeded()
+                    self.cond.wait(remaining)
+                self.take(nbytes)
+                return True
+            finally:
+                self.queue.remove(ticket)
+                self.cond.notify_all()
+
+    def try_acquire(self, nbytes):
+        """Reserve nbytes if that needs no waiting; never blocks, spills or raises
+
+        For callers that must not block, e.g. a reactor thread, and fall back
+        to acquire() on a worker when this returns False.
+        """
+        with self.cond:
+            if not self.queue and self.fits(nbytes):
+                self.take(nbytes)
+                return True
+            return False
+
+    def release(self, nbytes):
+        with self.cond:
+            self.in_use -= nbytes
+            self.cond.notify_all()
+
+    def stats(self):
+        with self.cond:
+            return {
+                'policy': self.policy,
+                'limit': self.limit,
+                'in_use': self.in_use,
+                'peak': self.peak,
+                'waiting': len(self.queue),
+                'admitted': self.admitted,
+                'waited': self.waited,
+                'spilled': self.spilled,
+                'rejected': self.rejected,
+                'timed_out': self.timed_out,
+            }
+
+
+def service_unavailable(retry_after, keep_alive=False):
+    message = 'Server busy, retry later'
+    return (
+        f"HTTP/1.1 503 Service Unavailable\r\n"
+        f"Retry-After: {retry_after}\r\n"
+        f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n"
+        f"Content-Type: text/plain\r\n"
+        f"Content-Length: {len(message)}\r\n\r\n{message}"
+    ).encode()
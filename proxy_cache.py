@@ -0,0 +1,166 @@
+import threading
+import time
+import re
+import collections
+
+
+class CacheEntry:
+    """A buffered GET response plus its validators and freshness deadline"""
+    def __init__(self, head, body, expires):
+        self.head = head
+        self.body = body
+        self.etag = head.headers.get('etag')
+        self.last_modified = head.headers.get('last-modified')
+        self.expires = expires
+        self.size = len(head.raw) + len(body)
+
+    def fresh(self, now):
+        return now < self.expires
+
+    def conditional_headers(self):
+        headers = []
+        if self.etag:
+            headers.append(f"If-None-Match: {self.etag}")
+        if self.last_modified:
+            headers.append(f"If-Modified-Since: {self.last_modified}")
+        return headers
+
+
+class ResponseCache:
+    """Size-bounded LRU of GET responses keyed by method + path
+
+    A response is stored only if it is a complete 200 with validators or an
+    explicit max-age, and Cache-Control does not forbid it. Responses
+    without max-age are considered fresh for default_ttl seconds and are
+    revalidated with a conditional request afterwards. Concurrent misses for
+    the same key wait for a single upstream fetch.
+    """
+    def __init__(self, max_size=64 * 1024 * 1024, max_object_size=8 * 1024 * 1024, default_ttl=5.0):
+        self.max_size = max_size
+        self.max_object_size = max_object_size
+        self.default_ttl = default_ttl
+        self.lock = threading.Lock()
+        self.entries = collections.OrderedDict()
+        self.size = 0
+        self.inflight = {}
+        self.hits = 0
+        self.misses = 0
+        self.revalidated = 0
+
+    @staticmethod
+    def key(head):
+        return f"{head.method} {head.path}"
+
+    @staticmethod
+    def cache_control(headers):
+        directives = {}
+        for item in headers.get('cache-control', '').lower().split(','):
+            name, _, value = item.strip().partition('=')
+            if name:
+                directives[name] = value.strip('"')
+        return directives
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.entries.move_to_end(key)
+            return entry
+
+    def freshness(self, head, now):
+        """Expiry time for a response, or None if it must not be cached"""
+        if head.status != 200 or head.content_length is None:
+            return None
+        if head.content_length > self.max_object_size:
+            return None
+        if 'vary' in head.headers:
+            # Entries are keyed by method and path only
+            return None
+        directives = self.cache_control(head.headers)
+        if 'no-store' in directives or 'private' in directives:
+            return None
+        if 'no-cache' in directives:
+            return now
+        max_age = directives.get('s-maxage') or directives.get('max-age')
+        if max_age is not None and re.fullmatch(r'\d+', max_age):
+            return now + int(max_age)
+        if 'etag' in head.headers or 'last-modified' in head.headers:
+            return now + self.default_ttl
+        return None
+
+    def cacheable(self, head):
+        return self.freshness(head, time.monotonic()) is not None
+
+    def put(self, key, head, body):
+        now = time.monotonic()
+        expires = self.freshness(head, now)
+        if expires is None:
+            self.invalidate(key)
+            return None
+        entry = CacheEntry(head, body, expires)
+        with self.lock:
+            old = self.entries.pop(key, None)
+            if old is not None:
+                self.size -= old.size
+            self.entries[key] = entry
+            self.size += entry.size
+            while self.size > self.max_size and self.entries:
+                _, evicted = self.entries.popitem(last=False)
+                self.size -= evicted.size
+        return entry
+
+    def refresh(self, entry, head):
+        """Extend an entry after the origin answered 304 Not Modified"""
+        now = time.monotonic()
+        directives = self.cache_control(head.headers)
+        max_age = directives.get('s-maxage') or directives.get('max-age')
+        if max_age is not None and re.fullmatch(r'\d+', max_age):
+            entry.expires = now + int(max_age)
+        else:
+            entry.expires = now + self.default_ttl
+        with self.lock:
+            self.revalidated += 1
+
+    def invalidate(self, key=None):
+        """Drop one key, or everything when key is None"""
+        with self.lock:
+            if key is None:
+                self.entries.clear()
+                self.size = 0
+                return
+            entry = self.entries.pop(key, None)
+            if entry is not None:
+                self.size -= entry.size
+
+    def begin_fetch(self, key):
+        """Return (True, event) for the thread that must fetch, (False, event) for waiters"""
+        with self.lock:
+            event = self.inflight.get(key)
+            if event is not None:
+                return False, event
+            event = threading.Event()
+            self.inflight[key] = event
+            return True, event
+
+    def end_fetch(self, key):
+        with self.lock:
+            event = self.inflight.pop(key, None)
+        if event is not None:
+            event.set()
+
+    def record(self, hit):
+        with self.lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def stats(self):
+        with self.lock:
+            return {
+                'entries': len(self.entries),
+                'size': self.size,
+                'hits': self.hits,
+                'misses': self.misses,
+                'revalidated': self.revalidated,
+            }
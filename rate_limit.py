@@ -0,0 +1,245 @@
+import threading
+import time
+import math
+import mmap
+import struct
+import hashlib
+import collections
+import multiprocessing
+
+
+DEFAULT_REQUEST_BURST = 100
+DEFAULT_MAX_CONCURRENT = 32
+DEFAULT_BYTES_PER_SEC = 50 * 1024 * 1024
+# SharedRateLimiter table: slots of key hash, request tokens, byte tokens, updated, active
+SHARED_SLOTS = 16384
+SHARED_PROBES = 8
+SLOT = struct.Struct('<Qdddq')
+
+
+class ClientState:
+    """Token buckets and in-flight request count for one client"""
+    __slots__ = ('request_tokens', 'byte_tokens', 'updated', 'active')
+
+    def __init__(self, request_burst, byte_burst, now):
+        self.request_tokens = request_burst
+        self.byte_tokens = byte_burst
+        self.updated = now
+        self.active = 0
+
+
+class RateLimiter:
+    """Per-client requests/sec and bytes/sec token buckets plus a concurrency cap
+
+    Clients are keyed by the X-Client-ID header when present, otherwise by
+    IP address. State lives in an OrderedDict used as an LRU, so lookups are
+    O(1) and at most max_clients idle clients are remembered. The byte bucket
+    may go into debt so a single body larger than the burst is still
+    admitted, after which the client waits until the debt is repaid.
+    """
+    def __init__(self, requests_per_sec=50.0, request_burst=DEFAULT_REQUEST_BURST, bytes_per_sec=DEFAULT_BYTES_PER_SEC,
+                 byte_burst=100 * 1024 * 1024, max_concurrent=DEFAULT_MAX_CONCURRENT, max_clients=10000):
+        self.requests_per_sec = requests_per_sec
+        self.request_burst = request_burst
+        self.bytes_per_sec = bytes_per_sec
+        self.byte_burst = byte_burst
+        self.max_concurrent = max_concurrent
+        self.max_clients = max_clients
+        self.lock = threading.Lock()
+        self.clients = collections.OrderedDict()
+
+    @staticmethod
+    def client_key(address, headers=None):
+        client_id = headers.get('x-client-id') if headers else None
+        if client_id:
+            return 'id:' + client_id
+        return 'ip:' + str(address[0] if isinstance(address, tuple) else address)
+
+    def state(self, key, now):
+        state = self.clients.get(key)
+        if state is None:
+            state = ClientState(self.request_burst, self.byte_burst, now)
+            self.clients[key] = state
+            self.evict()
+        else:
+            self.clients.move_to_end(key)
+            self.refill(state, now)
+        return state
+
+    def refill(self, state, now):
+        elapsed = now - state.updated
+        state.updated = now
+        state.request_tokens = min(self.request_burst, state.request_tokens + elapsed * self.requests_per_sec)
+        state.byte_tokens = min(self.byte_burst, state.byte_tokens + elapsed * self.bytes_per_sec)
+
+    def evict(self):
+        # Oldest clients first; busy ones are kept since they hold concurrency slots
+        checked = 0
+        while len(self.clients) > self.max_clients and checked < len(self.clients):
+            key, state = next(iter(self.clients.items()))
+            if state.active:
+                self.clients.move_to_end(key)
+                checked += 1
+            else:
+                del self.clients[key]
+
+    def acquire(self, key, nbytes=0):
+        """Admit one request of nbytes body; return (True, 0) or (False, retry_after_seconds)
+
+        Every admitted request must be paired with release(key).
+        """
+        now = time.monotonic()
+        with self.lock:
+            state = self.state(key, now)
+            if state.active >= self.max_concurrent:
+                return False, 1
+            if state.request_tokens < 1:
+                return False, math.ceil((1 - state.request_tokens) / self.requests_per_sec)
+            if nbytes and state.byte_tokens <= 0:
+                return False, math.ceil(-state.byte_tokens / self.bytes_per_sec) or 1
+            state.request_tokens -= 1
+            state.byte_tokens -= nbytes
+            state.active += 1
+            return True, 0
+
+    def release(self, key):
+        with self.lock:
+            state = self.clients.get(key)
+            if state is not None and state.active > 0:
+                state.active -= 1
+
+    def stats(self):
+        with self.lock:
+            return {
+                'clients': len(self.clients),
+                'active': sum(state.active for state in self.clients.values()),
+            }
+
+
+def slot_field(index):
+    """Property reading and writing one SLOT field of a SharedClientState in place"""
+    def get(self):
+        return SLOT.unpack_from(self.mm, self.offset)[index]
+
+    def set(self, value):
+        values = list(SLOT.unpack_from(self.mm, self.offset))
+        values[index] = value
+        SLOT.pack_into(self.mm, self.offset, *values)
+    return property(get, set)
+
+
+class SharedClientState:
+    """ClientState kept in a slot of a SharedRateLimiter mapping"""
+    __slots__ = ('mm', 'offset')
+
+    def __init__(self, mm, offset):
+        self.mm = mm
+        self.offset = offset
+
+    key = slot_field(0)
+    request_tokens = slot_field(1)
+    byte_tokens = slot_field(2)
+    updated = slot_field(3)
+    active = slot_field(4)
+
+
+class SharedRateLimiter(RateLimiter):
+    """RateLimiter whose state is shared by every process forked after it is created
+
+    Client state lives in an anonymous shared mapping, a fixed table of
+    slots found by hashing the client key (time.monotonic is the same clock
+    in every process). A multiprocessing lock replaces the thread lock, so
+    the limits and the concurrency cap hold across a pre-forked pool.
+    When all probed slots are taken the least recently updated idle client
+    is forgotten, like the LRU of RateLimiter.
+    """
+    def __init__(self, *args, slots=SHARED_SLOTS, **kwargs):
+        RateLimiter.__init__(self, *args, **kwargs)
+        self.lock = multiprocessing.Lock()
+        self.clients = None
+        self.slots = slots
+        self.mm = mmap.mmap(-1, slots * SLOT.size)
+
+    @staticmethod
+    def key_hash(key):
+        value = int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), 'little')
+        return value or 1
+
+    def probe(self, key_hash):
+        start = key_hash % self.slots
+        for step in range(min(SHARED_PROBES, self.slots)):
+            yield SharedClientState(self.mm, ((start + step) % self.slots) * SLOT.size)
+
+    def find(self, key):
+        key_hash = self.key_hash(key)
+        for state in self.probe(key_hash):
+            if state.key == key_hash:
+                return state
+        return None
+
+    def state(self, key, now):
+        key_hash = self.key_hash(key)
+        victim = None
+        for state in self.probe(key_hash):
+            stored, _, _, updated, active = SLOT.unpack_from(self.mm, state.offset)
+            if stored == key_hash:
+                self.refill(state, now)
+                return state
+            if stored == 0:
+                victim = victim if victim is not None and victim[0] < 0 else (-1, state)
+            elif not active and (victim is None or updated < victim[0]):
+                victim = (updated, state)
+        # Every probed client is busy: take over the first slot rather than fail
+        state = victim[1] if victim is not None else next(self.probe(key_hash))
+        SLOT.pack_into(self.mm, state.offset, key_hash, self.request_burst, self.byte_burst, now, 0)
+        return state
+
+    def release(self, key):
+        with self.lock:
+            state = self.find(key)
+            if state is not None and state.active > 0:
+                state.active -= 1
+
+    def stats(self):
+        with self.lock:
+            states = [SLOT.unpack_from(self.mm, offset) for offset in range(0, len(self.mm), SLOT.size)]
+        return {
+            'clients': sum(1 for state in states if state[0]),
+            'active': sum(state[4] for state in states if state[0]),
+        }
+
+
+def too_many_requests(retry_after, keep_alive=False):
+    message = 'Rate limit exceeded'
+    return (
+        f"HTTP/1.1 429 Too Many Requests\r\n"
+        f"Retry-After: {retry_after}\r\n"
+        f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n"
+        f"Content-Type: text/plain\r\n"
+        f"Content-Length: {len(message)}\r\n\r\n{message}"
+    ).encode()
+
+
+def add_arguments(parser):
+    """Command-line options for an opt-in limiter; see from_args"""
+    parser.add_argument('--rate-limit', type=float,
+                        help='requests/sec allowed per client (X-Client-ID or IP); off when not given')
+    parser.add_argument('--rate-burst', type=int, default=DEFAULT_REQUEST_BURST,
+                        help='requests a client may make at once before --rate-limit applies')
+    parser.add_argument('--max-concurrent', type=int, default=DEFAULT_MAX_CONCURRENT,
+                        help='requests in flight per client with --rate-limit')
+    parser.add_argument('--byte-rate-limit', type=int, default=DEFAULT_BYTES_PER_SEC // (1024 * 1024),
+                        help='MB/sec of request bodies per client with --rate-limit')
+
+
+def from_args(args, shared=False):
+    """RateLimiter configured by add_arguments options, None when limiting is off
+
+    With shared, a SharedRateLimiter for servers that fork their workers;
+    create it before forking.
+    """
+    if not args.rate_limit:
+        return None
+    bytes_per_sec = args.byte_rate_limit * 1024 * 1024
+    limiter_class = SharedRateLimiter if shared else RateLimiter
+    return limiter_class(args.rate_limit, args.rate_burst, bytes_per_sec, 2 * bytes_per_sec, args.max_concurrent)
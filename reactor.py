@@ -0,0 +1,284 @@
+import time
+import socket
+import selectors
+import threading
+import collections
+from http_connection import (RequestHead, is_keep_alive, header_too_large, RECV_BUFSIZE, MAX_HEADER_SIZE,
+                             SOCKET_TIMEOUT, KEEPALIVE_TIMEOUT)
+
+# Bodies up to this size are read by the reactor itself; larger ones (and
+# streamed uploads) are handed to a blocking worker together with the socket
+REACTOR_BODY_LIMIT = 64 * 1024
+ACCEPT_BATCH = 64
+
+
+class ReactorConnection:
+    __slots__ = ('sock', 'address', 'buffer', 'head', 'out', 'keep_alive', 'busy', 'last_active', 'reserved')
+
+    def __init__(self, sock, address):
+        self.sock = sock
+        self.address = address
+        self.buffer = bytearray()
+        self.head = None
+        self.out = None
+        self.keep_alive = False
+        self.busy = False
+        self.last_active = time.monotonic()
+        # Memory budget bytes held for the request being buffered or processed
+        self.reserved = 0
+
+
+class Reactor(threading.Thread):
+    """One thread multiplexing many non-blocking connections over an epoll selector
+
+    The reactor reads request heads and small bodies, and writes responses.
+    Nothing that can block on the disk runs here. Once a head is complete,
+    dispatch(reactor, conn, head, data, complete) is called on the reactor
+    thread:
+
+    - if buffered(head) is true and the request fits budget without
+      waiting, complete is True, data is the whole request (head + body)
+      and the reactor still owns the connection; the worker answers with
+      respond(conn, response), which also gives the budget back
+    - otherwise complete is False, the connection is detached and switched
+      back to blocking mode, data holds the body bytes already received,
+      and the worker owns the socket; it may give it back later with adopt()
+
+    With a listener (e.g. one SO_REUSEPORT socket per reactor) the reactor
+    accepts its own connections; otherwise an acceptor feeds it via adopt().
+    """
+    def __init__(self, dispatch, buffered, listener=None, name=None, budget=None):
+        threading.Thread.__init__(self, name=name, daemon=True)
+        self.dispatch = dispatch
+        self.buffered = buffered
+        self.budget = budget
+        self.listener = listener
+        self.selector = selectors.DefaultSelector()
+        self.calls = collections.deque()
+        self.waker_r, self.waker_w = socket.socketpair()
+        self.waker_r.setblocking(False)
+        self.waker_w.setblocking(False)
+        self.connections = set()
+        self.accepted = 0
+        self.requests = 0
+
+    def call_soon(self, function, *args):
+        """Run function(*args) on the reactor thread; safe from any thread"""
+        self.calls.append((function, args))
+        try:
+            self.waker_w.send(b'\0')
+        except (BlockingIOError, OSError):
+            # The wakeup pipe is full, so a wakeup is pending anyway
+            pass
+
+    def adopt(self, sock, address):
+        self.call_soon(self.add, sock, address)
+
+    def respond(self, conn, response):
+        self.call_soon(self.start_write, conn, response)
+
+    def run(self):
+        self.selector.register(self.waker_r, selectors.EVENT_READ, 'wake')
+        if self.listener is not None:
+            self.listener.setblocking(False)
+            self.selector.register(self.listener, selectors.EVENT_READ, 'accept')
+        last_sweep = time.monotonic()
+        while True:
+            for key, mask in self.selector.select(1.0):
+                if key.data == 'wake':
+                    self.run_calls()
+                elif key.data == 'accept':
+                    self.accept()
+                else:
+                    conn = key.data
+                    # A failure (e.g. in dispatch) costs this connection, never the reactor
+                    try:
+                        if mask & selectors.EVENT_READ:
+                            self.on_readable(conn)
+                        if mask & selectors.EVENT_WRITE and conn.out is not None:
+                            self.on_writable(conn)
+                    except Exception as e:
+                        print(f"Error processing client {conn.address}: {str(e)}")
+                        self.close(conn)
+            now = time.monotonic()
+            if now - last_sweep >= 1.0:
+                self.close_idle(now)
+                last_sweep = now
+
+    def run_calls(self):
+        try:
+            while self.waker_r.recv(4096):
+                pass
+        except BlockingIOError:
+            pass
+        while self.calls:
+            function, args = self.calls.popleft()
+            try:
+                function(*args)
+            except Exception as e:
+                print(f"Reactor call {function.__name__} failed: {str(e)}")
+                self.drop(args)
+
+    def drop(self, args):
+        """Close the connection or socket a failed call was about"""
+        for arg in args:
+            if isinstance(arg, ReactorConnection):
+                self.close(arg)
+            elif isinstance(arg, socket.socket):
+                try:
+                    self.selector.unregister(arg)
+                except (KeyError, ValueError):
+                    pass
+                self.connections = {conn for conn in self.connections if conn.sock is not arg}
+                try:
+                    arg.close()
+                except OSError:
+                    pass
+
+    def accept(self):
+        for _ in range(ACCEPT_BATCH):
+            try:
+                sock, address = self.listener.accept()
+            except (BlockingIOError, InterruptedError):
+                return
+            except OSError as e:
+                print(f"Accept failed: {e}")
+                return
+            self.accepted += 1
+            try:
+                self.add(sock, address)
+            except Exception as e:
+                print(f"Adding connection from {address} failed: {str(e)}")
+                self.drop((sock,))
+
+    def add(self, sock, address):
+        sock.setblocking(False)
+        conn = ReactorConnection(sock, address)
+        self.connections.add(conn)
+        self.selector.register(sock, selectors.EVENT_READ, conn)
+
+    def on_readable(self, conn):
+        try:
+            chunk = conn.sock.recv(RECV_BUFSIZE)
+        except (BlockingIOError, InterruptedError):
+            return
+        except OSError:
+            self.close(conn)
+            return
+        if not chunk:
+            self.close(conn)
+            return
+        conn.buffer += chunk
+        conn.last_active = time.monotonic()
+        self.process_input(conn)
+
+    def process_input(self, conn):
+        if conn.head is None:
+            header_end = conn.buffer.find(b"\r\n\r\n")
+            if header_end < 0:
+                if len(conn.buffer) > MAX_HEADER_SIZE:
+                    self.reject(conn, header_too_large())
+                return
+            conn.head = RequestHead(bytes(conn.buffer[:header_end + 4]))
+            del conn.buffer[:header_end + 4]
+            if not self.buffered(conn.head) or not self.reserve(conn):
+                head, data = conn.head, bytes(conn.buffer)
+                self.detach(conn)
+                conn.sock.setblocking(True)
+                self.requests += 1
+                self.dispatch(self, conn, head, data, False)
+                return
+
+        length = conn.head.content_length
+        if len(conn.buffer) < length:
+            return
+        request = conn.head.raw + bytes(conn.buffer[:length])
+        del conn.buffer[:length]
+        head, conn.head = conn.head, None
+        # No reads until the response is out; pipelined bytes wait in conn.buffer
+        conn.busy = True
+        self.selector.unregister(conn.sock)
+        self.requests += 1
+        self.dispatch(self, conn, head, request, True)
+
+    def reserve(self, conn):
+        """Take budget for the request before its body is buffered here
+
+        The reactor cannot wait, so when the budget is short the request goes
+        to a worker, which applies the budget policy itself.
+        """
+        size = len(conn.head.raw) + conn.head.content_length
+        if self.budget is not None:
+            if not self.budget.try_acquire(size):
+                return False
+            conn.reserved = size
+        return True
+
+    def unreserve(self, conn):
+        if conn.reserved:
+            self.budget.release(conn.reserved)
+            conn.reserved = 0
+
+    def reject(self, conn, response):
+        """Answer with response and close, without reading the rest of the request"""
+        conn.buffer.clear()
+        conn.head = None
+        conn.busy = True
+        self.selector.unregister(conn.sock)
+        self.start_write(conn, response)
+
+    def start_write(self, conn, response):
+        self.unreserve(conn)
+        if conn not in self.connections:
+            return
+        conn.out = memoryview(response)
+        conn.keep_alive = is_keep_alive(response)
+        conn.last_active = time.monotonic()
+        self.selector.register(conn.sock, selectors.EVENT_WRITE, conn)
+        self.on_writable(conn)
+
+    def on_writable(self, conn):
+        try:
+            while conn.out:
+                conn.out = conn.out[conn.sock.send(conn.out):]
+        except (BlockingIOError, InterruptedError):
+            conn.last_active = time.monotonic()
+            return
+        except OSError:
+            self.close(conn)
+            return
+        conn.out = None
+        if not conn.keep_alive:
+            self.close(conn)
+            return
+        conn.busy = False
+        conn.last_active = time.monotonic()
+        self.selector.modify(conn.sock, selectors.EVENT_READ, conn)
+        if conn.buffer:
+            self.process_input(conn)
+
+    def close_idle(self, now):
+        for conn in list(self.connections):
+            if conn.busy and conn.out is None:
+                continue
+            idle = KEEPALIVE_TIMEOUT if not conn.buffer and conn.out is None else SOCKET_TIMEOUT
+            if now - conn.last_active > idle:
+                self.close(conn)
+
+    def detach(self, conn):
+        self.connections.discard(conn)
+        try:
+            self.selector.unregister(conn.sock)
+        except (KeyError, ValueError):
+            pass
+
+    def close(self, conn):
+        self.unreserve(conn)
+        self.detach(conn)
+        try:
+            conn.sock.close()
+        except OSError:
+            pass
+
+    def stats(self):
+        return {'connections': len(self.connections), 'accepted': self.accepted, 'requests': self.requests}
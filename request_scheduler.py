@@ -0,0 +1,114 @@
+import os
+import time
+import threading
+import collections
+from concurrent.futures import ThreadPoolExecutor
+
+INTERACTIVE = 'interactive'
+BULK = 'bulk'
+BULK_THRESHOLD = 1024 * 1024
+LATENCY_WINDOW = 2048
+
+
+def classify(head, bulk_threshold=BULK_THRESHOLD, stat_files=True):
+    """Sort a request into INTERACTIVE or BULK from its method, path and size
+
+    Large bodies, batch and upload-session traffic and GETs of large files
+    are bulk; everything else is interactive. With stat_files false the
+    file size of a GET is not looked up, so nothing touches the disk.
+    """
+    if head.content_length >= bulk_threshold:
+        return BULK
+    path = head.path.split('?', 1)[0]
+    if path.startswith('/batch/') or path.startswith('/uploads'):
+        return BULK
+    if stat_files and head.method == 'GET' and 'range' not in head.headers:
+        try:
+            if os.path.getsize(path[1:]) >= bulk_threshold:
+                return BULK
+        except (OSError, ValueError):
+            pass
+    return INTERACTIVE
+
+
+def percentile(ordered, fraction):
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+class ClassMetrics:
+    """Queue wait and service time of one request class over the last LATENCY_WINDOW requests"""
+    def __init__(self, workers):
+        self.workers = workers
+        self.lock = threading.Lock()
+        self.queued = 0
+        self.active = 0
+        self.completed = 0
+        self.waits = collections.deque(maxlen=LATENCY_WINDOW)
+        self.services = collections.deque(maxlen=LATENCY_WINDOW)
+
+    def enqueued(self):
+        with self.lock:
+            self.queued += 1
+
+    def started(self, wait):
+        with self.lock:
+            self.queued -= 1
+            self.active += 1
+            self.waits.append(wait)
+
+    def finished(self, service):
+        with self.lock:
+            self.active -= 1
+            self.completed += 1
+            self.services.append(service)
+
+    def snapshot(self):
+        with self.lock:
+            waits = sorted(self.waits)
+            services = sorted(self.services)
+            snapshot = {
+                'workers': self.workers,
+                'queued': self.queued,
+                'active': self.active,
+                'completed': self.completed,
+            }
+        for name, samples in (('wait', waits), ('service', services)):
+            for label, fraction in (('p50', 0.5), ('p95', 0.95), ('p99', 0.99)):
+                snapshot[f'{name}_{label}_ms'] = round(1000 * percentile(samples, fraction), 2)
+        return snapshot
+
+
+class RequestScheduler:
+    """One worker pool per request class, so bulk transfers cannot occupy every worker
+
+    limits maps class name to its worker count, which is also that class's
+    concurrency limit; each pool queues its own requests FIFO.
+    """
+    def __init__(self, limits):
+        self.pools = {name: ThreadPoolExecutor(max_workers=workers, thread_name_prefix=name)
+                      for name, workers in limits.items()}
+        self.metrics = {name: ClassMetrics(workers) for name, workers in limits.items()}
+
+    def submit(self, request_class, fn, *args):
+        metrics = self.metrics[request_class]
+        enqueued = time.monotonic()
+        metrics.enqueued()
+
+        def run():
+            started = time.monotonic()
+            metrics.started(started - enqueued)
+            try:
+                fn(*args)
+            finally:
+                metrics.finished(time.monotonic() - started)
+
+        return self.pools[request_class].submit(run)
+
+    def stats(self):
+        return {name: metrics.snapshot() for name, metrics in self.metrics.items()}
+
+    def shutdown(self):
+        for pool in self.pools.values():
+            pool.shutdown(wait=False)
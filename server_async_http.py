@@ -3,33 +3,69 @@ import time
 import sys
 import asyncore
 import logging
+import argparse
 from http import HttpServer
+from http_connection import RequestHead, header_too_large, MAX_HEADER_SIZE
+import rate_limit
+from rate_limit import too_many_requests
 
 httpserver = HttpServer()
-rcv = ""
+#rate limiting per client opsional (--rate-limit)
+limiter = None
 
 class ProcessTheClient(asyncore.dispatcher_with_send):
+	def __init__(self, sock, address):
+		asyncore.dispatcher_with_send.__init__(self, sock)
+		self.address = address
+		#buffer per koneksi, request dibaca sebagai bytes
+		self.rcv = bytearray()
+		self.closing = False
+
 	def handle_read(self):
-		global rcv
-		data = self.recv(1024)
-		if data:
-			d = data.decode()
-			rcv = rcv + d
-			if rcv[-2:] == '\r\n':
-				# end of command, proses string
-				logging.warning("data dari client: {}".format(rcv))
-				hasil = httpserver.proses(rcv)
-				#hasil sudah dalam bentuk bytes
-				hasil = hasil + "\r\n\r\n".encode()
-				#agar bisa dioperasikan dengan string \r\n\r\n maka harus diencode dulu => bytes
-				logging.warning("balas ke  client: {}".format(hasil))
-				self.send(hasil) #hasil sudah dalam bentuk bytes, kirimkan balik ke client
-				rcv = ""
-				self.close()
-
-		#self.send('HTTP/1.1 200 OK \r\n\r\n'.encode())
-			#self.send("{}" . format(httpserver.proses(d)))
-		self.close()
+		if self.closing:
+			return
+		data = self.recv(65536)
+		if not data:
+			self.close()
+			return
+		self.rcv += data
+		header_end = self.rcv.find(b"\r\n\r\n")
+		if header_end < 0:
+			if len(self.rcv) > MAX_HEADER_SIZE:
+				self.reply(header_too_large())
+			return
+		head = RequestHead(bytes(self.rcv[:header_end + 4]))
+		if len(self.rcv) < header_end + 4 + head.content_length:
+			#body belum lengkap
+			return
+		request = bytes(self.rcv[:header_end + 4 + head.content_length])
+		logging.warning("data dari client: {}".format(head.raw))
+		if limiter is not None:
+			key = limiter.client_key(self.address, head.headers)
+			allowed, retry_after = limiter.acquire(key, head.content_length)
+			if not allowed:
+				self.reply(too_many_requests(retry_after))
+				return
+			try:
+				hasil = httpserver.proses(request)
+			finally:
+				limiter.release(key)
+		else:
+			hasil = httpserver.proses(request)
+		#hasil sudah dalam bentuk bytes, kirimkan balik ke client
+		self.reply(hasil)
+
+	def reply(self, hasil):
+		#koneksi ditutup setelah seluruh balasan terkirim
+		self.send(hasil)
+		self.closing = True
+		if not self.out_buffer:
+			self.close()
+
+	def handle_write(self):
+		self.initiate_send()
+		if self.closing and not self.out_buffer:
+			self.close()
 
 class Server(asyncore.dispatcher):
 	def __init__(self,portnumber):
@@ -45,15 +81,16 @@ class Server(asyncore.dispatcher):
 		if pair is not None:
 			sock, addr = pair
 			logging.warning("connection from {}" . format(repr(addr)))
-			handler = ProcessTheClient(sock)
+			handler = ProcessTheClient(sock, addr)
 
 def main():
-	portnumber=8887
-	try:
-		portnumber=int(sys.argv[1])
-	except:
-		pass
-	svr = Server(portnumber)
+	global limiter
+	parser = argparse.ArgumentParser(description='asyncore HTTP server')
+	parser.add_argument('port', nargs='?', type=int, default=8887)
+	rate_limit.add_arguments(parser)
+	args = parser.parse_args()
+	limiter = rate_limit.from_args(args)
+	svr = Server(args.port)
 	asyncore.loop()
 
 if __name__=="__main__":
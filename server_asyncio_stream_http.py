@@ -6,33 +6,101 @@ import logging
 import multiprocessing
 from concurrent.futures import ProcessPoolExecutor
 import asyncio
+import argparse
 from http import HttpServer
+import rate_limit
+from rate_limit import too_many_requests
+from http_connection import RequestHead, is_keep_alive, header_too_large, MAX_HEADER_SIZE
+from h2_connection import H2Session, PREFACE, SWITCHING_PROTOCOLS, available, is_upgrade
 
 httpserver = HttpServer()
+#rate limiting per client opsional (--rate-limit)
+limiter = None
 
 class ProcessTheClient(asyncio.Protocol):
 		def connection_made(self, transport):
 			peername = transport.get_extra_info('peername')
 			print('Connection from {}'.format(peername))
 			self.transport = transport
-			self.rcv = ""
+			self.rcv = bytearray()
+			self.h2 = None
+			self.busy = False
 		def data_received(self, data: bytes) -> None:
-			try:
-				d = data.decode()
-				self.rcv=self.rcv+d
-				if self.rcv[-2:]=='\r\n':
-					hasil = httpserver.proses(self.rcv)
-					hasil=hasil+"\r\n\r\n".encode()
-					self.transport.write(hasil)
+			#setelah upgrade / prior knowledge semua byte milik sesi HTTP/2
+			if self.h2 is not None:
+				self.h2.data_received(data)
+				return
+			self.rcv += data
+			if available() and self.rcv[:len(PREFACE)] == PREFACE[:len(self.rcv)]:
+				#HTTP/2 dengan prior knowledge, tunggu sampai preface lengkap
+				if len(self.rcv) >= len(PREFACE):
+					self.h2 = H2Session(self.transport, httpserver)
+					self.h2.start(bytes(self.rcv))
+					self.rcv.clear()
+				return
+			self.process()
+		def process(self):
+			if self.busy:
+				return
+			header_end = self.rcv.find(b"\r\n\r\n")
+			if header_end < 0:
+				if len(self.rcv) > MAX_HEADER_SIZE:
+					self.transport.write(header_too_large())
+					self.transport.close()
+				return
+			head = RequestHead(bytes(self.rcv[:header_end+4]))
+			request_end = header_end + 4 + head.content_length
+			if len(self.rcv) < request_end:
+				return
+			request = bytes(self.rcv[:request_end])
+			del self.rcv[:request_end]
+
+			if available() and is_upgrade(head.headers):
+				#h2c upgrade: request ini dijawab sebagai stream 1 HTTP/2
+				self.transport.write(SWITCHING_PROTOCOLS)
+				self.h2 = H2Session(self.transport, httpserver)
+				self.h2.start_upgrade(head.headers['http2-settings'], head.method, head.path, head.headers, request[len(head.raw):])
+				if self.rcv:
+					self.h2.data_received(bytes(self.rcv))
+					self.rcv.clear()
+				return
+
+			key = None
+			if limiter is not None:
+				key = limiter.client_key(self.transport.get_extra_info('peername'), head.headers)
+				allowed, retry_after = limiter.acquire(key, head.content_length)
+				if not allowed:
+					self.transport.write(too_many_requests(retry_after))
 					self.transport.close()
-					self.rcv=""
-			except OSError as e:
-				pass
+					return
+
+			self.busy = True
+			asyncio.get_running_loop().create_task(self.respond(request, key))
+		async def respond(self, request, key=None):
+			#proses dijalankan di executor supaya akses disk tidak memblok event loop
+			try:
+				hasil = await asyncio.get_running_loop().run_in_executor(None, httpserver.proses, request)
+			finally:
+				if key is not None:
+					limiter.release(key)
+			if self.transport.is_closing():
+				return
+			self.transport.write(hasil)
+			if is_keep_alive(hasil):
+				self.busy = False
+				self.process()
+			else:
+				self.transport.close()
+		def connection_lost(self, exc):
+			if self.h2 is not None:
+				self.h2.connection_lost()
 
 
 
 async def Server():
 	loop = asyncio.get_running_loop()
+	if not available():
+		logging.warning("h2 is not installed, serving HTTP/1.1 only")
 
 	server = await loop.create_server(
 		lambda: ProcessTheClient(),
@@ -41,6 +109,12 @@ async def Server():
 	async with server:
 		await server.serve_forever()
 
-if __name__=="__main__":
+def main():
+	global limiter
+	parser = argparse.ArgumentParser(description='asyncio HTTP/1.1 and h2c server')
+	rate_limit.add_arguments(parser)
+	limiter = rate_limit.from_args(parser.parse_args())
 	asyncio.run(Server())
 
+if __name__=="__main__":
+	main()
@@ -3,10 +3,16 @@ import socket
 import time
 import sys
 import logging
+import argparse
 import multiprocessing
 from http import HttpServer
+import rate_limit
+from http_connection import handle_connection
+from static_cache import SharedStaticCache, default_path
 
 httpserver = HttpServer()
+#rate limiting per client opsional (--rate-limit)
+limiter = None
 
 
 class ProcessTheClient(multiprocessing.Process):
@@ -16,32 +22,9 @@ class ProcessTheClient(multiprocessing.Process):
 		multiprocessing.Process.__init__(self)
 
 	def run(self):
-		rcv=""
-		while True:
-			try:
-				data = self.connection.recv(32)
-				if data:
-					#merubah input dari socket (berupa bytes) ke dalam string
-					#agar bisa mendeteksi \r\n
-					d = data.decode()
-					rcv=rcv+d
-					if rcv[-2:]=='\r\n':
-						#end of command, proses string
-						#logging.warning("data dari client: {}" . format(rcv))
-						hasil = httpserver.proses(rcv)
-						#hasil akan berupa bytes
-						#untuk bisa ditambahi dengan string, maka string harus di encode
-						hasil=hasil+"\r\n\r\n".encode()
-						#logging.warning("balas ke  client: {}" . format(hasil))
-						#hasil sudah dalam bentuk bytes
-						self.connection.sendall(hasil)
-						rcv=""
-						self.connection.close()
-				else:
-					break
-			except OSError as e:
-				pass
-		self.connection.close()
+		#request dibaca dan diproses sebagai bytes oleh handle_connection,
+		#termasuk body dan keep-alive
+		handle_connection(self.connection, self.address, httpserver, limiter)
 
 
 
@@ -61,11 +44,23 @@ class Server(multiprocessing.Process):
 
 			clt = ProcessTheClient(self.connection, self.client_address)
 			clt.start()
+			#koneksi sudah diwariskan ke proses client
+			self.connection.close()
+			self.the_clients = [c for c in self.the_clients if c.is_alive()]
 			self.the_clients.append(clt)
 
 
 
 def main():
+	global limiter
+	parser = argparse.ArgumentParser(description='HTTP server with one process per connection')
+	rate_limit.add_arguments(parser)
+	args = parser.parse_args()
+	multiprocessing.set_start_method('fork', force=True)
+	#limiter dan cache dibuat sebelum fork, sehingga semua proses client
+	#memakai state dan mapping yang sama
+	limiter = rate_limit.from_args(args, shared=True)
+	httpserver.static_cache = SharedStaticCache(default_path('myserver-static-8889'))
 	svr = Server()
 	svr.start()
 
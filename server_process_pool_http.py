@@ -2,13 +2,27 @@ from socket import *
 import socket
 import logging
 import os
+import time
+import argparse
 import multiprocessing as mp
 from http import HttpServer
-from concurrent.futures import ProcessPoolExecutor
+from http_connection import (read_head, read_request_body, spool_request, release_request, is_keep_alive,
+                             HeaderTooLarge, header_too_large)
+import rate_limit
+from rate_limit import too_many_requests
+from memory_budget import MemoryBudget, BudgetExceeded, service_unavailable, DEFAULT_BUDGET
+from static_cache import SharedStaticCache, default_path
+
+# Per-client rate limiting is opt-in (--rate-limit)
+limiter = None
+budget = MemoryBudget()
+# Hot files, mapped once before forking and shared by every worker process
+static_cache = None
+# Each worker process builds its own HttpServer after the fork
+httpserver = None
 
 def worker_process(request_data):
-    """Worker function that processes HTTP requests"""
-    httpserver = HttpServer()
+    """Process one HTTP request with this worker's HttpServer"""
     try:
         response = httpserver.proses(request_data)
         if isinstance(response, str):
@@ -22,45 +36,56 @@ def handle_connection(connection, address):
     """Handle a single client connection"""
     try:
         connection.settimeout(240.0)
-        
-        # Receive request headers first
-        headers_data = b""
-        while b"\r\n\r\n" not in headers_data:
-            chunk = connection.recv(1024*1024)
-            if not chunk:
-                raise ConnectionError("Client disconnected during headers")
-            headers_data += chunk
-        
-        # Parse headers to get content length
-        headers_str = headers_data[:headers_data.find(b"\r\n\r\n")].decode('utf-8')
-        content_length = 0
-        
-        for line in headers_str.split('\r\n'):
-            if line.lower().startswith('content-length:'):
-                content_length = int(line.split(':')[1].strip())
-                break
-        
-        # Get body data
-        body_start = headers_data.find(b"\r\n\r\n") + 4
-        body_data = headers_data[body_start:]
-        
-        # Receive remaining body if needed
-        while len(body_data) < content_length:
-            remaining = content_length - len(body_data)
-            chunk = connection.recv(min(8192, remaining))
-            if not chunk:
-                raise ConnectionError("Client disconnected during body")
-            body_data += chunk
-        
-        # Reconstruct complete request
-        complete_request = headers_data[:body_start] + body_data
-        
-        # Process request
-        response = worker_process(complete_request)
-        
+
+        head, body_start = read_head(connection)
+        if head is None:
+            return
+
+        # Reject over-limit clients before receiving their body
+        if limiter is not None:
+            key = limiter.client_key(address, head.headers)
+            allowed, retry_after = limiter.acquire(key, head.content_length)
+            if not allowed:
+                connection.sendall(too_many_requests(retry_after))
+                return
+
+        size = len(head.raw) + head.content_length
+        try:
+            # Bodies that do not fit the memory budget are spooled to disk
+            in_memory = budget.acquire(size)
+        except BudgetExceeded as e:
+            if limiter is not None:
+                limiter.release(key)
+            connection.sendall(service_unavailable(e.retry_after))
+            return
+
+        try:
+            if in_memory:
+                complete_request = read_request_body(connection, head, body_start)
+            else:
+                complete_request = spool_request(connection, head, body_start)
+
+            # Process request
+            response = worker_process(complete_request)
+            release_request(complete_request)
+        finally:
+            if in_memory:
+                budget.release(size)
+            if limiter is not None:
+                limiter.release(key)
+        # Each worker serves one connection at a time, so an idle keep-alive
+        # connection would stall that worker: always close
+        if is_keep_alive(response):
+            response = response.replace(b"Connection: keep-alive\r\n", b"Connection: close\r\n", 1)
+
         # Send response
         connection.sendall(response)
-        
+
+    except HeaderTooLarge:
+        try:
+            connection.sendall(header_too_large())
+        except OSError:
+            pass
     except Exception as e:
         print(f"Error processing client {address}: {str(e)}")
         try:
@@ -74,39 +99,71 @@ def handle_connection(connection, address):
         except:
             pass
 
-def Server():
+def serve(server_socket):
+    """Worker process: accept connections on the inherited listening socket and serve them"""
+    global httpserver
+    httpserver = HttpServer()
+    httpserver.static_cache = static_cache
+    while True:
+        try:
+            connection, client_address = server_socket.accept()
+        except OSError as e:
+            print(f"Accept failed in worker {os.getpid()}: {e}")
+            continue
+        handle_connection(connection, client_address)
+
+def Server(num_workers=None):
     # Create main server socket
     server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
     server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
     server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 8 * 1024 * 1024)
     server_socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
-    
+
     server_socket.bind(('0.0.0.0', 8889))
     server_socket.listen(5000)
-    
+
     print("Process Pool Server listening on port 8889...")
 
-    # Create process pool
-    num_workers = os.cpu_count() * 4
+    # Pre-forked pool: every worker accepts on the same socket and the
+    # kernel hands each connection to one waiting worker
+    num_workers = num_workers or os.cpu_count() * 4
     print(f"Starting {num_workers} worker processes")
-    
-    with ProcessPoolExecutor(max_workers=num_workers) as executor:
-        try:
-            while True:
-                connection, client_address = server_socket.accept()
-                # Handle connection in the main process (for simplicity)
-                # In production, you'd need a more sophisticated approach
-                handle_connection(connection, client_address)
-        except KeyboardInterrupt:
-            print("Server shutting down...")
-        finally:
-            server_socket.close()
+    workers = []
+    try:
+        while True:
+            # Replace workers that died so the pool keeps its size
+            workers = [worker for worker in workers if worker.is_alive()]
+            while len(workers) < num_workers:
+                worker = mp.Process(target=serve, args=(server_socket,), daemon=True)
+                worker.start()
+                workers.append(worker)
+            time.sleep(1)
+    except KeyboardInterrupt:
+        print("Server shutting down...")
+    finally:
+        for worker in workers:
+            worker.terminate()
+        server_socket.close()
 
 def main():
+    global static_cache, limiter, budget
+    parser = argparse.ArgumentParser(description='Pre-forked process pool HTTP server')
+    parser.add_argument('--workers', type=int, help='worker processes (default 4 per CPU)')
+    parser.add_argument('--memory-budget', type=int, default=DEFAULT_BUDGET // (1024 * 1024),
+                        help='MB of request bodies buffered in memory at once, split between the workers')
+    rate_limit.add_arguments(parser)
+    args = parser.parse_args()
+    num_workers = args.workers or os.cpu_count() * 4
     # Set multiprocessing start method
     mp.set_start_method('fork', force=True)
+    # The limiter lives in shared memory, so its limits hold across all workers;
+    # each worker has its own copy of the budget, so that is divided between them
+    limiter = rate_limit.from_args(args, shared=True)
+    budget = MemoryBudget(args.memory_budget * 1024 * 1024 // num_workers)
+    # Created before forking, so workers inherit the mapping
+    static_cache = SharedStaticCache(default_path('myserver-static-8889'))
     logging.basicConfig(level=logging.WARNING)
-    Server()
+    Server(num_workers)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
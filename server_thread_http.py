@@ -4,9 +4,14 @@ import threading
 import time
 import sys
 import logging
+import argparse
 from http import HttpServer
+from http_connection import handle_connection
+import rate_limit
 
 httpserver = HttpServer()
+#rate limiting per client opsional (--rate-limit)
+limiter = None
 
 
 class ProcessTheClient(threading.Thread):
@@ -16,32 +21,9 @@ class ProcessTheClient(threading.Thread):
 		threading.Thread.__init__(self)
 
 	def run(self):
-		rcv=""
-		while True:
-			try:
-				data = self.connection.recv(32)
-				if data:
-					#merubah input dari socket (berupa bytes) ke dalam string
-					#agar bisa mendeteksi \r\n
-					d = data.decode()
-					rcv=rcv+d
-					if rcv[-2:]=='\r\n':
-						#end of command, proses string
-						logging.warning("data dari client: {}" . format(rcv))
-						hasil = httpserver.proses(rcv)
-						#hasil akan berupa bytes
-						#untuk bisa ditambahi dengan string, maka string harus di encode
-						hasil=hasil+"\r\n\r\n".encode()
-						logging.warning("balas ke  client: {}" . format(hasil))
-						#hasil sudah dalam bentuk bytes
-						self.connection.sendall(hasil)
-						rcv=""
-						self.connection.close()
-				else:
-					break
-			except OSError as e:
-				pass
-		self.connection.close()
+		#request dibaca dan diproses sebagai bytes oleh handle_connection,
+		#termasuk body, keep-alive dan rate limiting
+		handle_connection(self.connection, self.address, httpserver, limiter)
 
 
 
@@ -66,6 +48,10 @@ class Server(threading.Thread):
 
 
 def main():
+	global limiter
+	parser = argparse.ArgumentParser(description='HTTP server with one thread per connection')
+	rate_limit.add_arguments(parser)
+	limiter = rate_limit.from_args(parser.parse_args())
 	svr = Server()
 	svr.start()
 
@@ -6,85 +6,131 @@ import time
 import sys
 import logging
 import ssl
+import argparse
+from concurrent.futures import ThreadPoolExecutor
 
 
 
 
 from http import HttpServer
+from http_connection import handle_connection, close_connection
+from tls_connection import TLSConnection, TLSMetrics
+import rate_limit
+from memory_budget import MemoryBudget
 
 httpserver = HttpServer()
+#rate limiting per client hanya aktif dengan --rate-limit
+limiter = None
+budget = MemoryBudget()
 
 
-class ProcessTheClient(threading.Thread):
-	def __init__(self, connection, address):
-		self.connection = connection
-		self.address = address
-		threading.Thread.__init__(self)
+HANDSHAKE_TIMEOUT = 10.0
 
-	def run(self):
-		rcv=""
-		while True:
-			try:
-				data = self.connection.recv(32)
-				if data:
-					#merubah input dari socket (berupa bytes) ke dalam string
-					#agar bisa mendeteksi \r\n
-					d = data.decode()
-					rcv=rcv+d
-					if rcv[-2:]=='\r\n':
-						#end of command, proses string
-						logging.warning("data dari client: {}" . format(rcv))
-						hasil = httpserver.proses(rcv)
-						#hasil akan berupa bytes
-						#untuk bisa ditambahi dengan string, maka string harus di encode
-						hasil=hasil+"\r\n\r\n".encode()
-						logging.warning("balas ke  client: {}" . format(hasil))
-						#hasil sudah dalam bentuk bytes
-						self.connection.sendall(hasil)
-						rcv=""
-						self.connection.close()
-				else:
-					break
-			except OSError as e:
-				pass
-		self.connection.close()
+
+def ProcessTheClient(connection, address, context, metrics):
+	#handshake dilakukan di worker, bukan di accept loop
+	#sehingga handshake yang lambat tidak menahan koneksi baru
+	try:
+		connection.settimeout(HANDSHAKE_TIMEOUT)
+		secure_connection = TLSConnection(connection, context, metrics)
+		secure_connection.do_handshake()
+	except (ssl.SSLError, OSError) as e:
+		logging.warning("handshake with {} failed: {}".format(address, str(e)))
+		close_connection(connection)
+		return
+	handle_connection(secure_connection, address, httpserver, limiter, budget)
 
 
 
 class Server(threading.Thread):
-	def __init__(self,hostname='testing.net'):
-		self.the_clients = []
+	def __init__(self,hostname='testing.net',max_workers=None,
+				 session_tickets=True,num_tickets=2,ticket_key_lifetime=3600,
+				 alpn_protocols=('http/1.1',),stats_interval=60):
+		self.max_workers = max_workers or os.cpu_count() * 8
 #------------------------------
 		self.hostname = hostname
-		cert_location = os.getcwd() + '/certs/'
-		self.context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
-		self.context.load_cert_chain(certfile=cert_location + 'domain.crt',
-									 keyfile=cert_location + 'domain.key')
+		self.cert_location = os.getcwd() + '/certs/'
+		self.session_tickets = session_tickets
+		self.num_tickets = num_tickets
+		#kunci session ticket dibuat per SSLContext oleh OpenSSL,
+		#rotasi dilakukan dengan membuat context baru secara berkala
+		self.ticket_key_lifetime = ticket_key_lifetime
+		self.alpn_protocols = list(alpn_protocols)
+		self.context = self.make_context()
+		self.context_created = time.monotonic()
+		self.metrics = TLSMetrics()
+		self.stats_interval = stats_interval
 #---------------------------------
 		self.my_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
 		self.my_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+		#membatasi koneksi yang sedang menunggu/diproses,
+		#sisanya tertahan di backlog kernel
+		self.slots = threading.BoundedSemaphore(self.max_workers * 2)
 		threading.Thread.__init__(self)
 
+	def make_context(self):
+		context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+		context.load_cert_chain(certfile=self.cert_location + 'domain.crt',
+								keyfile=self.cert_location + 'domain.key')
+		context.minimum_version = ssl.TLSVersion.TLSv1_2
+		#TLS 1.2 hanya ECDHE (TLS 1.3 selalu ephemeral)
+		context.set_ciphers('ECDHE+AESGCM:ECDHE+CHACHA20')
+		context.set_ecdh_curve('prime256v1')
+		context.options |= ssl.OP_CIPHER_SERVER_PREFERENCE
+		if self.session_tickets:
+			context.num_tickets = self.num_tickets
+		else:
+			context.options |= ssl.OP_NO_TICKET
+			context.num_tickets = 0
+		if self.alpn_protocols:
+			context.set_alpn_protocols(self.alpn_protocols)
+		return context
+
+	def current_context(self):
+		if self.ticket_key_lifetime and time.monotonic() - self.context_created > self.ticket_key_lifetime:
+			self.context = self.make_context()
+			self.context_created = time.monotonic()
+			logging.warning("session ticket keys rotated")
+		return self.context
+
+	def report_stats(self):
+		while True:
+			time.sleep(self.stats_interval)
+			logging.warning("tls stats: {}".format(self.metrics.snapshot()))
+
+	def release_slot(self, future):
+		self.slots.release()
+
 	def run(self):
 		self.my_socket.bind(('0.0.0.0', 8443))
-		self.my_socket.listen(1)
-		while True:
-			self.connection, self.client_address = self.my_socket.accept()
-			try:
-				self.secure_connection = self.context.wrap_socket(self.connection, server_side=True)
-				logging.warning("connection from {}".format(self.client_address))
-				clt = ProcessTheClient(self.secure_connection, self.client_address)
-				clt.start()
-				self.the_clients.append(clt)
-			except ssl.SSLError as essl:
-				print(str(essl))
+		self.my_socket.listen(1000)
+		if self.stats_interval:
+			threading.Thread(target=self.report_stats, daemon=True).start()
+		with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+			while True:
+				self.slots.acquire()
+				try:
+					connection, client_address = self.my_socket.accept()
+				except OSError:
+					self.slots.release()
+					continue
+				logging.warning("connection from {}".format(client_address))
+				future = executor.submit(ProcessTheClient, connection, client_address,
+										 self.current_context(), self.metrics)
+				future.add_done_callback(self.release_slot)
 
 
 
 
 def main():
+	global limiter
+	parser = argparse.ArgumentParser(description='HTTPS server with pooled TLS handshakes')
+	rate_limit.add_arguments(parser)
+	args = parser.parse_args()
+	limiter = rate_limit.from_args(args)
 	svr = Server()
 	svr.start()
+	svr.join()
 
 if __name__=="__main__":
 	main()
@@ -2,65 +2,69 @@ from socket import *
 import socket
 import logging
 import time
+import argparse
+import threading
+import itertools
 from concurrent.futures import ThreadPoolExecutor
 from http import HttpServer
+from http_connection import (read_head, buffer_and_process, send_response, BodyReader, HeaderTooLarge,
+                             header_too_large, KEEPALIVE_TIMEOUT)
+from reactor import Reactor, REACTOR_BODY_LIMIT
+import rate_limit
+from rate_limit import too_many_requests
+from durability import DURABILITY_MODES
+from checksum import ALGORITHMS
+from content_coding import MAX_RATIO, MAX_OUTPUT
+from memory_budget import MemoryBudget, BUDGET_POLICIES, DEFAULT_BUDGET, DEFAULT_WAIT_TIMEOUT
+from request_scheduler import RequestScheduler, classify, INTERACTIVE, BULK, BULK_THRESHOLD
 import os
 
 httpserver = HttpServer()
+# Per-client rate limiting is opt-in (--rate-limit)
+limiter = None
+budget = MemoryBudget()
 
-def ProcessTheClient(connection, address):
+# Connections wait for their next request head in head_pool; each request is
+# then served by the pool of its class (see request_scheduler.classify)
+head_pool = None
+scheduler = None
+bulk_threshold = BULK_THRESHOLD
+
+# Multi-reactor mode (--reactors N): heads and small bodies are read by N
+# epoll reactor threads instead of head_pool, so idle connections cost no thread
+reactors = []
+next_reactor = None
+
+def close_client(connection):
     try:
-        connection.settimeout(240.0)
-        start_time = time.time()
-        print(f"Processing client {address}")
-        
-        # Receive request headers first
-        headers_data = b""
-        while b"\r\n\r\n" not in headers_data:
-            chunk = connection.recv(1024*1024)
-            if not chunk:
-                raise ConnectionError("Client disconnected during headers")
-            headers_data += chunk
-        
-        # Parse headers to get content length
-        headers_str = headers_data[:headers_data.find(b"\r\n\r\n")].decode('utf-8')
-        content_length = 0
-        
-        for line in headers_str.split('\r\n'):
-            if line.lower().startswith('content-length:'):
-                content_length = int(line.split(':')[1].strip())
-                break
-        
-        # Get body data (what we already received after headers)
-        body_start = headers_data.find(b"\r\n\r\n") + 4
-        body_data = headers_data[body_start:]
-        
-        # Receive remaining body if needed
-        while len(body_data) < content_length:
-            remaining = content_length - len(body_data)
-            chunk = connection.recv(min(8192, remaining))
-            if not chunk:
-                raise ConnectionError("Client disconnected during body")
-            body_data += chunk
-        
-        # Reconstruct complete request
-        complete_request = headers_data[:body_start] + body_data
-        
-        print(f"Received {len(complete_request)} bytes from {address}")
-        
-        # Process request
-        response = httpserver.proses(complete_request)
-        if isinstance(response, str):
-            response = response.encode()
-        
-        # Send response
-        connection.sendall(response)
-        print(f"Sent response to {address}")
+        connection.shutdown(socket.SHUT_RDWR)
+    except:
+        pass
+    try:
+        connection.close()
+    except:
+        pass
+
+def ReadRequestHead(connection, address, start_time):
+    try:
+        head, body_start = read_head(connection)
+        if head is None:
+            close_client(connection)
+            return
+        request_class = classify(head, bulk_threshold)
+        scheduler.submit(request_class, ProcessTheRequest, connection, address, head, body_start, start_time)
+
+    except HeaderTooLarge:
+        try:
+            connection.sendall(header_too_large())
+        except OSError:
+            pass
+        close_client(connection)
 
     except socket.timeout:
         print(f"Timeout processing {address} after {time.time()-start_time:.2f}s")
-        raise
-        
+        close_client(connection)
+
     except Exception as e:
         print(f"Error processing client {address}: {str(e)}")
         try:
@@ -68,43 +72,220 @@ def ProcessTheClient(connection, address):
             connection.sendall(error_response)
         except:
             pass
-    finally:
+        close_client(connection)
+
+def ProcessTheRequest(connection, address, head, body_start, start_time):
+    keep_alive = False
+    try:
+        connection.settimeout(240.0)
+
+        # Reject over-limit clients before receiving their body
+        if limiter is not None:
+            key = limiter.client_key(address, head.headers)
+            allowed, retry_after = limiter.acquire(key, head.content_length)
+            if not allowed:
+                print(f"Rate limited {key}, retry after {retry_after}s")
+                connection.sendall(too_many_requests(retry_after))
+                return
+
         try:
-            connection.shutdown(socket.SHUT_RDWR)
-        except:
-            pass
+            if httpserver.streams(head):
+                # Upload and batch bodies are consumed as they arrive
+                response = httpserver.proses_stream(head, BodyReader(connection, head, body_start))
+            else:
+                # Whole request in memory, within the server-wide budget
+                response = buffer_and_process(connection, head, body_start, httpserver, budget)
+        finally:
+            if limiter is not None:
+                limiter.release(key)
+
+        # Send response, keep serving the connection only if the client asked for keep-alive
+        keep_alive = send_response(connection, response)
+        print(f"Sent response to {address}")
+
+    except socket.timeout:
+        print(f"Timeout processing {address} after {time.time()-start_time:.2f}s")
+
+    except Exception as e:
+        print(f"Error processing client {address}: {str(e)}")
         try:
-            connection.close()
+            error_response = b"HTTP/1.1 500 Internal Server Error\r\n\r\nServer Error"
+            connection.sendall(error_response)
         except:
             pass
+    finally:
+        if keep_alive:
+            resume_connection(connection, address)
+        else:
+            close_client(connection)
+
+def resume_connection(connection, address):
+    """Wait for the next request on a keep-alive connection"""
+    if reactors:
+        next(next_reactor).adopt(connection, address)
+    else:
+        connection.settimeout(KEEPALIVE_TIMEOUT)
+        head_pool.submit(ReadRequestHead, connection, address, time.time())
+
+def buffered_in_reactor(head):
+    return not httpserver.streams(head) and head.content_length <= REACTOR_BODY_LIMIT
+
+def DispatchFromReactor(reactor, conn, head, data, complete):
+    """Called on a reactor thread: run the request on its class pool, never here"""
+    if complete:
+        fn, args = ProcessBufferedRequest, (reactor, conn, head, data)
+    else:
+        # Streamed, large or over-budget bodies are read by the worker in blocking mode
+        conn.sock.settimeout(240.0)
+        fn, args = ProcessTheRequest, (conn.sock, conn.address, head, data, time.time())
+    # No file stats on the reactor thread: GETs whose size decides their
+    # class are sorted by an interactive worker
+    request_class = classify(head, bulk_threshold, stat_files=False)
+    if request_class == INTERACTIVE and head.method == 'GET':
+        scheduler.submit(INTERACTIVE, ClassifyAndProcess, head, fn, *args)
+    else:
+        scheduler.submit(request_class, fn, *args)
+
+def ClassifyAndProcess(head, fn, *args):
+    """Stat the requested file, then serve here or move the request to the bulk pool"""
+    if classify(head, bulk_threshold) == BULK:
+        scheduler.submit(BULK, fn, *args)
+    else:
+        fn(*args)
+
+def ProcessBufferedRequest(reactor, conn, head, request):
+    """Disk work for a request the reactor already read; the reactor sends the response"""
+    if limiter is not None:
+        key = limiter.client_key(conn.address, head.headers)
+        allowed, retry_after = limiter.acquire(key, head.content_length)
+        if not allowed:
+            print(f"Rate limited {key}, retry after {retry_after}s")
+            reactor.respond(conn, too_many_requests(retry_after))
+            return
+    try:
+        response = httpserver.proses(request)
+    except Exception as e:
+        print(f"Error processing client {conn.address}: {str(e)}")
+        response = b"HTTP/1.1 500 Internal Server Error\r\n\r\nServer Error"
+    finally:
+        if limiter is not None:
+            limiter.release(key)
+    reactor.respond(conn, response)
+
+def report_stats(interval):
+    while True:
+        time.sleep(interval)
+        logging.warning(f"scheduler stats: {scheduler.stats()}")
+        logging.warning(f"durability stats: {httpserver.durability.stats()}")
+        logging.warning(f"memory budget: {budget.stats()}")
+        if reactors:
+            logging.warning(f"reactors: {[reactor.stats() for reactor in reactors]}")
 
-def Server():
+def listening_socket(reuse_port=False):
     my_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
     my_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    if reuse_port:
+        my_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
     my_socket.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 8 * 1024 * 1024)  # 1MB receive buffer
     my_socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
     my_socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_FASTOPEN, 5)
     my_socket.setsockopt(socket.SOL_TCP, socket.TCP_NODELAY, 1)
-    
+
     my_socket.bind(('0.0.0.0', 8885))
     my_socket.listen(5000)  # Increased backlog
-    
-    print("Thread Pool Server listening on port 8885...")
-    
-    with ThreadPoolExecutor(max_workers=os.cpu_count() * 50) as executor:
-        try:
+    return my_socket
+
+def Server(interactive_workers=None, bulk_workers=None, stats_interval=60, reactor_count=0):
+    global head_pool, scheduler, next_reactor
+    if reactor_count:
+        # Reactors do the waiting, so the pools only need enough threads for disk work
+        interactive_workers = interactive_workers or os.cpu_count() * 4
+        bulk_workers = bulk_workers or os.cpu_count() * 2
+    else:
+        head_pool = ThreadPoolExecutor(max_workers=os.cpu_count() * 50, thread_name_prefix='head')
+    scheduler = RequestScheduler({
+        INTERACTIVE: interactive_workers or os.cpu_count() * 32,
+        BULK: bulk_workers or os.cpu_count() * 4,
+    })
+    if stats_interval:
+        threading.Thread(target=report_stats, args=(stats_interval,), daemon=True).start()
+
+    # With SO_REUSEPORT every reactor gets its own listener and the kernel
+    # spreads connections; otherwise this thread accepts and deals them out
+    reuse_port = reactor_count > 0 and hasattr(socket, 'SO_REUSEPORT')
+    listeners = [listening_socket(reuse_port) for _ in range(reactor_count if reuse_port else 1)]
+    for index in range(reactor_count):
+        listener = listeners[index] if reuse_port else None
+        reactors.append(Reactor(DispatchFromReactor, buffered_in_reactor, listener,
+                                name=f'reactor-{index}', budget=budget))
+    next_reactor = itertools.cycle(reactors)
+    for reactor in reactors:
+        reactor.start()
+
+    if reactors:
+        print(f"Thread Pool Server listening on port 8885 with {reactor_count} reactors...")
+    else:
+        print("Thread Pool Server listening on port 8885...")
+
+    try:
+        if reuse_port:
             while True:
-                connection, client_address = my_socket.accept()
-                print(f"Accepted connection from {client_address}")
-                executor.submit(ProcessTheClient, connection, client_address)
-        except KeyboardInterrupt:
-            print("Server shutting down...")
-        finally:
-            my_socket.close()
+                time.sleep(3600)
+        while True:
+            connection, client_address = listeners[0].accept()
+            print(f"Accepted connection from {client_address}")
+            if reactors:
+                next(next_reactor).adopt(connection, client_address)
+                continue
+            connection.settimeout(240.0)
+            head_pool.submit(ReadRequestHead, connection, client_address, time.time())
+    except KeyboardInterrupt:
+        print("Server shutting down...")
+    finally:
+        for listener in listeners:
+            listener.close()
+        if head_pool is not None:
+            head_pool.shutdown(wait=False)
+        scheduler.shutdown()
 
 def main():
+    global bulk_threshold, budget, limiter
     logging.basicConfig(level=logging.WARNING)
-    Server()
+    parser = argparse.ArgumentParser(description='Thread pool HTTP server with per-class worker pools')
+    parser.add_argument('--interactive-workers', type=int, help='workers for small requests (default 32 per CPU)')
+    parser.add_argument('--bulk-workers', type=int, help='workers for large transfers (default 4 per CPU)')
+    parser.add_argument('--bulk-threshold', type=int, default=BULK_THRESHOLD,
+                        help='body or file size in bytes from which a request is bulk')
+    parser.add_argument('--durability', choices=DURABILITY_MODES, default='none',
+                        help='how uploads are made durable before they are acknowledged')
+    parser.add_argument('--checksum', choices=sorted(ALGORITHMS) + ['none'], default='none',
+                        help='checksum computed for every upload and returned on GET')
+    parser.add_argument('--store-compressed', action='store_true',
+                        help='keep gzip uploads as received and serve them to clients accepting gzip')
+    parser.add_argument('--max-decoded-ratio', type=int, default=MAX_RATIO,
+                        help='largest compression ratio accepted for Content-Encoding uploads')
+    parser.add_argument('--max-decoded-size', type=int, default=MAX_OUTPUT // (1024 * 1024),
+                        help='MB a Content-Encoding upload may decompress to')
+    parser.add_argument('--memory-budget', type=int, default=DEFAULT_BUDGET // (1024 * 1024),
+                        help='MB of request bodies buffered in memory at once')
+    parser.add_argument('--budget-policy', choices=BUDGET_POLICIES, default='wait',
+                        help='what happens to requests that do not fit the memory budget')
+    parser.add_argument('--budget-wait-timeout', type=float, default=DEFAULT_WAIT_TIMEOUT,
+                        help='seconds a request may wait for budget before getting 503')
+    rate_limit.add_arguments(parser)
+    parser.add_argument('--reactors', type=int, default=0,
+                        help='serve connections from N epoll reactor threads instead of one thread per waiting connection')
+    parser.add_argument('--stats-interval', type=int, default=60, help='seconds between scheduler stats, 0 disables')
+    args = parser.parse_args()
+    bulk_threshold = args.bulk_threshold
+    httpserver.durability.mode = args.durability
+    httpserver.checksum_algorithm = None if args.checksum == 'none' else args.checksum
+    httpserver.store_compressed = args.store_compressed
+    httpserver.max_decoded_ratio = args.max_decoded_ratio
+    httpserver.max_decoded_size = args.max_decoded_size * 1024 * 1024
+    budget = MemoryBudget(args.memory_budget * 1024 * 1024, args.budget_policy, args.budget_wait_timeout)
+    limiter = rate_limit.from_args(args)
+    Server(args.interactive_workers, args.bulk_workers, args.stats_interval, args.reactors)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -3,64 +3,622 @@ import socket
 import threading
 import time
 import sys
+import os
+import selectors
 import logging
+import argparse
+from backend_pool import BackendPool, UpstreamPool, STRATEGIES
+from proxy_cache import ResponseCache
+import rate_limit
+from rate_limit import too_many_requests
+from http_connection import (read_head, rewrite_connection_header, close_connection, ResponseHead, HeaderTooLarge,
+                             header_too_large, KEEPALIVE_TIMEOUT)
 
 
+RELAY_BUFSIZE = 256 * 1024
+#batas data yang ditahan per arah sebelum berhenti membaca (backpressure)
+MAX_PENDING = 1024 * 1024
+IDLE_TIMEOUT = 240.0
+USE_SPLICE = hasattr(os, 'splice') and sys.platform.startswith('linux')
+CONNECT_TIMEOUT = 3.0
+MAX_REQUEST_LINE = 8192
+MAX_RETRIES = 3
+#thread pool server dan process pool server
+DEFAULT_BACKENDS = [('localhost', 8885), ('localhost', 8889)]
+
+
+class Direction:
+	"""Copies bytes from src to dst through a userspace buffer"""
+	def __init__(self, src, dst):
+		self.src = src
+		self.dst = dst
+		self.buffer = bytearray()
+		self.eof = False
+		self.done = False
+		self.total = 0
+
+	def want_read(self):
+		return not self.eof and len(self.buffer) < MAX_PENDING
+
+	def want_write(self):
+		return len(self.buffer) > 0
+
+	def on_readable(self):
+		try:
+			data = self.src.recv(RELAY_BUFSIZE)
+		except BlockingIOError:
+			return
+		if data:
+			self.buffer += data
+		else:
+			self.eof = True
+
+	def on_writable(self):
+		try:
+			sent = self.dst.send(self.buffer)
+		except BlockingIOError:
+			return
+		del self.buffer[:sent]
+		self.total += sent
+
+	def finish(self):
+		#sisi src sudah EOF dan semua data terkirim: teruskan half-close ke dst
+		if self.eof and not self.want_write() and not self.done:
+			self.done = True
+			try:
+				self.dst.shutdown(socket.SHUT_WR)
+			except OSError:
+				pass
+
+	def close(self):
+		pass
+
+
+class SpliceDirection(Direction):
+	"""Copies bytes from src to dst inside the kernel with os.splice through a pipe"""
+	def __init__(self, src, dst):
+		Direction.__init__(self, src, dst)
+		self.pipe_r, self.pipe_w = os.pipe()
+		self.capacity = 64 * 1024
+		try:
+			import fcntl
+			self.capacity = fcntl.fcntl(self.pipe_w, fcntl.F_SETPIPE_SZ, MAX_PENDING)
+		except (ImportError, AttributeError, OSError):
+			pass
+		self.pending = 0
+		self.flags = os.SPLICE_F_MOVE | os.SPLICE_F_NONBLOCK
+
+	def want_read(self):
+		return not self.eof and self.pending < self.capacity
+
+	def want_write(self):
+		return self.pending > 0
+
+	def on_readable(self):
+		try:
+			moved = os.splice(self.src.fileno(), self.pipe_w, self.capacity - self.pending, flags=self.flags)
+		except BlockingIOError:
+			return
+		if moved:
+			self.pending += moved
+		else:
+			self.eof = True
+
+	def on_writable(self):
+		try:
+			moved = os.splice(self.pipe_r, self.dst.fileno(), self.pending, flags=self.flags)
+		except BlockingIOError:
+			return
+		self.pending -= moved
+		self.total += moved
+
+	def close(self):
+		os.close(self.pipe_r)
+		os.close(self.pipe_w)
+
+
+class Relay:
+	"""Copies both directions independently until both sides have half-closed"""
+	def __init__(self, client, upstream, timeout=IDLE_TIMEOUT):
+		direction_class = SpliceDirection if USE_SPLICE else Direction
+		self.client = client
+		self.upstream = upstream
+		self.timeout = timeout
+		self.to_upstream = direction_class(client, upstream)
+		self.to_client = direction_class(upstream, client)
+
+	def run(self):
+		client, upstream = self.client, self.upstream
+		to_upstream, to_client = self.to_upstream, self.to_client
+		client.setblocking(False)
+		upstream.setblocking(False)
+
+		selector = selectors.DefaultSelector()
+		registered = {}
+		try:
+			while not (to_upstream.done and to_client.done):
+				for sock, outgoing, incoming in ((client, to_upstream, to_client), (upstream, to_client, to_upstream)):
+					events = 0
+					if outgoing.want_read():
+						events |= selectors.EVENT_READ
+					if incoming.want_write():
+						events |= selectors.EVENT_WRITE
+					if events == registered.get(sock, 0):
+						continue
+					if not events:
+						selector.unregister(sock)
+					elif registered.get(sock):
+						selector.modify(sock, events)
+					else:
+						selector.register(sock, events)
+					registered[sock] = events
+
+				ready = selector.select(self.timeout)
+				if not ready:
+					raise TimeoutError("relay idle for {}s".format(self.timeout))
+				for key, mask in ready:
+					if key.fileobj is client:
+						outgoing, incoming = to_upstream, to_client
+					else:
+						outgoing, incoming = to_client, to_upstream
+					if mask & selectors.EVENT_READ:
+						outgoing.on_readable()
+					if mask & selectors.EVENT_WRITE:
+						incoming.on_writable()
+				to_upstream.finish()
+				to_client.finish()
+		finally:
+			selector.close()
+			to_upstream.close()
+			to_client.close()
+
+
+def read_request_line(connection):
+	"""Receive at least the request line so the path can be used for routing"""
+	data = b""
+	while b"\r\n" not in data and len(data) < MAX_REQUEST_LINE:
+		chunk = connection.recv(RELAY_BUFSIZE)
+		if not chunk:
+			break
+		data += chunk
+	request_line = data.split(b"\r\n", 1)[0].split(b" ")
+	path = request_line[1].decode('latin-1') if len(request_line) > 1 else '/'
+	return data, path
+
+
+def error_response(kode, message):
+	return (
+		f"HTTP/1.1 {kode} {message}\r\n"
+		f"Connection: close\r\n"
+		f"Content-Length: {len(message)}\r\n\r\n{message}"
+	).encode()
+
+
+def read_body(src, length, body=b""):
+	"""Receive a Content-Length body into memory, body holds bytes already read"""
+	body = bytearray(body[:length])
+	while len(body) < length:
+		chunk = src.recv(min(RELAY_BUFSIZE, length - len(body)))
+		if not chunk:
+			raise ConnectionError("Peer closed with {} body bytes outstanding".format(length - len(body)))
+		body += chunk
+	return bytes(body)
+
+
+def copy_body(src, dst, length, buffer):
+	"""Stream length bytes (or until EOF when length is None) from src to dst through a reused buffer"""
+	view = memoryview(buffer)
+	remaining = length
+	while remaining is None or remaining > 0:
+		want = len(buffer) if remaining is None else min(len(buffer), remaining)
+		nbytes = src.recv_into(view[:want])
+		if not nbytes:
+			if remaining is None:
+				break
+			raise ConnectionError("Peer closed with {} body bytes outstanding".format(remaining))
+		dst.sendall(view[:nbytes])
+		if remaining is not None:
+			remaining -= nbytes
+
+
+def copy_chunked(src, dst, body, buffer):
+	"""Relay a chunked body from src to dst unchanged, stopping after the last chunk and trailers
+
+	body holds bytes already read. Chunk sizes are only parsed to find where
+	the body ends, so the upstream connection can be reused afterwards.
+	"""
+	data = bytearray(body)
+
+	def read_line():
+		while True:
+			line_end = data.find(b"\r\n")
+			if line_end >= 0:
+				line = bytes(data[:line_end])
+				dst.sendall(data[:line_end + 2])
+				del data[:line_end + 2]
+				return line
+			if len(data) > MAX_REQUEST_LINE:
+				raise ValueError("Chunk size line too long")
+			chunk = src.recv(RELAY_BUFSIZE)
+			if not chunk:
+				raise ConnectionError("Peer closed inside a chunked body")
+			data.extend(chunk)
+
+	while True:
+		size = int(read_line().split(b";", 1)[0].strip(), 16)
+		if size == 0:
+			break
+		#data chunk beserta CRLF penutupnya
+		needed = size + 2
+		available = min(needed, len(data))
+		dst.sendall(data[:available])
+		del data[:available]
+		if needed > available:
+			copy_body(src, dst, needed - available, buffer)
+	#trailer diakhiri baris kosong
+	while read_line():
+		pass
+
 
 class ProcessTheClient(threading.Thread):
-	def __init__(self, connection, address, destination_sock_address):
-		self.destination_sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-		self.destination_sock.connect(destination_sock_address)
+	def __init__(self, connection, address, backend_pool, upstream_pool=None, cache=None, limiter=None):
 		self.connection = connection
 		self.address = address
+		self.backend_pool = backend_pool
+		self.upstream_pool = upstream_pool
+		self.cache = cache
+		self.limiter = limiter
 		threading.Thread.__init__(self)
 
 	def run(self):
-		rcv=""
+		if self.upstream_pool is not None:
+			self.run_http()
+			return
+		if self.limiter is None:
+			self.run_tcp()
+			return
+
+		#mode tcp tidak membaca header, batasi per alamat IP
+		key = self.limiter.client_key(self.address)
+		allowed, retry_after = self.limiter.acquire(key)
+		if not allowed:
+			try:
+				self.connection.sendall(too_many_requests(retry_after))
+			except OSError:
+				pass
+			close_connection(self.connection)
+			return
+		try:
+			self.run_tcp()
+		finally:
+			self.limiter.release(key)
+
+	def connect_upstream(self, path):
+		"""Try backends in selection order until one accepts the connection"""
+		tried = []
 		while True:
+			backend = self.backend_pool.choose(path, exclude=tried)
+			if backend is None:
+				return None, None
 			try:
-				data = self.connection.recv(8192)
-				if data:
-					self.destination_sock.sendall(data)
-					data_balasan = self.destination_sock.recv(8192)
-					self.connection.sendall(data_balasan)
-					logging.warning(data)
-					logging.warning(data_balasan)
+				upstream = socket.create_connection(backend.address, timeout=CONNECT_TIMEOUT)
+				return backend, upstream
+			except OSError as e:
+				logging.warning("connect to {} failed: {}".format(backend, str(e)))
+				self.backend_pool.release(backend)
+				self.backend_pool.mark_failure(backend)
+				tried.append(backend)
+
+	def run_tcp(self):
+		"""Opaque byte relay: one upstream connection per client connection"""
+		try:
+			self.connection.settimeout(IDLE_TIMEOUT)
+			first_data, path = read_request_line(self.connection)
+			if not first_data:
+				self.connection.close()
+				return
+			backend, upstream = self.connect_upstream(path)
+			if upstream is None:
+				self.connection.sendall(error_response(503, 'Service Unavailable'))
+				self.connection.close()
+				return
+		except OSError as e:
+			logging.warning("client {} failed: {}".format(self.address, str(e)))
+			self.connection.close()
+			return
+
+		relay = Relay(self.connection, upstream)
+		try:
+			upstream.sendall(first_data)
+			relay.run()
+			self.backend_pool.mark_success(backend)
+		except OSError as e:
+			logging.warning("relay {} via {} stopped: {}".format(self.address, backend, str(e)))
+			if relay.to_client.total == 0:
+				#backend gagal sebelum mengirim respon apapun
+				self.backend_pool.mark_failure(backend)
+				try:
+					self.connection.setblocking(True)
+					self.connection.sendall(error_response(502, 'Bad Gateway'))
+				except OSError:
+					pass
+		finally:
+			self.backend_pool.release(backend)
+			upstream.close()
+			self.connection.close()
 
+	def run_http(self):
+		"""HTTP-aware proxying over pooled keep-alive upstream connections"""
+		self.buffer = bytearray(RELAY_BUFSIZE)
+		try:
+			self.connection.settimeout(IDLE_TIMEOUT)
+			leftover = b""
+			while True:
+				try:
+					head, leftover = read_head(self.connection, leftover)
+				except HeaderTooLarge:
+					self.connection.sendall(header_too_large())
+					break
+				if head is None:
+					break
+				#timeout keep-alive hanya untuk menunggu request berikutnya
+				self.connection.settimeout(IDLE_TIMEOUT)
+				if self.limiter is None:
+					keep_alive = self.forward(head, leftover[:head.content_length])
 				else:
+					key = self.limiter.client_key(self.address, head.headers)
+					allowed, retry_after = self.limiter.acquire(key, head.content_length)
+					if not allowed:
+						self.connection.sendall(too_many_requests(retry_after))
+						break
+					try:
+						keep_alive = self.forward(head, leftover[:head.content_length])
+					finally:
+						self.limiter.release(key)
+				if not keep_alive:
 					break
+				leftover = leftover[head.content_length:]
+				self.connection.settimeout(KEEPALIVE_TIMEOUT)
+		except socket.timeout:
+			pass
+		except (OSError, ValueError) as e:
+			logging.warning("client {} failed: {}".format(self.address, str(e)))
+		finally:
+			close_connection(self.connection)
+
+	def forward(self, head, body_start):
+		"""Answer one client request, return True to keep the client connection"""
+		if self.cache is not None and head.method == 'GET' and head.content_length == 0 and 'range' not in head.headers:
+			return self.forward_cached(head)
+
+		#upstream selalu keep-alive, walaupun client meminta Connection: close
+		request_head = rewrite_connection_header(head.raw, 'keep-alive')
+		result = self.exchange(head, request_head, body_start)
+		if result is None:
+			return False
+		backend, upstream, response, body = result
+		keep_alive = self.stream_response(head, backend, upstream, response, body)
+
+		if self.cache is not None and head.method != 'GET':
+			self.invalidate_after_write(head)
+		return keep_alive
+
+	def exchange(self, head, request_head, body_start):
+		"""Send a request upstream, retrying other backends where safe
+
+		Returns (backend, upstream, response head, body bytes already read),
+		or None after answering the client with 502/503.
+		"""
+		replayable = len(body_start) == head.content_length
+		tried = []
+		attempts = 0
+		while True:
+			backend = self.backend_pool.choose(head.path, exclude=tried)
+			if backend is None:
+				self.connection.sendall(error_response(503, 'Service Unavailable'))
+				return None
+			attempts += 1
+			try:
+				upstream = self.upstream_pool.get(backend)
 			except OSError as e:
-				pass
-		self.connection.close()
+				logging.warning("connect to {} failed: {}".format(backend, str(e)))
+				self.backend_pool.release(backend)
+				self.backend_pool.mark_failure(backend)
+				tried.append(backend)
+				continue
+
+			try:
+				upstream.sock.settimeout(IDLE_TIMEOUT)
+				upstream.sock.sendall(request_head + body_start)
+				if not replayable:
+					copy_body(self.connection, upstream.sock, head.content_length - len(body_start), self.buffer)
+				response, body = read_head(upstream.sock, head_class=ResponseHead)
+				if response is None:
+					raise ConnectionError("Upstream closed before responding")
+				return backend, upstream, response, body
+			except OSError as e:
+				self.upstream_pool.discard(upstream)
+				self.backend_pool.release(backend)
+				if replayable and upstream.reused and attempts <= MAX_RETRIES:
+					#koneksi idle bisa saja sudah ditutup backend, coba lagi
+					continue
+				logging.warning("request {} via {} failed: {}".format(head.path, backend, str(e)))
+				self.backend_pool.mark_failure(backend)
+				if replayable:
+					tried.append(backend)
+					continue
+				self.connection.sendall(error_response(502, 'Bad Gateway'))
+				return None
+
+	def finish_upstream(self, backend, upstream, response):
+		"""Return a fully read upstream connection to the pool if it can be reused"""
+		backend.supports_keep_alive = response.keep_alive
+		if response.keep_alive:
+			self.upstream_pool.put(upstream)
+		else:
+			self.upstream_pool.discard(upstream)
+		self.backend_pool.mark_success(backend)
+		self.backend_pool.release(backend)
+
+	def abort_upstream(self, backend, upstream):
+		self.upstream_pool.discard(upstream)
+		self.backend_pool.release(backend)
+
+	def stream_response(self, head, backend, upstream, response, body, extra=()):
+		"""Stream an upstream response to the client without buffering it"""
+		try:
+			client_keep_alive = head.keep_alive and (response.content_length is not None or response.chunked)
+			client_head = rewrite_connection_header(response.raw, 'keep-alive' if client_keep_alive else 'close', extra)
+			if response.chunked:
+				self.connection.sendall(client_head)
+				copy_chunked(upstream.sock, self.connection, body, self.buffer)
+			else:
+				body = body if response.content_length is None else body[:response.content_length]
+				self.connection.sendall(client_head + body)
+				remaining = None if response.content_length is None else response.content_length - len(body)
+				copy_body(upstream.sock, self.connection, remaining, self.buffer)
+		except (OSError, ValueError):
+			self.abort_upstream(backend, upstream)
+			raise
+		self.finish_upstream(backend, upstream, response)
+		return client_keep_alive
+
+	def forward_cached(self, head):
+		"""Serve a GET from the cache, collapsing concurrent misses into one fetch"""
+		key = self.cache.key(head)
+		no_cache = 'no-cache' in self.cache.cache_control(head.headers)
+		entry = self.cache.get(key)
+		if entry is not None and entry.fresh(time.monotonic()) and not no_cache:
+			self.cache.record(hit=True)
+			return self.send_cached(head, entry, 'HIT')
+
+		leader, event = self.cache.begin_fetch(key)
+		if not leader:
+			event.wait(IDLE_TIMEOUT)
+			entry = self.cache.get(key)
+			if entry is not None and entry.fresh(time.monotonic()):
+				self.cache.record(hit=True)
+				return self.send_cached(head, entry, 'HIT')
+		try:
+			return self.fetch_into_cache(head, key, entry)
+		finally:
+			if leader:
+				self.cache.end_fetch(key)
+
+	def fetch_into_cache(self, head, key, entry):
+		extra = entry.conditional_headers() if entry is not None else ()
+		#validator milik client diganti validator cache
+		request_head = rewrite_connection_header(head.raw, 'keep-alive', extra,
+			drop=('if-none-match', 'if-modified-since') if extra else ())
+		result = self.exchange(head, request_head, b"")
+		if result is None:
+			return False
+		backend, upstream, response, body = result
+		self.cache.record(hit=False)
+
+		if response.status == 304 and entry is not None:
+			try:
+				read_body(upstream.sock, response.content_length or 0, body)
+			except OSError:
+				self.abort_upstream(backend, upstream)
+				raise
+			self.finish_upstream(backend, upstream, response)
+			self.cache.refresh(entry, response)
+			return self.send_cached(head, entry, 'REVALIDATED')
+
+		if not self.cache.cacheable(response):
+			self.cache.invalidate(key)
+			return self.stream_response(head, backend, upstream, response, body, ['X-Cache: MISS'])
+
+		try:
+			body = read_body(upstream.sock, response.content_length, body)
+		except OSError:
+			self.abort_upstream(backend, upstream)
+			raise
+		self.finish_upstream(backend, upstream, response)
+		entry = self.cache.put(key, response, body)
+		return self.send_cached(head, entry, 'MISS')
+
+	def send_cached(self, head, entry, status):
+		connection_value = 'keep-alive' if head.keep_alive else 'close'
+		if entry.etag and entry.etag in [tag.strip() for tag in head.headers.get('if-none-match', '').split(',')]:
+			self.connection.sendall((
+				f"HTTP/1.1 304 Not Modified\r\n"
+				f"ETag: {entry.etag}\r\n"
+				f"Content-Length: 0\r\n"
+				f"X-Cache: {status}\r\n"
+				f"Connection: {connection_value}\r\n\r\n"
+			).encode())
+			return head.keep_alive
+		response_head = rewrite_connection_header(entry.head.raw, connection_value, [f'X-Cache: {status}'])
+		self.connection.sendall(response_head + entry.body)
+		return head.keep_alive
+
+	def invalidate_after_write(self, head):
+		if head.method == 'DELETE':
+			self.cache.invalidate(f"GET {head.path}")
+			return
+		filename = head.headers.get('x-filename')
+		if filename:
+			self.cache.invalidate(f"GET /{os.path.basename(filename)}")
+		else:
+			#nama file multipart ada di body, hapus semua
+			self.cache.invalidate()
 
 
 
 class Server(threading.Thread):
-	def __init__(self):
-		self.the_clients = []
+	def __init__(self, backends=DEFAULT_BACKENDS, strategy='round_robin', portnumber=18000, mode='http', cache_size=0,
+				 limiter=None):
 		self.my_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
 		self.my_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+		self.portnumber = portnumber
 
-		self.destination_sock_address = ('localhost',8889)
+		self.backend_pool = BackendPool(backends, strategy=strategy)
+		self.upstream_pool = UpstreamPool(self.backend_pool) if mode == 'http' else None
+		#cache hanya bisa dipakai pada mode http
+		self.cache = ResponseCache(max_size=cache_size) if cache_size and self.upstream_pool else None
+		#None: tanpa rate limiting (default)
+		self.limiter = limiter
 		threading.Thread.__init__(self)
 
 	def run(self):
-		self.my_socket.bind(('0.0.0.0', 18000))
-		self.my_socket.listen(1)
+		self.backend_pool.start()
+		if self.upstream_pool:
+			self.upstream_pool.start()
+		self.my_socket.bind(('0.0.0.0', self.portnumber))
+		self.my_socket.listen(1000)
 		while True:
 			self.connection, self.client_address = self.my_socket.accept()
 			logging.warning("connection from {}".format(self.client_address))
 
-			clt = ProcessTheClient(self.connection, self.client_address,self.destination_sock_address)
+			clt = ProcessTheClient(self.connection, self.client_address, self.backend_pool,
+								   self.upstream_pool, self.cache, self.limiter)
+			clt.daemon = True
 			clt.start()
-			self.the_clients.append(clt)
 
 
 
+def parse_backend(value):
+	host, port = value.rsplit(':', 1)
+	return (host, int(port))
+
+
 def main():
-	svr = Server()
+	parser = argparse.ArgumentParser(description='Load-balancing reverse proxy')
+	parser.add_argument('backends', nargs='*', type=parse_backend, help='host:port of each backend')
+	parser.add_argument('--strategy', default='round_robin', choices=STRATEGIES)
+	parser.add_argument('--mode', default='http', choices=('http', 'tcp'),
+						help='http: pooled keep-alive upstreams, tcp: opaque full-duplex relay')
+	parser.add_argument('--port', type=int, default=18000)
+	parser.add_argument('--cache-size', type=int, default=0,
+						help='bytes of GET responses to cache in http mode, 0 disables caching')
+	rate_limit.add_arguments(parser)
+	args = parser.parse_args()
+
+	svr = Server(args.backends or DEFAULT_BACKENDS, args.strategy, args.port, args.mode, args.cache_size,
+				 rate_limit.from_args(args))
 	svr.start()
 
 if __name__=="__main__":
 	main()
-
@@ -0,0 +1,195 @@
+import os
+import mmap
+import struct
+import fcntl
+import hashlib
+import contextlib
+import tempfile
+import threading
+
+MAGIC = b'STATCACH'
+HEADER = struct.Struct('<8sQQQQ')      # magic, slots, data capacity, next write offset, inserts
+SLOT = struct.Struct('<QQQQQQQQ')      # seq, key, mtime_ns, size, offset, length, stamp, unused
+DEFAULT_CACHE_SIZE = 64 * 1024 * 1024
+DEFAULT_SLOTS = 4096
+MAX_OBJECT_SIZE = 1024 * 1024
+PROBES = 8
+ALIGN = 64
+
+
+def default_path(name):
+    # /dev/shm keeps the backing file in memory on Linux
+    directory = '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir()
+    return os.path.join(directory, name)
+
+
+def path_key(path):
+    key = int.from_bytes(hashlib.blake2b(os.path.abspath(path).encode(), digest_size=8).digest(), 'little')
+    return key or 1
+
+
+class SharedStaticCache:
+    """Hot file contents in one shared mapping used by every worker process
+
+    The mapped file holds a small index (path hash + version -> offset,
+    length) and a data arena filled like a ring buffer; new entries evict
+    whatever they overwrite. A version is the file's mtime and size, so a
+    replaced file simply stops matching. Writers serialise on flock, readers
+    take no lock: every slot carries a sequence number that is odd while it
+    changes and is bumped again when its bytes are evicted, so a reader
+    that raced a writer sees a changed number and treats it as a miss.
+    """
+    def __init__(self, path, size=DEFAULT_CACHE_SIZE, slots=DEFAULT_SLOTS, max_object_size=MAX_OBJECT_SIZE):
+        self.path = path
+        self.max_object_size = max_object_size
+        self.thread_lock = threading.Lock()
+        self.lock_fd = None
+        self.lock_pid = None
+        self.hits = 0
+        self.misses = 0
+
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            index_size = HEADER.size + slots * SLOT.size
+            index_size += -index_size % ALIGN
+            total = index_size + size
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            try:
+                existing = os.fstat(fd).st_size
+                header = os.pread(fd, HEADER.size, 0)
+                if existing < HEADER.size or header[:8] != MAGIC:
+                    # New (or foreign) file: lay out an empty cache
+                    os.ftruncate(fd, 0)
+                    os.ftruncate(fd, total)
+                    os.pwrite(fd, HEADER.pack(MAGIC, slots, size, 0, 0), 0)
+                else:
+                    # Another worker created it: use its geometry
+                    _, slots, size, _, _ = HEADER.unpack(header)
+                    index_size = HEADER.size + slots * SLOT.size
+                    index_size += -index_size % ALIGN
+                    total = index_size + size
+            finally:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+            self.mm = mmap.mmap(fd, total)
+        finally:
+            os.close(fd)
+        self.slots = slots
+        self.capacity = size
+        self.data_start = index_size
+
+    @contextlib.contextmanager
+    def locked(self):
+        """Exclusive writer lock across processes (flock) and threads"""
+        with self.thread_lock:
+            fd = self.process_lock_fd()
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+
+    def process_lock_fd(self):
+        # flock is per open file, and a forked child shares its parent's
+        # descriptors: each process needs its own
+        if self.lock_pid != os.getpid():
+            self.lock_fd = os.open(self.path, os.O_RDWR)
+            self.lock_pid = os.getpid()
+        return self.lock_fd
+
+    def slot_offset(self, index):
+        return HEADER.size + index * SLOT.size
+
+    def probe(self, key):
+        start = key % self.slots
+        for i in range(PROBES):
+            yield (start + i) % self.slots
+
+    def get(self, path, stat):
+        """Cached bytes of path at the version described by stat, or None"""
+        key = path_key(path)
+        for index in self.probe(key):
+            offset = self.slot_offset(index)
+            seq, slot_key, mtime_ns, size, data_offset, length, _, _ = SLOT.unpack_from(self.mm, offset)
+            if seq & 1 or slot_key != key:
+                continue
+            if mtime_ns != stat.st_mtime_ns or size != stat.st_size:
+                continue
+            start = self.data_start + data_offset
+            data = self.mm[start:start + length]
+            if SLOT.unpack_from(self.mm, offset)[0] != seq:
+                break
+            self.hits += 1
+            return data
+        self.misses += 1
+        return None
+
+    def put(self, path, stat, data):
+        """Store data as the content of path at the version described by stat"""
+        length = len(data)
+        if length > self.max_object_size or length > self.capacity:
+            return False
+        key = path_key(path)
+        with self.locked():
+            # The file may have been replaced while it was read
+            current = os.stat(path)
+            if (current.st_mtime_ns, current.st_size) != (stat.st_mtime_ns, stat.st_size):
+                return False
+            magic, slots, capacity, head, inserts = HEADER.unpack_from(self.mm, 0)
+            if head + length > capacity:
+                head = 0
+            self.evict_range(head, head + length)
+            target = self.choose_slot(key)
+            start = self.data_start + head
+            self.mm[start:start + length] = data
+            inserts += 1
+            offset = self.slot_offset(target)
+            seq = SLOT.unpack_from(self.mm, offset)[0]
+            struct.pack_into('<Q', self.mm, offset, seq | 1)
+            SLOT.pack_into(self.mm, offset, seq | 1, key, stat.st_mtime_ns, stat.st_size, head, length, inserts, 0)
+            struct.pack_into('<Q', self.mm, offset, (seq | 1) + 1)
+            head += length + (-length % ALIGN)
+            HEADER.pack_into(self.mm, 0, magic, slots, capacity, head, inserts)
+        return True
+
+    def choose_slot(self, key):
+        """The slot already holding key, else an empty one, else the oldest entry"""
+        empty, oldest = None, None
+        for index in self.probe(key):
+            _, slot_key, _, _, _, _, stamp, _ = SLOT.unpack_from(self.mm, self.slot_offset(index))
+            if slot_key == key:
+                return index
+            if slot_key == 0:
+                if empty is None:
+                    empty = index
+            elif oldest is None or stamp < oldest[1]:
+                oldest = (index, stamp)
+        return empty if empty is not None else oldest[0]
+
+    def evict_range(self, start, end):
+        for index in range(self.slots):
+            offset = self.slot_offset(index)
+            seq, key, _, _, data_offset, length, _, _ = SLOT.unpack_from(self.mm, offset)
+            if key and data_offset < end and start < data_offset + length:
+                self.clear_slot(offset, seq)
+
+    def clear_slot(self, offset, seq):
+        # Two bumps: odd while clearing, then a new even number readers can compare
+        struct.pack_into('<Q', self.mm, offset, seq | 1)
+        SLOT.pack_into(self.mm, offset, seq | 1, 0, 0, 0, 0, 0, 0, 0)
+        struct.pack_into('<Q', self.mm, offset, (seq | 1) + 1)
+
+    def invalidate(self, path):
+        """Drop path from the cache; every worker sees it on its next lookup"""
+        key = path_key(path)
+        with self.locked():
+            for index in self.probe(key):
+                offset = self.slot_offset(index)
+                seq, slot_key = SLOT.unpack_from(self.mm, offset)[:2]
+                if slot_key == key:
+                    self.clear_slot(offset, seq)
+
+    def stats(self):
+        _, slots, capacity, head, inserts = HEADER.unpack_from(self.mm, 0)
+        used = sum(1 for index in range(slots) if SLOT.unpack_from(self.mm, self.slot_offset(index))[1])
+        return {'entries': used, 'capacity': capacity, 'inserts': inserts,
+                'hits': self.hits, 'misses': self.misses}
@@ -0,0 +1,168 @@
+import ssl
+import time
+import threading
+
+TLS_RECV_BUFSIZE = 256 * 1024
+
+
+class TLSMetrics:
+    """Thread-safe counters for handshake cost and TLS byte overhead"""
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.full_handshakes = 0
+        self.resumed_handshakes = 0
+        self.failed_handshakes = 0
+        self.full_handshake_time = 0.0
+        self.resumed_handshake_time = 0.0
+        self.max_handshake_time = 0.0
+        self.handshake_wire_bytes = 0
+        self.wire_bytes = 0
+        self.app_bytes = 0
+        self.alpn = {}
+
+    def record_handshake(self, connection, elapsed):
+        with self.lock:
+            if connection.session_reused:
+                self.resumed_handshakes += 1
+                self.resumed_handshake_time += elapsed
+            else:
+                self.full_handshakes += 1
+                self.full_handshake_time += elapsed
+            self.max_handshake_time = max(self.max_handshake_time, elapsed)
+            self.handshake_wire_bytes += connection.wire_bytes_in + connection.wire_bytes_out
+            protocol = connection.selected_alpn_protocol() or 'none'
+            self.alpn[protocol] = self.alpn.get(protocol, 0) + 1
+
+    def record_failure(self):
+        with self.lock:
+            self.failed_handshakes += 1
+
+    def record_close(self, connection):
+        with self.lock:
+            self.wire_bytes += connection.wire_bytes_in + connection.wire_bytes_out
+            self.app_bytes += connection.app_bytes_in + connection.app_bytes_out
+
+    def snapshot(self):
+        with self.lock:
+            handshakes = self.full_handshakes + self.resumed_handshakes
+            return {
+                'handshakes': handshakes,
+                'full_handshakes': self.full_handshakes,
+                'resumed_handshakes': self.resumed_handshakes,
+                'failed_handshakes': self.failed_handshakes,
+                'resumption_rate': self.resumed_handshakes / handshakes if handshakes else 0.0,
+                'avg_full_handshake_ms': 1000 * self.full_handshake_time / self.full_handshakes if self.full_handshakes else 0.0,
+                'avg_resumed_handshake_ms': 1000 * self.resumed_handshake_time / self.resumed_handshakes if self.resumed_handshakes else 0.0,
+                'max_handshake_ms': 1000 * self.max_handshake_time,
+                'handshake_wire_bytes': self.handshake_wire_bytes,
+                'wire_bytes': self.wire_bytes,
+                'app_bytes': self.app_bytes,
+                'tls_overhead_bytes': self.wire_bytes - self.app_bytes,
+                'alpn': dict(self.alpn),
+            }
+
+
+class TLSConnection:
+    """Server-side TLS over a plain socket using a MemoryBIO pair
+
+    Exposes the subset of the socket API used by http_connection, and counts
+    bytes on the wire separately from application bytes so the TLS overhead
+    can be measured exactly.
+    """
+    def __init__(self, sock, context, metrics=None):
+        self.sock = sock
+        self.metrics = metrics
+        self.incoming = ssl.MemoryBIO()
+        self.outgoing = ssl.MemoryBIO()
+        self.sslobj = context.wrap_bio(self.incoming, self.outgoing, server_side=True)
+        self.wire_bytes_in = 0
+        self.wire_bytes_out = 0
+        self.app_bytes_in = 0
+        self.app_bytes_out = 0
+        self.closed = False
+
+    @property
+    def session_reused(self):
+        return self.sslobj.session_reused
+
+    def selected_alpn_protocol(self):
+        return self.sslobj.selected_alpn_protocol()
+
+    def settimeout(self, timeout):
+        self.sock.settimeout(timeout)
+
+    def _flush(self):
+        data = self.outgoing.read()
+        if data:
+            self.sock.sendall(data)
+            self.wire_bytes_out += len(data)
+
+    def _fill(self):
+        data = self.sock.recv(TLS_RECV_BUFSIZE)
+        if not data:
+            self.incoming.write_eof()
+            return False
+        self.wire_bytes_in += len(data)
+        self.incoming.write(data)
+        return True
+
+    def do_handshake(self):
+        start_time = time.perf_counter()
+        try:
+            while True:
+                try:
+                    self.sslobj.do_handshake()
+                    break
+                except ssl.SSLWantReadError:
+                    self._flush()
+                    if not self._fill():
+                        raise ConnectionError("Client disconnected during handshake")
+            self._flush()
+        except Exception:
+            if self.metrics:
+                self.metrics.record_failure()
+            raise
+        if self.metrics:
+            self.metrics.record_handshake(self, time.perf_counter() - start_time)
+
+    def recv(self, bufsize):
+        while True:
+            try:
+                data = self.sslobj.read(bufsize)
+                self.app_bytes_in += len(data)
+                return data
+            except ssl.SSLWantReadError:
+                # Post-handshake messages (tickets, key updates) may be pending
+                self._flush()
+                if not self._fill():
+                    return b""
+            except ssl.SSLZeroReturnError:
+                return b""
+
+    def recv_into(self, buffer, nbytes=0):
+        data = self.recv(nbytes or len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+    def sendall(self, data):
+        view = memoryview(data)
+        while view:
+            written = self.sslobj.write(view)
+            self.app_bytes_out += written
+            view = view[written:]
+            self._flush()
+
+    def shutdown(self, how):
+        try:
+            self.sslobj.unwrap()
+        except ssl.SSLError:
+            pass
+        self._flush()
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        if self.metrics:
+            self.metrics.record_close(self)
+        self.sock.close()
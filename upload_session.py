@@ -0,0 +1,237 @@
+import os
+import json
+import time
+import uuid
+import threading
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+UPLOAD_DIR = '.uploads'
+UPLOAD_SESSION_TTL = 24 * 3600
+SWEEP_INTERVAL = 60
+
+
+def merge_range(ranges, start, end):
+    """Insert [start, end) into a sorted list of disjoint [start, end) ranges"""
+    merged = []
+    for a, b in ranges:
+        if b < start or a > end:
+            merged.append([a, b])
+        else:
+            start, end = min(a, start), max(b, end)
+    merged.append([start, end])
+    merged.sort()
+    return merged
+
+
+class UploadSession:
+    """State of one resumable upload; the data file is assembled in place with pwrite
+
+    The JSON state is rewritten atomically after every chunk, under an
+    exclusive flock when available so several server processes can share
+    the upload directory.
+    """
+    def __init__(self, session_id, filename, length, received=None, created=None, updated=None):
+        self.session_id = session_id
+        self.filename = filename
+        self.length = length
+        self.received = received or []
+        self.created = created or time.time()
+        self.updated = updated or self.created
+        self.lock = threading.Lock()
+
+    @property
+    def state_path(self):
+        return os.path.join(UPLOAD_DIR, self.session_id + '.json')
+
+    @property
+    def data_path(self):
+        return os.path.join(UPLOAD_DIR, self.session_id + '.part')
+
+    @property
+    def lock_path(self):
+        return os.path.join(UPLOAD_DIR, self.session_id + '.lock')
+
+    @property
+    def complete(self):
+        return self.received == [[0, self.length]] or self.length == 0
+
+    def missing(self):
+        gaps = []
+        position = 0
+        for start, end in self.received:
+            if start > position:
+                gaps.append([position, start])
+            position = end
+        if position < self.length:
+            gaps.append([position, self.length])
+        return gaps
+
+    def to_dict(self):
+        return {
+            'id': self.session_id,
+            'filename': self.filename,
+            'length': self.length,
+            'received': self.received,
+            'missing': self.missing(),
+            'complete': self.complete,
+            'created': self.created,
+            'updated': self.updated,
+        }
+
+    @classmethod
+    def create(cls, filename, length):
+        os.makedirs(UPLOAD_DIR, exist_ok=True)
+        session = cls(uuid.uuid4().hex, filename, length)
+        with open(session.data_path, 'wb') as f:
+            f.truncate(length)
+        session.save()
+        return session
+
+    @classmethod
+    def load(cls, session_id):
+        if not session_id.isalnum():
+            return None
+        try:
+            with open(os.path.join(UPLOAD_DIR, session_id + '.json')) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+        return cls(data['id'], data['filename'], data['length'], data['received'],
+                   data['created'], data['updated'])
+
+    def reload(self):
+        fresh = UploadSession.load(self.session_id)
+        if fresh is not None:
+            self.received = fresh.received
+            self.updated = fresh.updated
+
+    def save(self):
+        tmp_path = self.state_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(self.to_dict(), f)
+        os.replace(tmp_path, self.state_path)
+
+    @contextmanager
+    def locked(self):
+        with self.lock:
+            if fcntl is None:
+                yield
+                return
+            with open(self.lock_path, 'a') as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    # Another process may have recorded chunks since we last looked
+                    self.reload()
+                    yield
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def write_chunk(self, offset, data):
+        if offset < 0 or offset + len(data) > self.length:
+            raise ValueError(f"Chunk {offset}-{offset + len(data)} outside upload of {self.length} bytes")
+        fd = os.open(self.data_path, os.O_WRONLY)
+        try:
+            view = memoryview(data)
+            position = offset
+            while view:
+                written = os.pwrite(fd, view, position)
+                position += written
+                view = view[written:]
+        finally:
+            os.close(fd)
+        with self.locked():
+            if data:
+                self.received = merge_range(self.received, offset, offset + len(data))
+            self.updated = time.time()
+            self.save()
+
+    def commit(self, destination, durability, mode=None, verifier=None):
+        """Move the assembled file to destination once every byte has arrived
+
+        The rename goes through durability.commit like any other upload, so
+        the durability mode and its listeners apply. With a verifier the
+        assembled file is hashed first; a mismatch raises ChecksumMismatch
+        and the session stays open.
+        """
+        with self.locked():
+            if not self.complete:
+                return False
+            fd = os.open(self.data_path, os.O_RDONLY)
+            try:
+                if verifier is not None and verifier.active:
+                    verifier.update_file(fd)
+                    verifier.verify()
+                durability.commit(fd, self.data_path, destination, mode)
+            finally:
+                os.close(fd)
+            self.remove_files(keep_data=True)
+        return True
+
+    def remove_files(self, keep_data=False):
+        paths = [self.state_path, self.lock_path]
+        if not keep_data:
+            paths.append(self.data_path)
+        for path in paths:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def expired(self, now):
+        return now - self.updated > UPLOAD_SESSION_TTL
+
+
+class UploadSessions:
+    """Resumable upload sessions, cached in memory and persisted under UPLOAD_DIR"""
+    def __init__(self, cache):
+        self.cache = cache
+        self.lock = threading.Lock()
+        self.last_sweep = 0.0
+
+    def create(self, filename, length):
+        session = UploadSession.create(filename, length)
+        with self.lock:
+            self.cache[session.session_id] = session
+        return session
+
+    def get(self, session_id):
+        self.sweep()
+        with self.lock:
+            session = self.cache.get(session_id)
+        if session is None:
+            # Created by another process or before a restart
+            session = UploadSession.load(session_id)
+            if session is None:
+                return None
+            with self.lock:
+                session = self.cache.setdefault(session_id, session)
+        return session
+
+    def discard(self, session, keep_data=False):
+        with self.lock:
+            self.cache.pop(session.session_id, None)
+        session.remove_files(keep_data)
+
+    def sweep(self):
+        """Remove sessions that have not received data for UPLOAD_SESSION_TTL seconds"""
+        now = time.time()
+        with self.lock:
+            if now - self.last_sweep < SWEEP_INTERVAL:
+                return
+            self.last_sweep = now
+        try:
+            names = os.listdir(UPLOAD_DIR)
+        except FileNotFoundError:
+            return
+        for name in names:
+            if not name.endswith('.json'):
+                continue
+            session = UploadSession.load(name[:-5])
+            if session is not None and session.expired(now):
+                print(f"Expiring upload session {session.session_id}")
+                self.discard(session)